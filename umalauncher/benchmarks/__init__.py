@@ -0,0 +1,3 @@
+# Benchmarks and parity checks for the optimized code paths, along with the old implementations they are measured against.
+# Run them from the umalauncher folder, for example: python -m benchmarks.packet_sources
+# Nothing in the app imports this package, so it is not bundled with it.
@@ -0,0 +1,36 @@
+import os
+import sys
+import time
+import util
+import mdb
+import cache_registry
+
+
+def benchmark():
+    """Times a cold start, which builds every cached dict, against a warm start that loads them from disk and checks them.
+    """
+    results = []
+
+    t1 = time.perf_counter()
+    cache_registry.REGISTRY.refresh(force=True)
+    results.append(f"cold start: {time.perf_counter() - t1:.3f}s")
+
+    for entry in cache_registry.REGISTRY.entries.values():
+        entry.container.clear()
+
+    t1 = time.perf_counter()
+    loaded = cache_registry.REGISTRY.warm_start()
+    results.append(f"warm start: {time.perf_counter() - t1:.3f}s (loaded: {loaded}, {os.path.getsize(util.get_appdata(cache_registry.CACHE_FILE)) / 1024:.0f} KiB)")
+    return results
+
+
+def main():
+    # Usage: python -m benchmarks.dict_cache [path to master.mdb]
+    if len(sys.argv) > 1:
+        mdb.DB_PATH = sys.argv[1]
+    for line in benchmark():
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import sys
+import copy
+import time
+import sqlite3
+from loguru import logger
+import mdb
+import packet_reader
+import training_log
+
+
+class LegacyConnection():
+    """Opens a new connection for every query. Only used as a baseline in the benchmark.
+    """
+    def __init__(self):
+        self.conn = sqlite3.connect(f"file:{mdb.DB_PATH}?mode=ro", uri=True)
+    def __enter__(self):
+        return self.conn, self.conn.cursor()
+    def __exit__(self, type, value, traceback):
+        self.conn.close()
+
+
+def legacy_resolve_skills_list(chara_info):
+    skills_list = []
+    for skill_data in chara_info['skill_array']:
+        skills_list.append(skill_data['skill_id'])
+
+    skills_list += mdb.get_card_inherent_skills(chara_info['card_id'], chara_info['talent_level'])
+
+    for skill_tip in chara_info['skill_tips_array']:
+        if skill_tip['rarity'] > 1:
+            skills_list.append(mdb.get_skill_id_dict()[(skill_tip['group_id'], skill_tip['rarity'])])
+        else:
+            skills_list.append(mdb.determine_skill_id_from_group_id(skill_tip['group_id'], skill_tip['rarity'], skills_list))
+
+    return mdb.sort_skills_by_display_order(skills_list)
+
+
+def legacy_get_cooking_success_rate(power: int) -> int:
+    with mdb.Connection() as (_, cursor):
+        cursor.execute(
+            "SELECT success_rate FROM single_mode_cook_success_odds WHERE ? BETWEEN power_min AND power_max",
+            (power,)
+        )
+        row = cursor.fetchone()
+
+    if not row:
+        return 0
+    
+    return row[0]
+
+def legacy_get_cooking_tasting_success_thresholds(turn_num: int) -> list[int]:
+    with mdb.Connection() as (_, cursor):
+        cursor.execute(
+            "SELECT success_num, great_success_num FROM single_mode_cook_power_data WHERE ? < turn_num",
+            (turn_num,)
+        )
+    
+        row = cursor.fetchone()
+
+    if not row:
+        return [0, 0]
+    
+    return [row[0], row[1]]
+
+def legacy_get_cooking_vegetable_max_count(veg_id: int, veg_lv: int) -> int:
+    # Get the max count of a vegetable at specified level.
+
+    with mdb.Connection() as (_, cursor):
+        cursor.execute(
+            """
+            SELECT e.effect_value_2
+            FROM single_mode_cook_garden_effect e
+            JOIN single_mode_cook_garden_level l on l.effect_group_id = e.effect_group_id
+            WHERE l.facility_id = ? AND l.facility_lv = ? AND e.effect_type == 110
+            """,
+            (veg_id, veg_lv)
+        )
+        row = cursor.fetchone()
+    
+    if not row:
+        return 0
+    
+    return row[0]
+
+
+def benchmark(iterations=500):
+    """Compares per-query latency of the pooled connections with opening a connection for every query.
+    Uses the helpers that run for every training packet. Returns a list of result lines.
+    """
+    with mdb.Connection() as (_, cursor):
+        cursor.execute("""SELECT id FROM card_data WHERE default_rarity != 0 LIMIT 1""")
+        card_id = cursor.fetchone()[0]
+        cursor.execute("""SELECT id FROM skill_data LIMIT 20""")
+        skill_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("""SELECT group_id, rarity FROM skill_data WHERE group_rate > 0 LIMIT 1""")
+        group_id, rarity = cursor.fetchone()
+        cursor.execute("""SELECT id FROM single_mode_program LIMIT 1""")
+        program_id = cursor.fetchone()[0]
+
+    queries = [
+        lambda: mdb.get_card_inherent_skills(card_id, 5),
+        lambda: mdb.sort_skills_by_display_order(skill_ids),
+        lambda: mdb.determine_skill_id_from_group_id(group_id, rarity, []),
+        lambda: mdb.get_program_id_data(program_id),
+        lambda: mdb.get_program_id_grade(program_id),
+    ]
+
+    results = []
+    pooled_connection = mdb.Connection
+    in_memory = mdb.POOL.in_memory
+    for name, connection_class, use_snapshot in (
+        ("connect per call", LegacyConnection, False),
+        ("pooled", pooled_connection, False),
+        ("pooled, in memory", pooled_connection, True)
+    ):
+        mdb.Connection = connection_class
+        mdb.POOL.set_in_memory(use_snapshot, wait=True)
+        try:
+            t1 = time.perf_counter()
+            for _ in range(iterations):
+                for query in queries:
+                    query()
+            t2 = time.perf_counter()
+        finally:
+            mdb.Connection = pooled_connection
+        results.append(f"{name}: {(t2 - t1) / (iterations * len(queries)) * 1_000_000:.1f} us/query")
+    mdb.POOL.set_in_memory(in_memory)
+    return results
+
+
+def load_recorded_chara_infos(paths):
+    # Response msgpack files, or training logs.
+    chara_infos = []
+    for path in paths:
+        if path.endswith(".gz"):
+            packets = training_log.read_packets(path)
+        else:
+            packet = packet_reader.load_response(path)
+            packets = [packet.get('data', {})]
+        for packet in packets:
+            if 'single_mode_load_common' in packet:
+                # Packets from delta training logs share data with each other, so they are not modified.
+                packet = {**packet, **packet['single_mode_load_common']}
+            if 'chara_info' in packet:
+                chara_infos.append(packet['chara_info'])
+    return chara_infos
+
+def compare_skill_resolution(chara_infos):
+    """Compares resolve_skills_list with the query based version. Returns a line for every chara_info they disagree on.
+    """
+    mismatches = []
+    for chara_info in chara_infos:
+        expected = legacy_resolve_skills_list(copy.deepcopy(chara_info))
+        result = mdb.resolve_skills_list(chara_info)
+        if result != expected:
+            mismatches.append(f"card {chara_info['card_id']} on turn {chara_info.get('turn')}: {result} != {expected}")
+    return mismatches
+
+def verify_skill_resolution(paths):
+    """Compares resolve_skills_list with the query based version over recorded packets, and times both.
+    """
+    chara_infos = load_recorded_chara_infos(paths)
+    if not chara_infos:
+        return ["No chara_info found in the given packets."]
+
+    t1 = time.perf_counter()
+    for chara_info in chara_infos:
+        legacy_resolve_skills_list(copy.deepcopy(chara_info))
+    t2 = time.perf_counter()
+    for chara_info in chara_infos:
+        mdb.resolve_skills_list(chara_info)
+    t3 = time.perf_counter()
+
+    mismatches = compare_skill_resolution(chara_infos)
+    for mismatch in mismatches:
+        logger.error(f"Skill list mismatch for {mismatch}")
+
+    return [
+        f"{len(chara_infos)} turns, {len(mismatches)} mismatches",
+        f"queries: {(t2 - t1) / len(chara_infos) * 1000:.2f} ms/turn",
+        f"skill index: {(t3 - t2) / len(chara_infos) * 1000:.3f} ms/turn",
+    ]
+
+def compare_range_lookups():
+    """Compares the bisect based scenario lookups with the queries and loops they replace. Returns a line for every lookup they disagree on.
+    """
+    mismatches = []
+
+    cooking_index = mdb.get_cooking_index()
+    success_bounds = cooking_index["success_starts"] or [0]
+    for power in range(min(success_bounds) - 2, max(success_bounds) + 2):
+        if mdb.get_cooking_success_rate(power) != legacy_get_cooking_success_rate(power):
+            mismatches.append(f"cooking success rate, power {power}")
+
+    tasting_turns = cooking_index["tasting_turns"] or [0]
+    for turn in range(min(tasting_turns) - 2, max(tasting_turns) + 2):
+        if mdb.get_cooking_tasting_success_thresholds(turn) != legacy_get_cooking_tasting_success_thresholds(turn):
+            mismatches.append(f"tasting thresholds, turn {turn}")
+
+    for facility_id, facility_lv in cooking_index["vegetable_max"]:
+        for veg_lv in (facility_lv, facility_lv + 10):
+            if mdb.get_cooking_vegetable_max_count(facility_id, veg_lv) != legacy_get_cooking_vegetable_max_count(facility_id, veg_lv):
+                mismatches.append(f"vegetable max, {facility_id} lv {veg_lv}")
+
+    uaf_rows = mdb.get_uaf_required_rank_for_turn() or []
+    for turn in range(0, 80):
+        expected = None
+        for row in sorted(uaf_rows, key=lambda x: x[0], reverse=1):
+            if turn <= row[0]:
+                expected = row[1]
+        if mdb.get_uaf_required_rank(turn) != expected:
+            mismatches.append(f"UAF required rank, turn {turn}")
+
+    scouting_dict = mdb.get_scouting_score_to_rank_dict()
+    if scouting_dict:
+        thresholds = list(scouting_dict)
+        for score in sorted(set(thresholds) | {threshold - 1 for threshold in thresholds} | {max(thresholds) + 1}):
+            if score < thresholds[0]:
+                continue
+            expected = None
+            for score_threshold, rank in scouting_dict.items():
+                if score >= score_threshold:
+                    expected = rank
+                else:
+                    break
+            if mdb.get_scouting_rank(score) != expected:
+                mismatches.append(f"scouting rank, score {score}")
+
+    return mismatches
+
+def verify_range_lookups():
+    mismatches = compare_range_lookups()
+    for mismatch in mismatches:
+        logger.error(f"Range lookup mismatch: {mismatch}")
+    return [f"range lookups: {len(mismatches)} mismatches"]
+
+def main():
+    # Usage: python -m benchmarks.mdb_queries [path to master.mdb] [recorded *R.msgpack files or training logs to verify skill resolution with]
+    if len(sys.argv) > 1:
+        mdb.DB_PATH = sys.argv[1]
+    for line in benchmark():
+        print(line)
+    for line in verify_range_lookups():
+        print(line)
+    if len(sys.argv) > 2:
+        for line in verify_skill_resolution(sys.argv[2:]):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import os
+import sys
+import glob
+import time
+import msgpack
+import packet_reader
+
+
+def legacy_read_packet(msg_path, offset=0):
+    with open(msg_path, "rb") as in_file:
+        if offset:
+            return msgpack.unpackb(in_file.read()[offset:], strict_map_key=False)
+        return msgpack.unpackb(in_file.read(), strict_map_key=False)
+
+
+def benchmark(paths, iterations=20):
+    """Compares the old read-and-slice decoding with read_packet over captured packets.
+    Returns a list of result lines.
+    """
+    results = []
+    for name, func in (("read + slice", legacy_read_packet), ("mmap/unpacker", packet_reader.read_packet)):
+        copied = 0
+        packets = 0
+        t1 = time.perf_counter()
+        for _ in range(iterations):
+            for path in paths:
+                size = os.path.getsize(path)
+                offset = packet_reader.REQUEST_HEADER_SIZE if path.endswith("Q.msgpack") else 0
+                func(path, offset)
+                packets += 1
+                if func is legacy_read_packet:
+                    copied += size + (size - offset if offset else 0)
+                elif not packet_reader.uses_mmap(size):
+                    copied += size - offset
+        t2 = time.perf_counter()
+        results.append(f"{name}: {(t2 - t1) / packets * 1_000_000:.1f} us/packet, {copied / packets / 1024:.1f} KiB copied/packet")
+    return results
+
+
+def main():
+    # Usage: python -m benchmarks.packet_reading <folder with captured *Q.msgpack/*R.msgpack files>
+    folder = sys.argv[1] if len(sys.argv) > 1 else "."
+    paths = sorted(glob.glob(os.path.join(folder, "*Q.msgpack")) + glob.glob(os.path.join(folder, "*R.msgpack")))
+    if not paths:
+        print(f"No captured packets found in {folder}")
+        return
+    print(f"{len(paths)} packets, {sum(os.path.getsize(path) for path in paths) / 1024:.1f} KiB total")
+    for line in benchmark(paths):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import sys
+import glob
+import time
+import shutil
+import tempfile
+import threading
+import packet_source
+
+
+class LegacyGlobSource(packet_source.PacketSource):
+    """The previous fixed 250 ms glob-and-sort loop. Only used as a baseline in the benchmark.
+    """
+    def wait(self, timeout):
+        time.sleep(0.25)
+
+    def get_batch(self, max_count=None):
+        paths = sorted(glob.glob(os.path.join(self.folder, "*.msgpack")), key=os.path.getmtime)
+        batch = [path for path in paths if os.path.basename(path) not in self.delivered]
+        self.delivered = {os.path.basename(path) for path in paths}
+        return batch
+
+
+def benchmark_source(source_class, packet_count=200, write_interval=0.01, backlog=0):
+    """Writes fake packets into a temporary folder and measures how long it takes for the source to deliver them.
+    The backlog argument leaves that many undeleted files in the folder, like a folder that was not cleaned up.
+    """
+    folder = tempfile.mkdtemp(prefix="ul_packet_source_")
+    written = {}
+    delivered = {}
+    order = []
+
+    backlog_names = set()
+    for i in range(backlog):
+        name = f"{i:013}Q.msgpack"
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(b"\x80")
+        backlog_names.add(name)
+
+    source = source_class(folder)
+    should_stop = False
+
+    def consume():
+        while not should_stop:
+            source.wait(0.25)
+            for path in source.get_batch():
+                name = os.path.basename(path)
+                if name in backlog_names:
+                    # Undeletable leftovers stay in the folder.
+                    continue
+                delivered[name] = time.perf_counter()
+                order.append(name)
+                os.remove(path)
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+
+    base_time = int(time.time() * 1000)
+    for i in range(packet_count):
+        name = f"{base_time + i}{'Q' if i % 2 == 0 else 'R'}.msgpack"
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(b"\x81\xa4data\x80" * 64)
+        written[name] = time.perf_counter()
+        time.sleep(write_interval)
+
+    timeout = time.perf_counter() + 5
+    while len(delivered) < packet_count and time.perf_counter() < timeout:
+        time.sleep(0.01)
+    should_stop = True
+    consumer.join()
+    source.close()
+    shutil.rmtree(folder, ignore_errors=True)
+
+    latencies = sorted((delivered[name] - written[name]) * 1000 for name in written if name in delivered)
+    in_order = order == sorted(order)
+    if not latencies:
+        return f"{source_class.__name__}: nothing delivered"
+    return (f"{source_class.__name__}: {len(latencies)}/{packet_count} delivered, in order: {in_order}, "
+            f"mean {sum(latencies) / len(latencies):.1f} ms, p50 {latencies[len(latencies) // 2]:.1f} ms, "
+            f"p95 {latencies[int(len(latencies) * 0.95)]:.1f} ms, max {latencies[-1]:.1f} ms")
+
+
+def main():
+    # Usage: python -m benchmarks.packet_sources [number of leftover files in the folder]
+    backlog = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    sources = [LegacyGlobSource, packet_source.PacketSource]
+    if packet_source.win32file is not None:
+        sources.append(packet_source.NotificationPacketSource)
+    for source_class in sources:
+        print(benchmark_source(source_class, backlog=backlog))
+
+
+if __name__ == "__main__":
+    main()
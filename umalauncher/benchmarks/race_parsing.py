@@ -0,0 +1,87 @@
+import sys
+import gzip
+import time
+import base64
+import numpy as np
+import race_blobs
+import training_log
+from external import race_data_parser
+
+
+def compare(b):
+    """Checks that deserialize_arrays reads the same values as deserialize. Returns a list of differences.
+    """
+    data = race_data_parser.deserialize(b)
+    race = race_data_parser.deserialize_arrays(b)
+    differences = []
+
+    for name in ("distance_diff_max", "horse_num", "horse_frame_size", "horse_result_size", "frame_count", "frame_size"):
+        if np.float32(getattr(data, name)) != np.float32(getattr(race, name)):
+            differences.append(f"{name}: {getattr(data, name)} != {getattr(race, name)}")
+    if (data.header.max_length, data.header.version) != (race.max_length, race.version):
+        differences.append("header")
+
+    if not np.array_equal(np.array([frame.time for frame in data.frame], dtype="<f4"), race.time):
+        differences.append("time")
+    for name, fmt, _ in race_data_parser.HORSE_FRAME_FIELDS:
+        expected = np.array([[getattr(horse_frame, name) for horse_frame in frame.horse_frame] for frame in data.frame], dtype=fmt)
+        if expected.tobytes() != np.ascontiguousarray(race.horse_frame[name]).tobytes():
+            differences.append(f"horse_frame.{name}")
+    for name, fmt, _ in race_data_parser.HORSE_RESULT_FIELDS:
+        expected = np.array([getattr(horse_result, name) for horse_result in data.horse_result], dtype=fmt)
+        if expected.tobytes() != np.ascontiguousarray(race.horse_result[name]).tobytes():
+            differences.append(f"horse_result.{name}")
+
+    expected_events = [(np.float32(wrapper.event.frame_time), wrapper.event.type, tuple(wrapper.event.param)) for wrapper in data.event]
+    if expected_events != [(np.float32(event.frame_time), event.type, event.param) for event in race.events]:
+        differences.append("events")
+    return differences
+
+
+def load_race_scenarios(paths):
+    # Training logs, or text files with one race_scenario per line.
+    race_scenarios = []
+    for path in paths:
+        if path.endswith(".gz"):
+            for packet in training_log.read_packets(path):
+                for race_dict in (packet, packet.get('venus_data_set')):
+                    if isinstance(race_dict, dict) and race_dict.get('race_scenario'):
+                        race_scenarios.append(race_blobs.load_race_scenario(race_dict['race_scenario']))
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                race_scenarios += [line.strip().strip('"') for line in f if line.strip()]
+    return race_scenarios
+
+
+def benchmark(paths, iterations=3):
+    """Checks parity and compares the speed of deserialize and deserialize_arrays on the races in the given files.
+    Returns a list of result lines.
+    """
+    races = [gzip.decompress(base64.b64decode(race_scenario)) for race_scenario in load_race_scenarios(paths)]
+    if not races:
+        return ["No races found."]
+
+    results = [f"{len(races)} races"]
+    for i, b in enumerate(races):
+        differences = compare(b)
+        if differences:
+            results.append(f"Race {i} differs: {', '.join(differences)}")
+
+    for name, function in (("protobuf", race_data_parser.deserialize), ("numpy", race_data_parser.deserialize_arrays)):
+        t1 = time.perf_counter()
+        for _ in range(iterations):
+            for b in races:
+                function(b)
+        elapsed = (time.perf_counter() - t1) / iterations
+        results.append(f"{name}: {elapsed / len(races) * 1000:.2f} ms/race")
+    return results
+
+
+def main():
+    # Usage: python -m benchmarks.race_parsing <training logs or race_scenario files>
+    for line in benchmark(sys.argv[1:]):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import os
+import sys
+import glob
+import gzip
+import json
+import time
+import tempfile
+import race_blobs
+import training_log
+
+
+def legacy_append_packet(path, packet):
+    is_first = not os.path.exists(path)
+    with gzip.open(path, 'ab') as f:
+        if not is_first:
+            f.write(','.encode('utf-8'))
+        # The old format had race_scenario inline.
+        f.write(json.dumps(packet, ensure_ascii=False, default=race_blobs.load_race_scenario).encode('utf-8'))
+
+
+def legacy_load_packets(path):
+    with gzip.open(path, 'rb') as f:
+        return json.loads(f"[{f.read().decode('utf-8')}]")
+
+
+def write_with(append):
+    def write(path, packets):
+        for packet in packets:
+            append(path, packet)
+    return write
+
+
+def write_with_writer(flush_policy, delta=False):
+    def write(path, packets):
+        writer = training_log.LogWriter(path, flush_policy, delta=delta)
+        for packet in packets:
+            writer.write(packet, training_log.get_turn(packet))
+        writer.close()
+    return write
+
+
+def benchmark(paths, iterations=3):
+    """Compares writing and reading training logs in the old JSON format and the framed format.
+    Packets are written one by one, like during a training: either by reopening the file for every packet,
+    or with a LogWriter using each flush policy.
+    Returns a list of result lines.
+    """
+    packets = []
+    for path in paths:
+        packets += training_log.load_packets(path)
+    if not packets:
+        return ["No packets found in the given training logs."]
+
+    results = [f"{len(packets)} packets from {len(paths)} training logs"]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, write, load in (
+            ("json", write_with(legacy_append_packet), legacy_load_packets),
+            ("json, streamed", write_with(legacy_append_packet), lambda path: list(training_log.read_json(path))),
+            ("framed, reopened", write_with(training_log.append_packet), training_log.load_packets),
+            ("framed, flush per packet", write_with_writer(training_log.FLUSH_PACKET), training_log.load_packets),
+            (f"framed, flush per {training_log.FLUSH_EVERY} packets", write_with_writer(training_log.FLUSH_COUNT), training_log.load_packets),
+            ("framed, flush per turn", write_with_writer(training_log.FLUSH_TURN), training_log.load_packets),
+            ("framed, delta, flush per turn", write_with_writer(training_log.FLUSH_TURN, delta=True), training_log.load_packets),
+        ):
+            log_path = os.path.join(tmp_dir, "training.gz")
+            if os.path.exists(log_path):
+                os.remove(log_path)
+            t1 = time.perf_counter()
+            c1 = time.process_time()
+            write(log_path, packets)
+            write_time = time.perf_counter() - t1
+            write_cpu = time.process_time() - c1
+
+            t1 = time.perf_counter()
+            for _ in range(iterations):
+                loaded = load(log_path)
+            read_time = (time.perf_counter() - t1) / iterations
+
+            if len(loaded) != len(packets):
+                results.append(f"{name}: read back {len(loaded)} packets instead of {len(packets)}")
+            results.append(
+                f"{name}: write {write_time / len(packets) * 1000:.2f} ms/packet ({write_cpu / len(packets) * 1000:.2f} ms CPU), "
+                f"read {read_time * 1000:.1f} ms ({len(packets) / read_time:.0f} packets/s), "
+                f"{os.path.getsize(log_path) / 1024:.0f} KiB"
+            )
+
+        # Reading the last turn of the last log written, with and without its index.
+        index = training_log.load_index(log_path)
+        if index:
+            last_turn = index[-1].turn
+            for name in ("indexed", "scanned"):
+                if name == "scanned":
+                    os.remove(training_log.get_index_path(log_path))
+                t1 = time.perf_counter()
+                for _ in range(iterations):
+                    turn_packets = list(training_log.read_turns(log_path, last_turn))
+                turn_time = (time.perf_counter() - t1) / iterations
+                results.append(f"turn {last_turn}, {name}: read {len(turn_packets)} packets in {turn_time * 1000:.2f} ms")
+    return results
+
+
+def benchmark_delta(paths, iterations=3):
+    """Rewrites each training log with and without delta storage, and compares the total size and load time.
+    Returns a list of result lines.
+    """
+    sizes = {False: 0, True: 0}
+    load_times = {False: 0.0, True: 0.0}
+    packet_count = 0
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for path in paths:
+            packets = training_log.load_packets(path)
+            packet_count += len(packets)
+            for delta in (False, True):
+                log_path = os.path.join(tmp_dir, f"training_{delta}.gz")
+                training_log.write_packets(log_path, packets, delta)
+                sizes[delta] += os.path.getsize(log_path)
+                t1 = time.perf_counter()
+                for _ in range(iterations):
+                    loaded = training_log.load_packets(log_path)
+                load_times[delta] += (time.perf_counter() - t1) / iterations
+                if loaded != packets:
+                    results.append(f"{path}: packets read back from the {'delta' if delta else 'full'} log do not match")
+
+    if not packet_count:
+        return ["No packets found in the given training logs."]
+    results.insert(0, f"{packet_count} packets from {len(paths)} training logs")
+    for delta in (False, True):
+        results.append(
+            f"{'delta' if delta else 'full'}: {sizes[delta] / 1024:.0f} KiB, "
+            f"load {load_times[delta] * 1000:.1f} ms ({packet_count / load_times[delta]:.0f} packets/s)"
+        )
+    results.append(
+        f"delta is {(1 - sizes[True] / sizes[False]) * 100:.1f}% smaller, "
+        f"loads in {load_times[True] / load_times[False] * 100:.0f}% of the time"
+    )
+    return results
+
+
+def main():
+    # Usage: python -m benchmarks.training_logs [--delta] <training log .gz files or folders>
+    # Compares writing and reading the log formats. With --delta, compares the size and load time of the logs with and without delta storage.
+    args = sys.argv[1:]
+    delta = "--delta" in args
+    paths = []
+    for arg in args:
+        if arg == "--delta":
+            continue
+        if os.path.isdir(arg):
+            paths += sorted(glob.glob(os.path.join(arg, "*.gz")))
+        else:
+            paths.append(arg)
+    if not paths:
+        print("No training logs given.")
+        return
+
+    for line in (benchmark_delta(paths) if delta else benchmark(paths)):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
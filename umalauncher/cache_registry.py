@@ -0,0 +1,260 @@
+import os
+import time
+import pickle
+import hashlib
+from loguru import logger
+import util
+import mdb
+import version
+
+# Remote data (umapyoi.net) is downloaded again after this many seconds.
+REMOTE_TTL = 60 * 60
+
+CACHE_FILE = "dict_cache.pickle"
+CACHE_FORMAT = 3
+
+
+class CacheEntry():
+    """A cached dict getter, along with the container it fills and the inputs it is built from.
+    tables: master.mdb tables it reads.
+    depends: names of other entries whose output it uses.
+    remote: whether it downloads data, which is refreshed after REMOTE_TTL.
+    assets: asset folders it encodes.
+    """
+    def __init__(self, func, container, tables=None, depends=None, remote=False, assets=None):
+        self.func = func
+        self.container = container
+        self.name = f"{func.__module__}.{func.__name__}"
+        self.tables = tables or []
+        self.depends = depends or []
+        self.remote = remote
+        self.assets = assets or []
+
+        self.fingerprint = None
+        self.output_hash = None
+        self.version = 0
+        self.built_at = None
+        self.failed = False
+
+        self.hits = 0
+        self.misses = 0
+        self.rebuild_time = 0.
+
+    def __repr__(self):
+        return f"CacheEntry({self.name})"
+
+    def fill(self, output):
+        # Fill the module-level container in place, as other modules keep references to it.
+        if isinstance(self.container, list):
+            self.container[:] = output
+        else:
+            self.container.update(output)
+
+
+def hash_output(output):
+    return hashlib.blake2b(repr(output).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def get_folder_fingerprint(folder):
+    asset_folder = util.get_asset(folder)
+    try:
+        return tuple(sorted((entry.name, entry.stat().st_mtime_ns, entry.stat().st_size) for entry in os.scandir(asset_folder)))
+    except FileNotFoundError:
+        return None
+
+
+class CacheRegistry():
+    """Keeps track of what each cached dict was built from, so only the dicts whose inputs changed are rebuilt.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.mdb_fingerprint = None
+        # Goes up every time cached dicts are filled with new data, so work done with the old data can be discarded.
+        self.generation = 0
+
+    def register(self, func, container, **kwargs):
+        entry = CacheEntry(func, container, **kwargs)
+        self.entries[entry.name] = entry
+        return func
+
+    def get_mdb_fingerprint(self):
+        try:
+            stat = os.stat(mdb.DB_PATH)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def mark_failed(self, func):
+        """Called by a remote getter when its download failed, so it is tried again on the next refresh instead of after REMOTE_TTL.
+        """
+        entry = self.entries.get(f"{func.__module__}.{func.__name__}")
+        if entry is not None:
+            entry.failed = True
+
+    def is_failed(self, func):
+        entry = self.entries.get(f"{func.__module__}.{func.__name__}")
+        return entry is not None and entry.failed
+
+    def get_fingerprint(self, entry, now):
+        fingerprint = []
+        if entry.tables:
+            # Rows can be edited in place, so anything read from master.mdb is rebuilt whenever the file changes.
+            fingerprint.append(("master.mdb", self.mdb_fingerprint))
+        for name in entry.depends:
+            fingerprint.append((name, self.entries[name].version))
+        for folder in entry.assets:
+            fingerprint.append((folder, get_folder_fingerprint(folder)))
+        if entry.remote:
+            if entry.built_at is not None and now - entry.built_at < REMOTE_TTL:
+                # Keep the previous download until it expires.
+                fingerprint.append(("remote", entry.built_at))
+            else:
+                fingerprint.append(("remote", now))
+        return tuple(fingerprint)
+
+    def get_build_order(self):
+        order = []
+        visited = set()
+
+        def visit(entry):
+            if entry.name in visited:
+                return
+            visited.add(entry.name)
+            for name in entry.depends:
+                visit(self.entries[name])
+            order.append(entry)
+
+        for entry in self.entries.values():
+            visit(entry)
+        return order
+
+    def refresh(self, force=False):
+        """Rebuilds the cached dicts whose inputs changed since they were last built.
+        """
+        self.mdb_fingerprint = self.get_mdb_fingerprint()
+
+        now = time.time()
+        rebuilt = []
+        t1 = time.perf_counter()
+        for entry in self.get_build_order():
+            fingerprint = self.get_fingerprint(entry, now)
+            if not force and fingerprint == entry.fingerprint:
+                entry.hits += 1
+                continue
+
+            entry.misses += 1
+            entry.failed = False
+            t2 = time.perf_counter()
+            output = entry.func(force=True)
+            entry.rebuild_time += time.perf_counter() - t2
+            if entry.failed:
+                # Leave it unbuilt, so it is neither saved nor kept until it expires.
+                logger.warning(f"Could not download {entry.name}, will try again on the next refresh.")
+                entry.fingerprint = None
+                entry.built_at = None
+                continue
+
+            entry.fingerprint = fingerprint
+            entry.built_at = now
+            rebuilt.append(entry.name)
+
+            output_hash = hash_output(output)
+            if output_hash != entry.output_hash:
+                entry.output_hash = output_hash
+                entry.version += 1
+
+        if rebuilt:
+            self.generation += 1
+            logger.info(f"Rebuilt {len(rebuilt)}/{len(self.entries)} cached dicts in {time.perf_counter() - t1:.2f}s: {', '.join(rebuilt)}")
+            self.save()
+        else:
+            logger.debug(f"All {len(self.entries)} cached dicts are up to date.")
+        self.log_stats()
+
+    def get_cache_key(self):
+        return (CACHE_FORMAT, version.VERSION, self.get_mdb_fingerprint())
+
+    def save(self):
+        """Writes all cached dicts to disk, so the next start can load them without touching master.mdb or the network.
+        """
+        cache = {
+            "key": self.get_cache_key(),
+            "entries": {
+                name: (entry.container, entry.fingerprint, entry.built_at, entry.output_hash, entry.version)
+                for name, entry in self.entries.items()
+                if entry.fingerprint is not None
+            },
+        }
+        cache_path = util.get_appdata(CACHE_FILE)
+        tmp_path = cache_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            logger.warning(f"Could not write dict cache to {cache_path}")
+
+    def load(self):
+        """Fills the cached dicts from disk. Returns False when there is no cache for this master.mdb and Uma Launcher version.
+        """
+        cache_path = util.get_appdata(CACHE_FILE)
+        if not os.path.exists(cache_path):
+            return False
+
+        try:
+            with open(cache_path, "rb") as f:
+                cache = pickle.load(f)
+        except Exception:
+            logger.warning(f"Could not read dict cache at {cache_path}")
+            return False
+
+        key = self.get_cache_key()
+        if cache.get("key") != key:
+            logger.info("Dict cache is outdated.")
+            return False
+
+        self.mdb_fingerprint = key[2]
+        for name, (output, fingerprint, built_at, output_hash, output_version) in cache["entries"].items():
+            entry = self.entries.get(name)
+            if entry is None:
+                continue
+            entry.fill(output)
+            entry.fingerprint = fingerprint
+            entry.built_at = built_at
+            entry.output_hash = output_hash
+            entry.version = output_version
+        self.generation += 1
+        return True
+
+    def warm_start(self):
+        t1 = time.perf_counter()
+        if self.load():
+            logger.info(f"Loaded cached dicts from disk in {time.perf_counter() - t1:.3f}s.")
+            # Expired downloads, changed asset folders and dicts missing from the cache are rebuilt.
+            # The cache is only loaded for the same master.mdb, so the dicts read from it are kept.
+            self.refresh()
+            return True
+        self.refresh()
+        logger.info(f"Built cached dicts in {time.perf_counter() - t1:.3f}s.")
+        return False
+
+    def stats(self):
+        return [
+            {
+                "name": entry.name,
+                "hits": entry.hits,
+                "misses": entry.misses,
+                "rebuild_time": entry.rebuild_time,
+            }
+            for entry in self.entries.values()
+        ]
+
+    def log_stats(self):
+        for stat in self.stats():
+            logger.debug(f"{stat['name']}: {stat['hits']} hits, {stat['misses']} misses, {stat['rebuild_time'] * 1000:.1f} ms rebuilding")
+
+
+REGISTRY = CacheRegistry()
+
+def register(func, container, **kwargs):
+    return REGISTRY.register(func, container, **kwargs)
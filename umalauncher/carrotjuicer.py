@@ -1,19 +1,21 @@
 import os
 import time
-import glob
 import traceback
 import math
 import json
-import msgpack
 from loguru import logger
 from selenium.common.exceptions import NoSuchWindowException
 import screenstate_utils
 import util
-import constants
 import mdb
 import helper_table
 import training_tracker
+import training_log
+import training_catalog
 import horsium
+import packet_source
+import packet_reader
+import packet_pipeline
 
 class CarrotJuicer():
     browser: horsium.BrowserWindow = None
@@ -36,7 +38,11 @@ class CarrotJuicer():
     open_skill_window = False
     skill_browser = None
     last_skills_rect = None
-    skipped_msgpacks = []
+    packet_source = None
+    pipeline = None
+    MAX_LOAD_TRIES = 50
+    overlay_renders = 0
+    overlay_renders_skipped = 0
 
     def __init__(self, threader):
         self.threader = threader
@@ -63,32 +69,31 @@ class CarrotJuicer():
         self.start_time = math.floor(time.time() * 1000)
 
 
-    def load_request(self, msg_path):
+    def load_request(self, msg_path, tries=0):
         try:
-            with open(msg_path, "rb") as in_file:
-                unpacked = msgpack.unpackb(in_file.read()[170:], strict_map_key=False)
-                # Remove keys that are not needed
-                for key in constants.REQUEST_KEYS_TO_BE_REMOVED:
-                    if key in unpacked:
-                        del unpacked[key]
-                return unpacked
-        except PermissionError:
+            return packet_reader.load_request(msg_path)
+        except (PermissionError, packet_reader.IncompletePacketError):
+            if tries >= self.MAX_LOAD_TRIES:
+                logger.warning(f"Giving up on loading request: {msg_path}")
+                return None
             logger.warning("Could not load request because it is already in use!")
             time.sleep(0.1)
-            return self.load_request(msg_path)
+            return self.load_request(msg_path, tries + 1)
         except FileNotFoundError:
             logger.warning(f"Could not find request file: {msg_path}")
             return None
 
 
-    def load_response(self, msg_path):
+    def load_response(self, msg_path, tries=0):
         try:
-            with open(msg_path, "rb") as in_file:
-                return msgpack.unpackb(in_file.read(), strict_map_key=False)
-        except PermissionError:
+            return packet_reader.load_response(msg_path)
+        except (PermissionError, packet_reader.IncompletePacketError):
+            if tries >= self.MAX_LOAD_TRIES:
+                logger.warning(f"Giving up on loading response: {msg_path}")
+                return None
             logger.warning("Could not load response because it is already in use!")
             time.sleep(0.1)
-            return self.load_response(msg_path)
+            return self.load_response(msg_path, tries + 1)
         except FileNotFoundError:
             logger.warning(f"Could not find response file: {msg_path}")
             return None
@@ -168,12 +173,25 @@ class CarrotJuicer():
 
     def end_training(self):
         if self.training_tracker:
+            self.training_tracker.close()
             self.training_tracker = None
         if self.skill_browser and self.skill_browser.alive():
             self.skill_browser.close()
         self.close_browser()
         return
     
+    TRAINING_LOG_FLUSH_POLICIES = {
+        "Every packet": training_log.FLUSH_PACKET,
+        "Every turn": training_log.FLUSH_TURN,
+        "Every 10 packets": training_log.FLUSH_COUNT,
+    }
+
+    def get_training_log_flush_policy(self):
+        for key, value in self.threader.settings['training_log_flush'].items():
+            if value:
+                return self.TRAINING_LOG_FLUSH_POLICIES.get(key, training_log.FLUSH_TURN)
+        return training_log.FLUSH_TURN
+
     def add_response_to_tracker(self, data):
         should_track = self.threader.settings["track_trainings"]
         if self.previous_request:
@@ -210,7 +228,56 @@ class CarrotJuicer():
 
         return [f"{grade_text} {self.EVENT_ID_TO_POS_STRING[event_id]}"]
 
-    def handle_response(self, message, is_json=False):
+    def resolve_skills_list(self, chara_info):
+        t1 = time.perf_counter()
+        skills_list = mdb.resolve_skills_list(chara_info)
+
+        # Fix certain skills for GameTora
+        for i in range(len(skills_list)):
+            cur_skill_id = skills_list[i]
+            if 900000 <= cur_skill_id < 1000000:
+                skills_list[i] = cur_skill_id - 800000
+
+        logger.debug(f"Resolved skills list in {(time.perf_counter() - t1) * 1000:.2f} ms")
+        return skills_list
+
+    def renders_overlay(self, data):
+        """Whether handling this response data ends with a new overlay render.
+        Errs on the side of False, as a packet is only ever skipped for a later one that renders.
+        """
+        if any(key in data for key in ('single_mode_factor_select_common', 'live_theater_save_info_array', 'heroes_id', 'stage1_grand_result')):
+            return False
+        if 'chara_info' in data:
+            if data.get('race_scenario') and 'race_start_info' in data:
+                return False
+            return 'home_info' in data
+        return 'reserved_race_array' in data
+
+    def preprocess_response(self, packet):
+        """Prepares a decoded response on a decoder thread, before it is handled in order.
+        Only does work that depends on nothing but the packet itself.
+        """
+        data = packet.data
+        if not data or 'data' not in data:
+            return
+        data = data['data']
+
+        if 'single_mode_load_common' in data:
+            for key, value in data['single_mode_load_common'].items():
+                data[key] = value
+
+        packet.renders_overlay = self.renders_overlay(data)
+
+        if 'chara_info' in data:
+            try:
+                # The cached dicts may be refreshed before the packet is handled, in which case this is resolved again.
+                packet.skills_generation = mdb.get_cache_generation()
+                packet.skills_list = self.resolve_skills_list(data['chara_info'])
+            except Exception:
+                # Will be retried, and reported, while handling the response.
+                logger.warning(traceback.format_exc())
+
+    def handle_response(self, message, is_json=False, skills_list=None, skills_generation=None, render_overlay=True):
         if is_json:
             data = message
         else:
@@ -327,29 +394,13 @@ class CarrotJuicer():
                     # Update cached dicts first
                     mdb.update_mdb_cache()
 
-                    self.training_tracker = training_tracker.TrainingTracker(training_id, data['chara_info']['card_id'])
-
-                self.skills_list = []
-                for skill_data in data['chara_info']['skill_array']:
-                    self.skills_list.append(skill_data['skill_id'])
-                
-                self.skills_list += mdb.get_card_inherent_skills(data['chara_info']['card_id'], data['chara_info']['talent_level'])
-
-                for skill_tip in data['chara_info']['skill_tips_array']:
-                    if skill_tip['rarity'] > 1:
-                        self.skills_list.append(self.skill_id_dict[(skill_tip['group_id'], skill_tip['rarity'])])  # TODO: Check if level is correct. Check gold skills and purple skills.
-                    else:
-                        self.skills_list.append(mdb.determine_skill_id_from_group_id(skill_tip['group_id'], skill_tip['rarity'], self.skills_list))
+                    if self.training_tracker:
+                        self.training_tracker.close()
+                    self.training_tracker = training_tracker.TrainingTracker(training_id, data['chara_info']['card_id'], flush_policy=self.get_training_log_flush_policy(), live_analysis=self.threader.settings["track_trainings"], catalog=training_catalog.get_catalog() if self.threader.settings["track_trainings"] else None, delta_storage=self.threader.settings["training_log_delta"])
 
-                # self.skills_list.sort()
-                self.skills_list = mdb.sort_skills_by_display_order(self.skills_list)
-
-                # Fix certain skills for GameTora
-                for i in range(len(self.skills_list)):
-                    cur_skill_id = self.skills_list[i]
-                    if 900000 <= cur_skill_id < 1000000:
-                        self.skills_list[i] = cur_skill_id - 800000
-                
+                if skills_list is None or skills_generation != mdb.get_cache_generation():
+                    skills_list = self.resolve_skills_list(data['chara_info'])
+                self.skills_list = skills_list
                 logger.debug(f"Skills list: {self.skills_list}")
 
                 # Add request to tracker
@@ -373,7 +424,7 @@ class CarrotJuicer():
                     logger.debug(f"Helper URL: {self.helper_url}")
                     self.open_helper()
                 
-                self.update_helper_table(data)
+                self.update_helper_table(data, render_overlay)
 
             if 'unchecked_event_array' in data and data['unchecked_event_array']:
                 # Training event.
@@ -435,7 +486,7 @@ class CarrotJuicer():
                 # User changed reserved races
                 self.last_helper_data['reserved_race_array'] = data['reserved_race_array']
                 data = self.last_helper_data
-                self.update_helper_table(data)
+                self.update_helper_table(data, render_overlay)
 
             self.last_data = data
         except Exception:
@@ -451,8 +502,11 @@ class CarrotJuicer():
         self.screen_state_handler.carrotjuicer_state = screenstate_utils.make_concert_state(music_id, self.threader.screenstate)
         return
 
-    def handle_request(self, message):
-        data = self.load_request(message)
+    def handle_request(self, message, is_json=False):
+        if is_json:
+            data = message
+        else:
+            data = self.load_request(message)
 
         if not data:
             return
@@ -499,63 +553,38 @@ class CarrotJuicer():
             # self.close_browser()
 
     def remove_message(self, message_path):
-        if message_path in self.skipped_msgpacks:
-            return
+        self.pipeline.janitor.remove(message_path)
 
-        tries = 0
-        last_exception = None
-        while tries < 5:
-            try:
-                if os.path.exists(message_path):
-                    os.remove(message_path)
-                    return
-                else:
-                    logger.warning(f"Attempted to delete non-existent msgpack file: {message_path}. Skipped.")
-                    return
-            except Exception as e:
-                last_exception = e
-                tries += 1
-                time.sleep(1)
-        
-        logger.warning(f"Failed to remove msgpack file: {message_path}.")
-        logger.warning(''.join(traceback.format_tb(last_exception.__traceback__)))
-        self.skipped_msgpacks.append(message_path)
-
-
-    def process_message(self, message: str):
-        if message in self.skipped_msgpacks:
-            return
-
-        try:
-            message_time = int(str(os.path.basename(message))[:-9])
-        except ValueError:
-            return
-        if message_time < self.start_time:
-            # Delete old msgpack files.
-            self.remove_message(message)
-            return
 
-        # logger.info(f"New Packet: {os.path.basename(message)}")
+    def process_message(self, packet: packet_pipeline.DecodedPacket):
+        # logger.info(f"New Packet: {os.path.basename(packet.path)}")
 
-        if message.endswith("R.msgpack"):
+        if packet.is_response:
             # Response
-            self.handle_response(message)
+            self.handle_response(packet.data, is_json=True, skills_list=packet.skills_list, skills_generation=packet.skills_generation, render_overlay=not packet.superseded)
 
         else:
             # Request
-            self.handle_request(message)
-
-        self.remove_message(message)
+            self.handle_request(packet.data, is_json=True)
         return
 
 
-    def get_msgpack_batch(self, msg_path):
-        return sorted(glob.glob(os.path.join(msg_path, "*.msgpack")), key=os.path.getmtime)
+    def get_msgpack_batch(self):
+        return self.packet_source.get_batch(self.pipeline.capacity())
+
 
+    def update_helper_table(self, data, render=True):
+        if not render:
+            # A newer packet will overwrite the overlay anyway. Only keep the state up to date.
+            self.helper_table.carry_over_data(data, self.last_helper_data)
+            self.last_helper_data = data
+            self.overlay_renders_skipped += 1
+            logger.debug(f"Skipped superseded overlay render ({self.overlay_renders_skipped} skipped, {self.overlay_renders} rendered)")
+            return
 
-    def update_helper_table(self, data):
         helper_table = self.helper_table.create_helper_elements(data, self.last_helper_data)
         self.last_helper_data = data
+        self.overlay_renders += 1
         if helper_table:
             self.browser.execute_script("""
                 window.UL_DATA.overlay_html = arguments[0];
@@ -647,6 +676,9 @@ class CarrotJuicer():
         try:
             self.run()
         except Exception:
+            if self.training_tracker:
+                # Finish the training log, so it does not need to be recovered.
+                self.training_tracker.close()
             util.show_error_box("Critical Error", "Uma Launcher has encountered a critical error and will now close.")
             self.threader.stop()
 
@@ -660,10 +692,13 @@ class CarrotJuicer():
                 util.show_error_box("Uma Launcher: No game install path found.", "This should not happen. Ensure you have the game installed via DMM.")
                 return
 
-            while not self.should_stop:
-                time.sleep(0.25)
+            msg_path = os.path.join(base_path, "CarrotJuicer")
+            self.packet_source = packet_source.create_packet_source(msg_path)
+            self.pipeline = packet_pipeline.PacketPipeline(self)
 
-                msg_path = os.path.join(base_path, "CarrotJuicer")
+            while not self.should_stop:
+                # Wakes up early when new packets arrive.
+                self.packet_source.wait(0.25)
 
                 if not self.threader.settings["enable_carrotjuicer"] or not self.threader.settings['enable_browser']:
                     if self.browser and self.browser.alive():
@@ -708,12 +743,22 @@ class CarrotJuicer():
                         logger.error(traceback.format_exc())
                         pass
 
-                messages = self.get_msgpack_batch(msg_path)
+                messages = self.get_msgpack_batch()
                 for message in messages:
-                    self.process_message(message)
+                    self.pipeline.submit(message)
+                self.pipeline.dispatch()
         except NoSuchWindowException:
             pass
 
+        if self.packet_source:
+            self.packet_source.close()
+
+        if self.pipeline:
+            self.pipeline.stop()
+
+        if self.training_tracker:
+            self.training_tracker.close()
+
         if self.browser:
             logger.debug("Closing browser.")
             self.browser.quit()
@@ -2,6 +2,8 @@ import base64
 import gzip
 import struct
 import sys
+import collections
+import numpy as np
 import util
 sys.path.append(util.get_asset('external'))
 
@@ -100,6 +102,123 @@ def deserialize(b: bytearray) -> race_data_pb2.RaceSimulateData:
 def parse(race_scenario):
     return deserialize(gzip.decompress(base64.b64decode(race_scenario)))
 
+
+# The same layouts as the struct formats above, for reading whole blocks with NumPy.
+# '<fHHHbb'
+HORSE_FRAME_FIELDS = (
+    ("distance", "<f4", 0),
+    ("lane_position", "<u2", 4),
+    ("speed", "<u2", 6),
+    ("hp", "<u2", 8),
+    ("temptation_mode", "i1", 10),
+    ("block_front_horse_index", "i1", 11),
+)
+HORSE_FRAME_MIN_SIZE = 12
+
+# '<ifffBBfBif'
+HORSE_RESULT_FIELDS = (
+    ("finish_order", "<i4", 0),
+    ("finish_time", "<f4", 4),
+    ("finish_diff_time", "<f4", 8),
+    ("start_delay_time", "<f4", 12),
+    ("guts_order", "u1", 16),
+    ("wiz_order", "u1", 17),
+    ("last_spurt_start_distance", "<f4", 18),
+    ("running_style", "u1", 22),
+    ("defeat", "<i4", 23),
+    ("finish_time_raw", "<f4", 27),
+)
+HORSE_RESULT_MIN_SIZE = 31
+
+RaceEvent = collections.namedtuple("RaceEvent", ["frame_time", "type", "param"])
+
+
+def make_dtype(fields, itemsize):
+    return np.dtype({
+        "names": [name for name, _, _ in fields],
+        "formats": [fmt for _, fmt, _ in fields],
+        "offsets": [offset for _, _, offset in fields],
+        "itemsize": itemsize,
+    })
+
+
+def make_frame_dtype(horse_num, horse_frame_size, frame_size):
+    if horse_frame_size < HORSE_FRAME_MIN_SIZE or frame_size < 4 + horse_num * horse_frame_size:
+        raise ValueError(f"Unexpected frame layout: {horse_num} horses of {horse_frame_size} bytes in {frame_size} byte frames.")
+    return np.dtype({
+        "names": ["time", "horse_frame"],
+        "formats": ["<f4", (make_dtype(HORSE_FRAME_FIELDS, horse_frame_size), (horse_num,))],
+        "offsets": [0, 4],
+        "itemsize": frame_size,
+    })
+
+
+class RaceArrays():
+    """A race read into NumPy arrays instead of protobuf messages.
+    time: (frame_count,) frame times.
+    horse_frame: (frame_count, horse_num) structured array with the fields of RaceSimulateHorseFrameData.
+    horse_result: (horse_num,) structured array with the fields of RaceSimulateHorseResultData.
+    The arrays are read-only views into the race bytes, so they keep them alive.
+    """
+    def __init__(self):
+        self.max_length = 0
+        self.version = 0
+        self.distance_diff_max = 0.0
+        self.horse_num = 0
+        self.horse_frame_size = 0
+        self.horse_result_size = 0
+        self.frame_count = 0
+        self.frame_size = 0
+        self.time = None
+        self.horse_frame = None
+        self.horse_result = None
+        self.events = []
+
+
+def deserialize_arrays(b) -> RaceArrays:
+    """Reads the same data as deserialize, with one np.frombuffer for the frames and one for the horse results.
+    """
+    race = RaceArrays()
+    race.max_length, race.version = struct.unpack_from('<ii', b, 0)
+    offset = 4 + race.max_length
+
+    fmt = '<fiii'
+    race.distance_diff_max, race.horse_num, race.horse_frame_size, race.horse_result_size = struct.unpack_from(fmt, b, offset)
+    offset += struct.calcsize(fmt)
+    offset += 4 + struct.unpack_from('<i', b, offset)[0]
+
+    fmt = '<ii'
+    race.frame_count, race.frame_size = struct.unpack_from(fmt, b, offset)
+    offset += struct.calcsize(fmt)
+
+    frames = np.frombuffer(b, dtype=make_frame_dtype(race.horse_num, race.horse_frame_size, race.frame_size), count=race.frame_count, offset=offset)
+    race.time = frames["time"]
+    race.horse_frame = frames["horse_frame"]
+    offset += race.frame_count * race.frame_size
+    offset += 4 + struct.unpack_from('<i', b, offset)[0]
+
+    if race.horse_result_size < HORSE_RESULT_MIN_SIZE:
+        raise ValueError(f"Unexpected horse result size: {race.horse_result_size} bytes.")
+    race.horse_result = np.frombuffer(b, dtype=make_dtype(HORSE_RESULT_FIELDS, race.horse_result_size), count=race.horse_num, offset=offset)
+    offset += race.horse_num * race.horse_result_size
+    offset += 4 + struct.unpack_from('<i', b, offset)[0]
+
+    event_count = struct.unpack_from('<i', b, offset)[0]
+    offset += 4
+    for _ in range(event_count):
+        event_size = struct.unpack_from('<h', b, offset)[0]
+        offset += 2
+        frame_time, event_type, param_count = struct.unpack_from('<fbb', b, offset)
+        race.events.append(RaceEvent(frame_time, event_type, struct.unpack_from(f'<{max(param_count, 0)}i', b, offset + 6)))
+        offset += event_size
+
+    return race
+
+
+def parse_arrays(race_scenario):
+    return deserialize_arrays(gzip.decompress(base64.b64decode(race_scenario)))
+
+
 def main():
     b = input('Please paste content of field "race_scenario" here: ').strip('"')
     b = gzip.decompress(base64.b64decode(b))
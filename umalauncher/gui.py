@@ -1301,6 +1301,12 @@ class UmaBorderlessPopup(UmaMainWidget):
         if len(self.check_target) > 0:
             self.timer.stop()
             self.close()
+            return
+
+        # The update object can report its progress.
+        progress_message = getattr(self.update_object, "progress_message", None)
+        if progress_message and progress_message != self.label.text():
+            self.label.setText(progress_message)
 
 
 class UmaUpdatePopup(UmaMainWidget):
@@ -132,14 +132,17 @@ class HelperTable():
             self.carrotjuicer.update_helper_table(self.carrotjuicer.last_helper_data)
 
 
-    def create_helper_elements(self, data, last_data) -> str:
-        """Creates the helper elements for the given response packet.
-        """
+    def carry_over_data(self, data, last_data):
         # Transfer data from last data if it does not exist in the current data
         if last_data:
             if 'reserved_race_array' not in data and 'reserved_race_array' in last_data:
                 data['reserved_race_array'] = last_data['reserved_race_array']
 
+    def create_helper_elements(self, data, last_data) -> str:
+        """Creates the helper elements for the given response packet.
+        """
+        self.carry_over_data(data, last_data)
+
         if not 'home_info' in data:
             return None
         
@@ -397,7 +400,6 @@ class HelperTable():
             uaf_current_active_bonus = 0
             uaf_sport_competition = {}
             uaf_sport_rank_total = {2100: 0, 2200: 0, 2300: 0}
-            uaf_required_rank_for_turn = {}
             uaf_current_required_rank = -1
             uaf_consultations_left = 0
             
@@ -430,12 +432,9 @@ class HelperTable():
 
                 uaf_consultations_left = len(data['sport_data_set'].get('item_id_array', []))
                 
-                uaf_required_rank_for_turn = mdb.get_uaf_required_rank_for_turn()
-                uaf_required_rank_for_turn.sort(key=lambda x: x[0], reverse=1)
-                
-                for row in uaf_required_rank_for_turn:
-                    if turn <= row[0]:
-                        uaf_current_required_rank = row[1]
+                required_rank = mdb.get_uaf_required_rank(turn)
+                if required_rank is not None:
+                    uaf_current_required_rank = required_rank
                 
                 # Calculate totals for each base
                 for command_id, rank in uaf_sport_rank.items():
@@ -490,31 +489,30 @@ class HelperTable():
         scheduled_races = []
         if 'reserved_race_array' in data:
             for race_data in data['reserved_race_array'][0]['race_array']:
-                # TODO: Maybe cache the mdb data for all race programs?
-                program_data = mdb.get_program_id_data(race_data['program_id'])
-                if not program_data:
+                program = mdb.get_race_program(race_data['program_id'])
+                if not program:
                     util.show_warning_box(f"Could not get program data for program_id {race_data['program_id']}")
                     continue
                 
-                if program_data['base_program_id'] != 0:
-                    program_data = mdb.get_program_id_data(program_data['base_program_id'])
+                if program.base_program_id != 0:
+                    program = mdb.get_race_program(program.base_program_id)
                 
-                if not program_data:
+                if not program:
                     util.show_warning_box(f"Could not get program data for program_id {race_data['program_id']}")
                     continue
 
                 year = race_data['year'] - 1
-                month = program_data['month'] - 1
-                half = program_data['half'] - 1
+                month = program.month - 1
+                half = program.half - 1
                 s_turn = 24 * year
                 s_turn += month * 2
                 s_turn += half
                 s_turn += 1
-                thumb_url = f"https://gametora.com/images/umamusume/race_banners/thum_race_rt_000_{str(program_data['race_instance_id'])[:4]}_00.png"
+                thumb_url = f"https://gametora.com/images/umamusume/race_banners/thum_race_rt_000_{str(program.race_instance_id)[:4]}_00.png"
 
                 scheduled_races.append({
                     "turn": s_turn,
-                    "fans": program_data['need_fan_count'],
+                    "fans": program.need_fan_count,
                     "thumb_url": thumb_url
                 })
             
@@ -1,31 +1,282 @@
 import sqlite3
 import os
+import time
+import bisect
+import threading
+import traceback
+from typing import NamedTuple
 from loguru import logger
 import util
 import constants
 import gui
+import cache_registry
+import mdb_profiler
 
 DB_PATH = os.path.expandvars("%userprofile%\\appdata\\locallow\\Cygames\\umamusume\\master\\master.mdb")
 
+# Tables used by the queries in this module. Only these are copied into the in-memory snapshot.
+SNAPSHOT_TABLES = [
+    "available_skill_set",
+    "card_data",
+    "carotene",
+    "race",
+    "race_instance",
+    "single_mode_cook_garden_effect",
+    "single_mode_cook_garden_level",
+    "single_mode_cook_power_data",
+    "single_mode_cook_success_odds",
+    "single_mode_live_square",
+    "single_mode_program",
+    "single_mode_sport_compe_effect",
+    "single_mode_sport_competition",
+    "single_mode_story_data",
+    "single_mode_unique_chara",
+    "skill_data",
+    "support_card_data",
+    "team_building_rank",
+    "text_data",
+]
+
 def update_mdb_cache():
     logger.info("Reloading cached dicts.")
-    all_update_funcs = UPDATE_FUNCS + util.UPDATE_FUNCS
-    for func in all_update_funcs:
-        func(force=True)
+    cache_registry.REGISTRY.refresh()
+
+def get_cache_generation():
+    return cache_registry.REGISTRY.generation
+
+class PooledConnection():
+    def __init__(self, conn, generation):
+        self.conn = conn
+        self.generation = generation
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+
+class ConnectionPool():
+    """Keeps one read-only connection to master.mdb per thread, so queries reuse the open file and its prepared statements.
+    Connections are reopened when the file is replaced by a game update, and closed when idle so the game can replace it.
+
+    With in_memory enabled, the tables in SNAPSHOT_TABLES are copied into a shared in-memory database that queries are served from.
+    The snapshot is rebuilt in the background when the file changes. Queries go to the file until the new snapshot is swapped in.
+    """
+    CHECK_INTERVAL = 1.0
+    IDLE_TIMEOUT = 10.0
+    CACHED_STATEMENTS = 256
+    PRAGMAS = (
+        "PRAGMA query_only = ON",
+        "PRAGMA mmap_size = 268435456",
+        "PRAGMA cache_size = -16384",
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = {}
+        self.generation = 0
+        self.fingerprint = None
+        self.last_check = 0.
+        self.reaper = None
+        self.in_memory = False
+        self.snapshot_uri = None
+        self.snapshot_holder = None
+        self.snapshot_count = 0
+        self.building = False
+
+    def get_fingerprint(self):
+        try:
+            stat = os.stat(DB_PATH)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def check_file(self):
+        now = time.monotonic()
+        if now - self.last_check < self.CHECK_INTERVAL:
+            return
+        self.last_check = now
+
+        fingerprint = self.get_fingerprint()
+        if fingerprint != self.fingerprint:
+            if self.fingerprint is not None:
+                logger.info("master.mdb changed, reopening connections.")
+            with self.lock:
+                self.fingerprint = fingerprint
+                self.drop_snapshot()
+                self.generation += 1
+            if self.in_memory:
+                self.start_snapshot_build()
+
+    def set_in_memory(self, in_memory, wait=False):
+        if in_memory == self.in_memory:
+            return
+        self.in_memory = in_memory
+        if in_memory:
+            if wait:
+                self.build_snapshot()
+            else:
+                self.start_snapshot_build()
+        else:
+            with self.lock:
+                self.drop_snapshot()
+                self.generation += 1
+
+    def drop_snapshot(self):
+        # Must be called with the lock held. Readers that still use the old snapshot keep it alive until they reopen.
+        if self.snapshot_holder is not None:
+            self.snapshot_holder.close()
+        self.snapshot_holder = None
+        self.snapshot_uri = None
+
+    def start_snapshot_build(self):
+        with self.lock:
+            if self.building:
+                return
+            self.building = True
+        threading.Thread(target=self.build_snapshot, name="MdbSnapshot", daemon=True).start()
+
+    def build_snapshot(self):
+        self.building = True
+        try:
+            while self.in_memory:
+                fingerprint = self.get_fingerprint()
+                if fingerprint is None:
+                    return
+
+                holder, uri = self.copy_tables()
+                if holder is None:
+                    return
+
+                if self.get_fingerprint() != fingerprint:
+                    # The file changed while copying. Try again once it has settled.
+                    holder.close()
+                    time.sleep(self.CHECK_INTERVAL)
+                    continue
+
+                with self.lock:
+                    self.drop_snapshot()
+                    if self.in_memory:
+                        self.snapshot_holder = holder
+                        self.snapshot_uri = uri
+                    else:
+                        holder.close()
+                    self.fingerprint = fingerprint
+                    self.generation += 1
+                return
+        finally:
+            self.building = False
+
+    def copy_tables(self):
+        self.snapshot_count += 1
+        uri = f"file:ul_master_{self.snapshot_count}?mode=memory&cache=shared"
+
+        t1 = time.perf_counter()
+        holder = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        try:
+            holder.execute("ATTACH DATABASE ? AS src", (f"file:{DB_PATH}?mode=ro",))
+            rows = holder.execute("""SELECT type, name, tbl_name, sql FROM src.sqlite_master WHERE sql IS NOT NULL""").fetchall()
+            with holder:
+                for row_type, name, _, sql in rows:
+                    if row_type == "table" and name in SNAPSHOT_TABLES:
+                        holder.execute(sql)
+                        holder.execute(f'INSERT INTO main."{name}" SELECT * FROM src."{name}"')
+                for row_type, _, table_name, sql in rows:
+                    if row_type == "index" and table_name in SNAPSHOT_TABLES:
+                        holder.execute(sql)
+            holder.execute("DETACH DATABASE src")
+        except sqlite3.Error:
+            logger.error("Could not create in-memory copy of master.mdb.")
+            logger.error(traceback.format_exc())
+            holder.close()
+            return None, None
+
+        logger.info(f"Copied master.mdb into memory in {time.perf_counter() - t1:.2f}s.")
+        return holder, uri
+
+    def connect(self, uri):
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=self.CACHED_STATEMENTS)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        self.check_file()
+        thread_id = threading.get_ident()
+
+        with self.lock:
+            pooled = self.connections.get(thread_id)
+            if pooled and pooled.generation != self.generation and pooled.in_use == 0:
+                pooled.conn.close()
+                del self.connections[thread_id]
+                pooled = None
+            if pooled:
+                pooled.in_use += 1
+                return pooled
+            uri = self.snapshot_uri or f"file:{DB_PATH}?mode=ro"
+            generation = self.generation
+
+        pooled = PooledConnection(self.connect(uri), generation)
+        pooled.in_use += 1
+        with self.lock:
+            self.connections[thread_id] = pooled
+            if self.reaper is None:
+                self.reaper = threading.Thread(target=self.close_idle, name="MdbConnectionReaper", daemon=True)
+                self.reaper.start()
+        return pooled
+
+    def release(self, pooled, discard=False):
+        with self.lock:
+            pooled.in_use -= 1
+            pooled.last_used = time.monotonic()
+            if discard and pooled.in_use == 0:
+                self.remove(pooled)
+
+    def remove(self, pooled):
+        # Must be called with the lock held.
+        for thread_id, other in list(self.connections.items()):
+            if other is pooled:
+                del self.connections[thread_id]
+        pooled.conn.close()
+
+    def close_idle(self):
+        while True:
+            time.sleep(self.IDLE_TIMEOUT / 2)
+            with self.lock:
+                now = time.monotonic()
+                for pooled in list(self.connections.values()):
+                    if pooled.in_use == 0 and now - pooled.last_used > self.IDLE_TIMEOUT:
+                        self.remove(pooled)
+                if not self.connections:
+                    self.reaper = None
+                    return
+
+    def close_all(self):
+        with self.lock:
+            for pooled in list(self.connections.values()):
+                if pooled.in_use == 0:
+                    self.remove(pooled)
+
+POOL = ConnectionPool()
 
 class Connection():
     def __init__(self):
+        self.pooled = None
         try:
-            self.conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+            self.pooled = POOL.acquire()
+            self.conn = self.pooled.conn
         except sqlite3.OperationalError:
             util.show_error_box_no_report("Connection Error", "Could not connect to the game database.<br>Try restarting Uma Launcher after the game updates.<br>Uma Launcher will now close.")
             if gui.THREADER:
                 gui.THREADER.stop()
     def __enter__(self):
-        return self.conn, self.conn.cursor()
+        self.cursor = self.conn.cursor()
+        if mdb_profiler.ENABLED:
+            self.cursor = mdb_profiler.ProfiledCursor(self.cursor)
+        return self.conn, self.cursor
     def __exit__(self, type, value, traceback):
-        self.conn.close()
-        
+        self.cursor.close()
+        if self.pooled:
+            # Drop the connection on errors, in case the file went bad underneath it.
+            POOL.release(self.pooled, discard=type is not None)
+
         if type is not None:
             logger.error(f"Error: {type} {value}")
             util.show_error_box("Connection Error", "Could not connect to the game database.")
@@ -93,16 +344,7 @@ def _get_event_titles_special(story_id, card_id):
 
 
 def _get_event_titles_default(story_id):
-    with Connection() as (_, cursor):
-        cursor.execute(
-            """SELECT text FROM text_data WHERE category = 181 AND "index" = ? LIMIT 1""",
-            (story_id,)
-        )
-        row = cursor.fetchone()
-        if row is None:
-            return [None]
-        
-        return [row[0]]
+    return [get_text(181, int(story_id))]
     
 def convert_short_story_id(story_id):
     with Connection() as (_, cursor):
@@ -136,59 +378,76 @@ def get_event_titles(story_id, card_id):
 
     return event_titles
 
+# text_data categories that Uma Launcher uses.
+TEXT_CATEGORIES = [
+    5,  # Outfit names
+    14,  # Outfit titles by card id
+    16,  # Song titles
+    28,  # Race names by race instance
+    47,  # Skill names
+    142,  # Status (condition) names
+    170,  # Character names
+    181,  # Event titles
+    209,  # Grand Live lesson titles
+    225,  # MANT item names
+]
+
+TEXT_INDEX = {}
+def get_text_index(force=False):
+    """All used text_data categories, loaded with a single query. Maps category to a dict of index to text.
+    """
+    global TEXT_INDEX
+    if force or not TEXT_INDEX:
+        with Connection() as (_, cursor):
+            cursor.execute(
+                f"""SELECT category, "index", text FROM text_data WHERE category IN ({','.join(['?'] * len(TEXT_CATEGORIES))})""",
+                TEXT_CATEGORIES
+            )
+            rows = cursor.fetchall()
+
+        tmp = {category: {} for category in TEXT_CATEGORIES}
+        for category, index, text in rows:
+            tmp[category].setdefault(index, text)
+        TEXT_INDEX.update(tmp)
+    return TEXT_INDEX
+
+def get_text(category, index, default=None):
+    return get_text_index().get(category, {}).get(index, default)
+
+def get_texts(category, indexes, default=None):
+    texts = get_text_index().get(category, {})
+    return [texts.get(index, default) for index in indexes]
+
 def get_song_title(song_id):
-    with Connection() as (_, cursor):
-        cursor.execute(
-            """SELECT text FROM text_data WHERE category = 16 AND "index" = ? LIMIT 1""",
-            (song_id,)
-        )
-        song_title = cursor.fetchone()[0]
-    return song_title
+    return get_text(16, song_id)
 
 def get_status_name(status_id):
-    with Connection() as (_, cursor):
-        cursor.execute(
-            """SELECT text FROM text_data WHERE category = 142 AND "index" = ? LIMIT 1""",
-            (status_id,)
-        )
-        status_name = cursor.fetchone()[0]
-    return status_name
+    return get_text(142, status_id)
 
 def get_skill_name(skill_id):
-    with Connection() as (_, cursor):
-        cursor.execute(
-            """SELECT text FROM text_data WHERE category = 47 AND "index" = ? LIMIT 1""",
-            (skill_id,)
-        )
-        skill_name = cursor.fetchone()[0]
-    return skill_name
+    return get_text(47, skill_id)
 
 def get_skill_hint_name(group_id, rarity):
     with Connection() as (_, cursor):
         cursor.execute(
-            """SELECT td.text FROM skill_data sd INNER JOIN text_data td ON sd.id = td."index" AND td.category = 47 WHERE sd.group_id = ? AND sd.rarity = ? LIMIT 1""",
+            """SELECT id FROM skill_data WHERE group_id = ? AND rarity = ?""",
             (group_id, rarity)
         )
-        skill_hint_name = cursor.fetchone()[0]
-    return skill_hint_name
+        rows = cursor.fetchall()
+
+    for skill_name in get_texts(47, [row[0] for row in rows]):
+        if skill_name is not None:
+            return skill_name
+    return None
 
 def get_race_program_name(program_id):
-    with Connection() as (_, cursor):
-        cursor.execute(
-            """SELECT t.text FROM single_mode_program s INNER JOIN text_data t ON s.race_instance_id = t."index" AND t.category = 28 WHERE s.id = ? LIMIT 1""",
-            (program_id,)
-        )
-        program_name = cursor.fetchone()[0]
-    return program_name
+    program = get_race_program(program_id)
+    if program is None:
+        return None
+    return get_text(28, program.race_instance_id)
 
 def get_outfit_name(card_id):
-    with Connection() as (_, cursor):
-        cursor.execute(
-            """SELECT text FROM text_data WHERE category = 14 AND "index" = ? LIMIT 1""",
-            (card_id,)
-        )
-        outfit_name = cursor.fetchone()[0]
-    return outfit_name
+    return get_text(14, card_id)
 
 def get_support_card_string(support_id):
     with Connection() as (_, cursor):
@@ -210,15 +469,18 @@ def get_event_title_dict(force=False):
     if force or not EVENT_TITLE_DICT:
         with Connection() as (_, cursor):
             cursor.execute(
-                """SELECT s.story_id, s.short_story_id, t.text FROM text_data t JOIN single_mode_story_data s ON t."index" = s.story_id WHERE category = 181"""
+                """SELECT story_id, short_story_id FROM single_mode_story_data"""
             )
             rows = cursor.fetchall()
 
+        event_titles = get_text_index()[181]
         out = {}
-        for row in rows:
-            out[row[0]] = row[2]
-            if row[1] != 0:
-                out[row[1]] = row[2]
+        for story_id, short_story_id in rows:
+            if story_id not in event_titles:
+                continue
+            out[story_id] = event_titles[story_id]
+            if short_story_id != 0:
+                out[short_story_id] = event_titles[story_id]
         EVENT_TITLE_DICT.update(out)
     return EVENT_TITLE_DICT
 
@@ -228,10 +490,11 @@ def get_race_program_name_dict(force=False):
     if force or not RACE_PROGRAM_NAME_DICT:
         with Connection() as (_, cursor):
             cursor.execute(
-                """SELECT s.id, t.text FROM single_mode_program s INNER JOIN text_data t ON s.race_instance_id = t."index" AND t.category = 28"""
+                """SELECT id, race_instance_id FROM single_mode_program"""
             )
             rows = cursor.fetchall()
-        RACE_PROGRAM_NAME_DICT.update({row[0]: row[1] for row in rows})
+        race_names = get_text_index()[28]
+        RACE_PROGRAM_NAME_DICT.update({row[0]: race_names[row[1]] for row in rows if row[1] in race_names})
     return RACE_PROGRAM_NAME_DICT
 
 SKILL_NAME_DICT = {}
@@ -240,11 +503,12 @@ def get_skill_name_dict(force=False):
     if force or not SKILL_NAME_DICT:
         with Connection() as (_, cursor):
             cursor.execute(
-                """SELECT sd.id, td.text FROM skill_data sd INNER JOIN text_data td ON sd.id = td."index" AND td.category = 47"""
+                """SELECT id FROM skill_data"""
             )
             rows = cursor.fetchall()
 
-        SKILL_NAME_DICT.update({row[0]: row[1] for row in rows})
+        skill_names = get_text_index()[47]
+        SKILL_NAME_DICT.update({row[0]: skill_names[row[0]] for row in rows if row[0] in skill_names})
 
     return SKILL_NAME_DICT
 
@@ -254,11 +518,12 @@ def get_skill_hint_name_dict(force=False):
     if force or not SKILL_HINT_NAME_DICT:
         with Connection() as (_, cursor):
             cursor.execute(
-                """SELECT sd.group_id, sd.rarity, td.text FROM skill_data sd INNER JOIN text_data td ON sd.id = td."index" AND td.category = 47"""
+                """SELECT id, group_id, rarity FROM skill_data"""
             )
             rows = cursor.fetchall()
         
-        SKILL_HINT_NAME_DICT.update({(row[0], row[1]): row[2] for row in rows})
+        skill_names = get_text_index()[47]
+        SKILL_HINT_NAME_DICT.update({(row[1], row[2]): skill_names[row[0]] for row in rows if row[0] in skill_names})
 
     return SKILL_HINT_NAME_DICT
 
@@ -266,13 +531,7 @@ STATUS_NAME_DICT = {}
 def get_status_name_dict(force=False):
     global STATUS_NAME_DICT
     if force or not STATUS_NAME_DICT:
-        with Connection() as (_, cursor):
-            cursor.execute(
-                """SELECT "index", text FROM text_data WHERE category = 142"""
-            )
-            rows = cursor.fetchall()
-        
-        STATUS_NAME_DICT.update({row[0]: row[1] for row in rows})
+        STATUS_NAME_DICT.update(get_text_index()[142])
 
     return STATUS_NAME_DICT
 
@@ -280,13 +539,7 @@ OUTFIT_NAME_DICT = {}
 def get_outfit_name_dict(force=False):
     global OUTFIT_NAME_DICT
     if force or not OUTFIT_NAME_DICT:
-        with Connection() as (_, cursor):
-            cursor.execute(
-                """SELECT "index", text FROM text_data WHERE category = 5"""
-            )
-            rows = cursor.fetchall()
-        
-        OUTFIT_NAME_DICT.update({row[0]: row[1] for row in rows})
+        OUTFIT_NAME_DICT.update(get_text_index()[5])
 
     return OUTFIT_NAME_DICT
 
@@ -311,8 +564,8 @@ def get_support_card_string_dict(force=False):
     if force or not SUPPORT_CARD_STRING_DICT:
         support_card_dict = get_support_card_dict()
 
-        # Forcefully clear the character name dict cache if needed.
-        util.get_character_name_dict(force=force)
+        # The character name dict is refreshed by the cache registry before this one, if needed.
+        util.get_character_name_dict()
 
         SUPPORT_CARD_STRING_DICT.update({id: create_support_card_string(*data) for id, data in support_card_dict.items()})
     
@@ -322,13 +575,7 @@ CHARA_NAME_DICT = {}
 def get_chara_name_dict(force=False):
     global CHARA_NAME_DICT
     if force or not CHARA_NAME_DICT:
-        with Connection() as (_, cursor):
-            cursor.execute(
-                """SELECT "index", text FROM text_data WHERE category = 170"""
-            )
-            rows = cursor.fetchall()
-
-        CHARA_NAME_DICT.update({row[0]: row[1] for row in rows})
+        CHARA_NAME_DICT.update(get_text_index()[170])
     
     return CHARA_NAME_DICT
 
@@ -336,13 +583,7 @@ MANT_ITEM_STRING_DICT = {}
 def get_mant_item_string_dict(force=False):
     global MANT_ITEM_STRING_DICT
     if force or not MANT_ITEM_STRING_DICT:
-        with Connection() as (_, cursor):
-            cursor.execute(
-                """SELECT "index", text FROM text_data WHERE category = 225"""
-            )
-            rows = cursor.fetchall()
-
-        MANT_ITEM_STRING_DICT.update({row[0]: row[1] for row in rows})
+        MANT_ITEM_STRING_DICT.update(get_text_index()[225])
     
     return MANT_ITEM_STRING_DICT
 
@@ -352,11 +593,12 @@ def get_gl_lesson_dict(force=False):
     if force or not GL_LESSON_DICT:
         with Connection() as (_, cursor):
             cursor.execute(
-                """SELECT s.id, t.text, s.square_type FROM single_mode_live_square s JOIN text_data t ON t."index" = s.square_title_text_id AND t.category = 209"""
+                """SELECT id, square_title_text_id, square_type FROM single_mode_live_square"""
             )
             rows = cursor.fetchall()
 
-        GL_LESSON_DICT.update({row[0]: (row[1], row[2]) for row in rows})
+        lesson_titles = get_text_index()[209]
+        GL_LESSON_DICT.update({row[0]: (lesson_titles[row[1]], row[2]) for row in rows if row[1] in lesson_titles})
     
     return GL_LESSON_DICT
 
@@ -375,18 +617,61 @@ def get_group_card_effect_ids(force=False):
 
     return GROUP_CARD_EFFECT_IDS
 
-def get_program_id_grade(program_id):
-    with Connection() as (_, cursor):
-        cursor.execute(
-            """SELECT r.grade FROM single_mode_program smp JOIN race_instance ri on smp.race_instance_id = ri.id JOIN race r on ri.race_id = r.id WHERE smp.id = ?;""",
-            (program_id,)
-        )
-        row = cursor.fetchone()
+class RaceProgram(NamedTuple):
+    id: int
+    base_program_id: int
+    race_instance_id: int
+    month: int
+    half: int
+    need_fan_count: int
+    grade: int
+
+RACE_PROGRAM_INDEX = {}
+def get_race_program_index(force=False):
+    """All training race programs with their grade, loaded once.
+    by_id: program id to RaceProgram.
+    by_grade: grade to a list of RacePrograms.
+    by_base: base program id to a list of the RacePrograms based on it.
+    """
+    global RACE_PROGRAM_INDEX
+    if force or not RACE_PROGRAM_INDEX:
+        with Connection() as (_, cursor):
+            cursor.execute(
+                """SELECT smp.id, smp.base_program_id, smp.race_instance_id, smp.month, smp.half, smp.need_fan_count, r.grade FROM single_mode_program smp LEFT JOIN race_instance ri ON smp.race_instance_id = ri.id LEFT JOIN race r ON ri.race_id = r.id ORDER BY smp.id"""
+            )
+            rows = cursor.fetchall()
 
-    if not row:
-        return None
+        by_id = {}
+        by_grade = {}
+        by_base = {}
+        for row in rows:
+            program = RaceProgram(*row)
+            by_id.setdefault(program.id, program)
+            by_grade.setdefault(program.grade, []).append(program)
+            if program.base_program_id != 0:
+                by_base.setdefault(program.base_program_id, []).append(program)
 
-    return row[0]
+        RACE_PROGRAM_INDEX.update({
+            "by_id": by_id,
+            "by_grade": by_grade,
+            "by_base": by_base,
+        })
+    return RACE_PROGRAM_INDEX
+
+def get_race_program(program_id):
+    return get_race_program_index()["by_id"].get(program_id)
+
+def get_race_programs_with_grade(grade):
+    return get_race_program_index()["by_grade"].get(grade, [])
+
+def get_race_programs_with_base(base_program_id):
+    return get_race_program_index()["by_base"].get(base_program_id, [])
+
+def get_program_id_grade(program_id):
+    program = get_race_program(program_id)
+    if not program:
+        return None
+    return program.grade
 
 def get_program_id_data(program_id):
     with Connection() as (_, cursor):
@@ -448,6 +733,31 @@ def get_scouting_score_to_rank_dict(force=False):
 
     return SCOUTING_SCORE_TO_RANK_DICT
 
+SCOUTING_RANK_INDEX = {}
+def get_scouting_rank_index(force=False):
+    """The scouting rank thresholds as a running maximum, so the rank for a score can be found with bisect.
+    """
+    global SCOUTING_RANK_INDEX
+    if force or not SCOUTING_RANK_INDEX:
+        thresholds = []
+        ranks = []
+        highest = None
+        for score_threshold, rank in get_scouting_score_to_rank_dict().items():
+            highest = score_threshold if highest is None else max(highest, score_threshold)
+            thresholds.append(highest)
+            ranks.append(rank)
+        SCOUTING_RANK_INDEX.update({
+            "thresholds": thresholds,
+            "ranks": ranks,
+        })
+    return SCOUTING_RANK_INDEX
+
+def get_scouting_rank(score):
+    scouting_rank_index = get_scouting_rank_index()
+    # Thresholds are walked in order until the first one that is not reached.
+    i = bisect.bisect_right(scouting_rank_index["thresholds"], score)
+    return scouting_rank_index["ranks"][max(i - 1, 0)]
+
 def get_card_inherent_skills(card_id, level=99):
     skills = []
     rows = []
@@ -501,6 +811,79 @@ def determine_skill_id_from_group_id(group_id, rarity, skills_id_list):
     
     return skill_id
 
+SKILL_INDEX = {}
+def get_skill_index(force=False):
+    """Everything needed to resolve a trainee's skill list, so it can be done without queries.
+    disp_order: skill id to (disp_order, id) sort key.
+    group_skills: (group_id, rarity) to skill ids with group_rate > 0, ordered by group_rate.
+    card_skills: card id to a list of (need_rank, skill_id).
+    """
+    global SKILL_INDEX
+    if force or not SKILL_INDEX:
+        with Connection() as (_, cursor):
+            cursor.execute(
+                """SELECT id, group_id, rarity, group_rate, disp_order FROM skill_data ORDER BY rowid"""
+            )
+            skill_rows = cursor.fetchall()
+            cursor.execute(
+                """SELECT cd.id, ass.need_rank, ass.skill_id FROM card_data cd JOIN available_skill_set ass ON cd.available_skill_set_id = ass.available_skill_set_id"""
+            )
+            card_rows = cursor.fetchall()
+
+        disp_order = {}
+        group_skills = {}
+        for skill_id, group_id, rarity, group_rate, order in skill_rows:
+            disp_order[skill_id] = (order, skill_id)
+            if group_rate > 0:
+                group_skills.setdefault((group_id, rarity), []).append((group_rate, skill_id))
+
+        for key, skills in group_skills.items():
+            # Stable, like the ORDER BY it replaces.
+            skills.sort(key=lambda skill: skill[0])
+            group_skills[key] = [skill[1] for skill in skills]
+
+        card_skills = {}
+        for card_id, need_rank, skill_id in card_rows:
+            card_skills.setdefault(card_id, []).append((need_rank, skill_id))
+
+        SKILL_INDEX.update({
+            "disp_order": disp_order,
+            "group_skills": group_skills,
+            "card_skills": card_skills,
+        })
+    return SKILL_INDEX
+
+def resolve_skills_list(chara_info):
+    """Gives the same result as get_card_inherent_skills, determine_skill_id_from_group_id and sort_skills_by_display_order combined, without any queries.
+    """
+    skill_index = get_skill_index()
+    skill_id_dict = get_skill_id_dict()
+
+    skills_list = [skill_data['skill_id'] for skill_data in chara_info['skill_array']]
+
+    talent_level = chara_info['talent_level']
+    for need_rank, skill_id in skill_index["card_skills"].get(chara_info['card_id'], []):
+        if need_rank <= talent_level:
+            skills_list.append(skill_id)
+
+    for skill_tip in chara_info['skill_tips_array']:
+        if skill_tip['rarity'] > 1:
+            skills_list.append(skill_id_dict[(skill_tip['group_id'], skill_tip['rarity'])])
+            continue
+
+        skill_id = None
+        for skill_id in skill_index["group_skills"].get((skill_tip['group_id'], skill_tip['rarity']), []):
+            if skill_id not in skills_list:
+                break
+            skills_list.remove(skill_id)
+        skills_list.append(skill_id)
+
+    disp_order = skill_index["disp_order"]
+    sort_keys = sorted({disp_order[skill_id] for skill_id in skills_list if skill_id in disp_order})
+    if not sort_keys:
+        return None
+    return [sort_key[1] for sort_key in sort_keys]
+
 def get_total_minigame_plushies(force=False):
     with Connection() as (_, cursor):
         cursor.execute(
@@ -528,6 +911,34 @@ def get_uaf_required_rank_for_turn(force=False):
         
     return rows
 
+UAF_RANK_INDEX = {}
+def get_uaf_rank_index(force=False):
+    """Required sport rank per UAF competition turn, sorted by turn for bisect lookups.
+    """
+    global UAF_RANK_INDEX
+    if force or not UAF_RANK_INDEX:
+        rows = get_uaf_required_rank_for_turn() or []
+
+        ranks = {}
+        for turn, rank in rows:
+            # The last row wins for equal turns.
+            ranks[turn] = rank
+        turns = sorted(ranks)
+        UAF_RANK_INDEX.update({
+            "turns": turns,
+            "ranks": [ranks[turn] for turn in turns],
+        })
+    return UAF_RANK_INDEX
+
+def get_uaf_required_rank(turn):
+    """The required rank of the first competition on or after the given turn. None after the last competition.
+    """
+    uaf_rank_index = get_uaf_rank_index()
+    i = bisect.bisect_left(uaf_rank_index["turns"], turn)
+    if i == len(uaf_rank_index["turns"]):
+        return None
+    return uaf_rank_index["ranks"][i]
+
 def get_uaf_training_effects(force=False):
     with Connection() as (_, cursor):
         cursor.execute(
@@ -542,53 +953,85 @@ def get_uaf_training_effects(force=False):
     effects_map = {row[0]: row[1] for row in rows}
     return effects_map
 
-def get_cooking_success_rate(power: int) -> int:
-    with Connection() as (_, cursor):
-        cursor.execute(
-            "SELECT success_rate FROM single_mode_cook_success_odds WHERE ? BETWEEN power_min AND power_max",
-            (power,)
-        )
-        row = cursor.fetchone()
+COOKING_INDEX = {}
+def get_cooking_index(force=False):
+    """Great Food Festival lookup tables, so they can be read without queries every turn.
+    success_starts/success_rates: elementary cooking power ranges and the success rate of the first row covering each.
+    tasting_turns/tasting_thresholds: distinct turn_num values and the thresholds of the first row with at least that turn_num.
+    vegetable_max: (facility_id, facility_lv) to max vegetable count.
+    """
+    global COOKING_INDEX
+    if force or not COOKING_INDEX:
+        with Connection() as (_, cursor):
+            cursor.execute(
+                """SELECT power_min, power_max, success_rate FROM single_mode_cook_success_odds ORDER BY rowid"""
+            )
+            success_rows = cursor.fetchall()
+            cursor.execute(
+                """SELECT turn_num, success_num, great_success_num FROM single_mode_cook_power_data ORDER BY rowid"""
+            )
+            tasting_rows = cursor.fetchall()
+            cursor.execute(
+                """
+                SELECT l.facility_id, l.facility_lv, e.effect_value_2
+                FROM single_mode_cook_garden_effect e
+                JOIN single_mode_cook_garden_level l on l.effect_group_id = e.effect_group_id
+                WHERE e.effect_type == 110
+                """
+            )
+            vegetable_rows = cursor.fetchall()
+
+        # Ranges can overlap, so split them into ranges that are covered by the same rows.
+        bounds = sorted({row[0] for row in success_rows} | {row[1] + 1 for row in success_rows})
+        success_starts = []
+        success_rates = []
+        for start in bounds:
+            rate = 0
+            for power_min, power_max, success_rate in success_rows:
+                if power_min <= start <= power_max:
+                    rate = success_rate
+                    break
+            success_starts.append(start)
+            success_rates.append(rate)
+
+        tasting_turns = sorted({row[0] for row in tasting_rows})
+        tasting_thresholds = []
+        for turn in tasting_turns:
+            for turn_num, success_num, great_success_num in tasting_rows:
+                if turn_num >= turn:
+                    tasting_thresholds.append([success_num, great_success_num])
+                    break
+
+        vegetable_max = {}
+        for facility_id, facility_lv, max_count in vegetable_rows:
+            vegetable_max.setdefault((facility_id, facility_lv), max_count)
+
+        COOKING_INDEX.update({
+            "success_starts": success_starts,
+            "success_rates": success_rates,
+            "tasting_turns": tasting_turns,
+            "tasting_thresholds": tasting_thresholds,
+            "vegetable_max": vegetable_max,
+        })
+    return COOKING_INDEX
 
-    if not row:
+def get_cooking_success_rate(power: int) -> int:
+    cooking_index = get_cooking_index()
+    i = bisect.bisect_right(cooking_index["success_starts"], power) - 1
+    if i < 0:
         return 0
-    
-    return row[0]
+    return cooking_index["success_rates"][i]
 
 def get_cooking_tasting_success_thresholds(turn_num: int) -> list[int]:
-    with Connection() as (_, cursor):
-        cursor.execute(
-            "SELECT success_num, great_success_num FROM single_mode_cook_power_data WHERE ? < turn_num",
-            (turn_num,)
-        )
-    
-        row = cursor.fetchone()
-
-    if not row:
+    cooking_index = get_cooking_index()
+    i = bisect.bisect_right(cooking_index["tasting_turns"], turn_num)
+    if i == len(cooking_index["tasting_turns"]):
         return [0, 0]
-    
-    return [row[0], row[1]]
+    return list(cooking_index["tasting_thresholds"][i])
 
 def get_cooking_vegetable_max_count(veg_id: int, veg_lv: int) -> int:
     # Get the max count of a vegetable at specified level.
-
-    with Connection() as (_, cursor):
-        cursor.execute(
-            """
-            SELECT e.effect_value_2
-            FROM single_mode_cook_garden_effect e
-            JOIN single_mode_cook_garden_level l on l.effect_group_id = e.effect_group_id
-            WHERE l.facility_id = ? AND l.facility_lv = ? AND e.effect_type == 110
-            """,
-            (veg_id, veg_lv)
-        )
-        row = cursor.fetchone()
-    
-    if not row:
-        return 0
-    
-    return row[0]
-
+    return get_cooking_index()["vegetable_max"].get((veg_id, veg_lv), 0)
 
 SINGLE_MODE_UNIQUE_CHARA_DICT = {}
 def get_single_mode_unique_chara_dict(force=False):
@@ -612,23 +1055,27 @@ def get_single_mode_unique_chara_dict(force=False):
     return SINGLE_MODE_UNIQUE_CHARA_DICT
 
 
-UPDATE_FUNCS = [
-    get_chara_name_dict,
-    get_event_title_dict,
-    get_race_program_name_dict,
-    get_skill_name_dict,
-    get_skill_hint_name_dict,
-    get_status_name_dict,
-    get_outfit_name_dict,
-    get_support_card_dict,
-    get_support_card_string_dict,
-    get_mant_item_string_dict,
-    get_gl_lesson_dict,
-    get_group_card_effect_ids,
-    get_skill_id_dict,
-    get_scouting_score_to_rank_dict,
-    get_single_mode_unique_chara_dict
-]
+cache_registry.register(get_text_index, TEXT_INDEX, tables=["text_data"])
+cache_registry.register(get_chara_name_dict, CHARA_NAME_DICT, depends=["mdb.get_text_index"])
+cache_registry.register(get_event_title_dict, EVENT_TITLE_DICT, tables=["single_mode_story_data"], depends=["mdb.get_text_index"])
+cache_registry.register(get_race_program_name_dict, RACE_PROGRAM_NAME_DICT, tables=["single_mode_program"], depends=["mdb.get_text_index"])
+cache_registry.register(get_skill_name_dict, SKILL_NAME_DICT, tables=["skill_data"], depends=["mdb.get_text_index"])
+cache_registry.register(get_skill_hint_name_dict, SKILL_HINT_NAME_DICT, tables=["skill_data"], depends=["mdb.get_text_index"])
+cache_registry.register(get_status_name_dict, STATUS_NAME_DICT, depends=["mdb.get_text_index"])
+cache_registry.register(get_outfit_name_dict, OUTFIT_NAME_DICT, depends=["mdb.get_text_index"])
+cache_registry.register(get_support_card_dict, SUPPORT_CARD_DICT, tables=["support_card_data"])
+cache_registry.register(get_support_card_string_dict, SUPPORT_CARD_STRING_DICT, depends=["mdb.get_support_card_dict", "util.get_character_name_dict"])
+cache_registry.register(get_mant_item_string_dict, MANT_ITEM_STRING_DICT, depends=["mdb.get_text_index"])
+cache_registry.register(get_gl_lesson_dict, GL_LESSON_DICT, tables=["single_mode_live_square"], depends=["mdb.get_text_index"])
+cache_registry.register(get_group_card_effect_ids, GROUP_CARD_EFFECT_IDS, tables=["support_card_data"])
+cache_registry.register(get_race_program_index, RACE_PROGRAM_INDEX, tables=["single_mode_program", "race_instance", "race"])
+cache_registry.register(get_skill_id_dict, SKILL_ID_DICT, tables=["skill_data"])
+cache_registry.register(get_skill_index, SKILL_INDEX, tables=["skill_data", "card_data", "available_skill_set"])
+cache_registry.register(get_scouting_score_to_rank_dict, SCOUTING_SCORE_TO_RANK_DICT, tables=["team_building_rank"])
+cache_registry.register(get_scouting_rank_index, SCOUTING_RANK_INDEX, depends=["mdb.get_scouting_score_to_rank_dict"])
+cache_registry.register(get_uaf_rank_index, UAF_RANK_INDEX, tables=["single_mode_sport_competition"])
+cache_registry.register(get_cooking_index, COOKING_INDEX, tables=["single_mode_cook_success_odds", "single_mode_cook_power_data", "single_mode_cook_garden_effect", "single_mode_cook_garden_level"])
+cache_registry.register(get_single_mode_unique_chara_dict, SINGLE_MODE_UNIQUE_CHARA_DICT, tables=["single_mode_unique_chara"])
 
 def has_carotene_table():
     with Connection() as (_, cursor):
@@ -639,4 +1086,4 @@ def has_carotene_table():
     
     if row:
         return True
-    return False
\ No newline at end of file
+    return False
@@ -0,0 +1,214 @@
+import os
+import sys
+import time
+import threading
+import contextlib
+from loguru import logger
+import util
+
+REPORT_FILE = "mdb_profile.txt"
+# Write the report every this many packets, besides when CarrotJuicer stops.
+REPORT_INTERVAL = 100
+
+ENABLED = False
+
+_lock = threading.Lock()
+_local = threading.local()
+_session_start = time.time()
+_query_stats = {}
+_thread_stats = {}
+_packet_stats = {}
+_packet_count = 0
+
+
+def set_enabled(enabled):
+    global ENABLED
+    if enabled and not ENABLED:
+        logger.info("mdb query profiling enabled.")
+    ENABLED = enabled
+
+
+class QueryStat():
+    def __init__(self):
+        self.count = 0
+        self.rows = 0
+        self.total_time = 0.
+        self.max_time = 0.
+
+    def add(self, rows, elapsed):
+        self.count += 1
+        self.rows += rows
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+
+def get_call_site():
+    """Returns the mdb helper that ran the query, and the code outside mdb that called it.
+    """
+    frame = sys._getframe(1)
+    while frame and frame.f_globals.get("__name__") == __name__:
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+
+    helper = f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
+    caller = frame.f_back
+    while caller and caller.f_globals.get("__name__") in ("mdb", "cache_registry"):
+        caller = caller.f_back
+    if caller is None:
+        return helper
+    return f"{helper} <- {caller.f_globals.get('__name__')}.{caller.f_code.co_name}"
+
+
+class ProfiledCursor():
+    """Wraps an sqlite3 cursor and records how long each query and its fetches take.
+    """
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.query = None
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def finish(self):
+        if self.query is None:
+            return
+        call_site, sql, rows, elapsed = self.query
+        self.query = None
+        record(call_site, sql, rows, elapsed)
+
+    def execute(self, sql, *args):
+        self.finish()
+        call_site = get_call_site()
+        t1 = time.perf_counter()
+        self.cursor.execute(sql, *args)
+        self.query = [call_site, " ".join(sql.split()), 0, time.perf_counter() - t1]
+        return self
+
+    def timed_fetch(self, func, *args):
+        t1 = time.perf_counter()
+        result = func(*args)
+        if self.query is not None:
+            self.query[3] += time.perf_counter() - t1
+            if isinstance(result, list):
+                self.query[2] += len(result)
+            elif result is not None:
+                self.query[2] += 1
+        return result
+
+    def fetchone(self):
+        return self.timed_fetch(self.cursor.fetchone)
+
+    def fetchall(self):
+        return self.timed_fetch(self.cursor.fetchall)
+
+    def fetchmany(self, *args):
+        return self.timed_fetch(self.cursor.fetchmany, *args)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.timed_fetch(self.cursor.fetchone)
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self.finish()
+        self.cursor.close()
+
+
+def record(call_site, sql, rows, elapsed):
+    thread_name = threading.current_thread().name
+    packet = getattr(_local, "packet", None)
+    with _lock:
+        _query_stats.setdefault((call_site, sql), QueryStat()).add(rows, elapsed)
+        _thread_stats.setdefault(thread_name, QueryStat()).add(rows, elapsed)
+        if packet is not None:
+            packet_stat = _packet_stats.setdefault(packet, {})
+            packet_stat.setdefault(call_site, QueryStat()).add(rows, elapsed)
+
+
+@contextlib.contextmanager
+def packet(name, dispatch=False):
+    """Attributes the queries run inside this block to a packet.
+    """
+    global _packet_count
+    if not ENABLED:
+        yield
+        return
+
+    _local.packet = name
+    try:
+        yield
+    finally:
+        _local.packet = None
+        if dispatch:
+            with _lock:
+                _packet_count += 1
+                write = _packet_count % REPORT_INTERVAL == 0
+            if write:
+                write_report()
+
+
+def make_report():
+    with _lock:
+        query_stats = sorted(_query_stats.items(), key=lambda item: item[1].total_time, reverse=True)
+        thread_stats = sorted(_thread_stats.items(), key=lambda item: item[1].total_time, reverse=True)
+        packet_totals = []
+        for packet_name, call_sites in _packet_stats.items():
+            total = QueryStat()
+            for stat in call_sites.values():
+                total.count += stat.count
+                total.rows += stat.rows
+                total.total_time += stat.total_time
+            top_site = max(call_sites.items(), key=lambda item: item[1].total_time)[0]
+            packet_totals.append((packet_name, total, top_site))
+        packet_count = _packet_count
+
+    packet_totals.sort(key=lambda item: item[1].total_time, reverse=True)
+
+    lines = [
+        f"mdb query profile, session started {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(_session_start))}",
+        f"{packet_count} packets dispatched, {len(_packet_stats)} with queries",
+        "",
+        "Per thread:",
+    ]
+    for thread_name, stat in thread_stats:
+        lines.append(f"  {thread_name}: {stat.count} queries, {stat.rows} rows, {stat.total_time * 1000:.1f} ms")
+
+    lines += ["", "Per call site (by total time):"]
+    call_site_totals = {}
+    for (call_site, _), stat in query_stats:
+        total = call_site_totals.setdefault(call_site, QueryStat())
+        total.count += stat.count
+        total.rows += stat.rows
+        total.total_time += stat.total_time
+        total.max_time = max(total.max_time, stat.max_time)
+    for call_site, stat in sorted(call_site_totals.items(), key=lambda item: item[1].total_time, reverse=True):
+        lines.append(f"  {stat.total_time * 1000:9.1f} ms  {stat.count:6} calls  {stat.rows:8} rows  max {stat.max_time * 1000:7.2f} ms  {call_site}")
+
+    lines += ["", "Slowest queries (by total time):"]
+    for (call_site, sql), stat in query_stats[:25]:
+        lines.append(f"  {stat.total_time * 1000:9.1f} ms  {stat.count:6} calls  avg {stat.total_time / stat.count * 1000:7.2f} ms  {call_site}")
+        lines.append(f"      {sql[:200]}")
+
+    lines += ["", "Slowest packets:"]
+    for packet_name, stat, top_site in packet_totals[:25]:
+        lines.append(f"  {stat.total_time * 1000:9.1f} ms  {stat.count:4} queries  {os.path.basename(packet_name)}  (mostly {top_site})")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_report():
+    if not _query_stats:
+        return
+    report_path = util.get_appdata(REPORT_FILE)
+    try:
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write(make_report())
+    except OSError:
+        logger.warning(f"Could not write mdb profile to {report_path}")
+        return
+    logger.debug(f"Wrote mdb profile to {report_path}")
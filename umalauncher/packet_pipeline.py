@@ -0,0 +1,160 @@
+import os
+import time
+import queue
+import threading
+import traceback
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from loguru import logger
+import mdb_profiler
+
+
+@dataclass
+class DecodedPacket():
+    path: str
+    is_response: bool
+    data: dict = None
+    skills_list: list = None
+    # Cache generation the skills list was resolved with.
+    skills_generation: int = None
+    renders_overlay: bool = False
+    superseded: bool = False
+
+
+def get_message_time(message_path):
+    try:
+        return int(str(os.path.basename(message_path))[:-9])
+    except ValueError:
+        return None
+
+
+class MessageJanitor():
+    """Deletes handled msgpack files on a background thread, so retrying a locked file does not block packet handling.
+    """
+    def __init__(self):
+        # Files that could not be deleted. Filled by the janitor thread, and checked when packets are submitted.
+        self.skipped_msgpacks = set()
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="MessageJanitor", daemon=True)
+        self.thread.start()
+
+    def remove(self, message_path):
+        self.queue.put(message_path)
+
+    def is_skipped(self, message_path):
+        with self.lock:
+            return message_path in self.skipped_msgpacks
+
+    def remove_now(self, message_path):
+        if self.is_skipped(message_path):
+            return
+
+        tries = 0
+        last_exception = None
+        while tries < 5:
+            try:
+                if os.path.exists(message_path):
+                    os.remove(message_path)
+                    return
+                else:
+                    logger.warning(f"Attempted to delete non-existent msgpack file: {message_path}. Skipped.")
+                    return
+            except Exception as e:
+                last_exception = e
+                tries += 1
+                time.sleep(1)
+
+        logger.warning(f"Failed to remove msgpack file: {message_path}.")
+        logger.warning(''.join(traceback.format_tb(last_exception.__traceback__)))
+        with self.lock:
+            self.skipped_msgpacks.add(message_path)
+
+    def run(self):
+        while True:
+            message_path = self.queue.get()
+            if message_path is None:
+                return
+            self.remove_now(message_path)
+
+    def stop(self):
+        self.queue.put(None)
+
+
+class PacketPipeline():
+    """Decodes and pre-processes packets on a worker pool, then hands them to CarrotJuicer one by one, in the order they were submitted.
+    """
+    # Limits how many packets are taken from the folder at once, so a large burst is handled in chunks.
+    MAX_PENDING = 16
+
+    def __init__(self, carrotjuicer, workers=2):
+        self.carrotjuicer = carrotjuicer
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="PacketDecoder")
+        self.pending = collections.deque()
+        self.janitor = MessageJanitor()
+
+    def decode(self, message_path):
+        with mdb_profiler.packet(message_path):
+            if message_path.endswith("R.msgpack"):
+                packet = DecodedPacket(message_path, True)
+                packet.data = self.carrotjuicer.load_response(message_path)
+                self.carrotjuicer.preprocess_response(packet)
+            else:
+                packet = DecodedPacket(message_path, False)
+                packet.data = self.carrotjuicer.load_request(message_path)
+        return packet
+
+    def submit(self, message_path):
+        if self.janitor.is_skipped(message_path):
+            return
+
+        message_time = get_message_time(message_path)
+        if message_time is None:
+            return
+        if message_time < self.carrotjuicer.start_time:
+            # Delete old msgpack files.
+            self.janitor.remove(message_path)
+            return
+
+        self.pending.append((message_path, self.executor.submit(self.decode, message_path)))
+
+    def capacity(self):
+        return max(self.MAX_PENDING - len(self.pending), 0)
+
+    def is_superseded(self):
+        """Checks if a packet that is still pending, and already decoded, will render the overlay again.
+        Only looks at finished decodes, so it never waits.
+        """
+        for _, future in self.pending:
+            if not future.done() or future.cancelled() or future.exception():
+                continue
+            if future.result().renders_overlay:
+                return True
+        return False
+
+    def dispatch(self):
+        """Applies all submitted packets in order. Runs on the CarrotJuicer thread.
+        """
+        while self.pending:
+            message_path, future = self.pending.popleft()
+            try:
+                packet = future.result()
+            except Exception:
+                logger.error(f"Error while decoding {message_path}")
+                logger.error(traceback.format_exc())
+                packet = None
+
+            if packet is not None:
+                if packet.renders_overlay:
+                    packet.superseded = self.is_superseded()
+                with mdb_profiler.packet(message_path, dispatch=True):
+                    self.carrotjuicer.process_message(packet)
+            self.janitor.remove(message_path)
+
+    def stop(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.pending.clear()
+        self.janitor.stop()
+        if mdb_profiler.ENABLED:
+            mdb_profiler.write_report()
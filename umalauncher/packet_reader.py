@@ -0,0 +1,58 @@
+import os
+import mmap
+import msgpack
+import constants
+
+# CarrotJuicer prefixes requests with a header that is not part of the msgpack data.
+REQUEST_HEADER_SIZE = 170
+
+# Below this size, mapping the file costs more than reading it into the unpacker buffer.
+MMAP_THRESHOLD = 64 * 1024
+
+
+class IncompletePacketError(Exception):
+    """The packet file ended before the msgpack data did. It is most likely still being written.
+    """
+
+
+def uses_mmap(size):
+    return size >= MMAP_THRESHOLD
+
+
+def read_packet(msg_path, offset=0):
+    """Decodes the msgpack data in a packet file, starting at the given offset.
+    Large files are memory-mapped and decoded through a memoryview, so the file contents are not copied at all.
+    Small files go through a streaming Unpacker, which copies them once into its buffer.
+    """
+    with open(msg_path, "rb") as in_file:
+        size = os.fstat(in_file.fileno()).st_size
+        if size <= offset:
+            raise IncompletePacketError(msg_path)
+
+        try:
+            if uses_mmap(size):
+                with mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    return msgpack.unpackb(memoryview(mapped)[offset:], strict_map_key=False)
+
+            in_file.seek(offset)
+            unpacker = msgpack.Unpacker(in_file, read_size=size - offset, max_buffer_size=size, strict_map_key=False)
+            return unpacker.unpack()
+        except msgpack.OutOfData as e:
+            raise IncompletePacketError(msg_path) from e
+        except ValueError as e:
+            if "incomplete" in str(e):
+                raise IncompletePacketError(msg_path) from e
+            raise
+
+
+def load_request(msg_path):
+    unpacked = read_packet(msg_path, REQUEST_HEADER_SIZE)
+    # Remove keys that are not needed
+    for key in constants.REQUEST_KEYS_TO_BE_REMOVED:
+        if key in unpacked:
+            del unpacked[key]
+    return unpacked
+
+
+def load_response(msg_path):
+    return read_packet(msg_path)
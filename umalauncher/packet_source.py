@@ -0,0 +1,147 @@
+import os
+import time
+from loguru import logger
+
+try:
+    import win32file
+    import win32event
+    import win32con
+except ImportError:
+    win32file = None
+
+PACKET_SUFFIXES = ("R.msgpack", "Q.msgpack")
+
+
+class PacketSource():
+    """Delivers new CarrotJuicer msgpack paths in the order they were written.
+    The base class polls the folder with an adaptive interval: it backs off while the folder is idle
+    and snaps back to the minimum interval as soon as packets show up.
+    """
+    MIN_INTERVAL = 0.02
+    MAX_INTERVAL = 0.25
+    # Packets that still look unfinished after this long are delivered anyway, so a stray file cannot block the folder.
+    MAX_HOLD_NS = 2 * 1_000_000_000
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.interval = self.MIN_INTERVAL
+        self.delivered = set()
+
+    def wait(self, timeout):
+        """Block until new packets may be available, or until the timeout has passed.
+        """
+        time.sleep(min(self.interval, timeout))
+
+    def scan(self):
+        entries = []
+        try:
+            with os.scandir(self.folder) as it:
+                for entry in it:
+                    if not entry.name.endswith(PACKET_SUFFIXES):
+                        continue
+                    try:
+                        # On Windows, scandir already has the stat data so this does not cost a syscall.
+                        entries.append((entry.stat().st_mtime_ns, entry.name, entry.path))
+                    except FileNotFoundError:
+                        continue
+        except FileNotFoundError:
+            return []
+        entries.sort()
+        return entries
+
+    def is_closed(self, path, mtime_ns):
+        if time.time_ns() - mtime_ns > self.MAX_HOLD_NS:
+            return True
+
+        # A file that is still being written is either empty or locked by the writer.
+        try:
+            if os.path.getsize(path) == 0:
+                return False
+            with open(path, "rb"):
+                return True
+        except (PermissionError, FileNotFoundError):
+            return False
+
+    def get_batch(self, max_count=None):
+        """Returns the paths of packets that were not delivered before, oldest first.
+        Packets that are still being written are held back, along with every packet after them to keep the order.
+        """
+        entries = self.scan()
+        present = set()
+        batch = []
+        blocked = False
+        for mtime_ns, name, path in entries:
+            present.add(name)
+            if blocked or name in self.delivered:
+                continue
+            if (max_count is not None and len(batch) >= max_count) or not self.is_closed(path, mtime_ns):
+                blocked = True
+                continue
+            batch.append(path)
+            self.delivered.add(name)
+
+        # Forget files that have been deleted.
+        self.delivered &= present
+
+        if batch or blocked:
+            self.interval = self.MIN_INTERVAL
+        else:
+            self.interval = min(self.interval * 2, self.MAX_INTERVAL)
+        return batch
+
+    def close(self):
+        return
+
+
+class NotificationPacketSource(PacketSource):
+    """Wakes up on Windows change notifications for the folder instead of sleeping.
+    Falls back to adaptive polling while the folder does not exist or notifications cannot be set up.
+    """
+    handle = None
+
+    def open_handle(self):
+        if self.handle is not None:
+            return True
+        if not os.path.isdir(self.folder):
+            return False
+        try:
+            self.handle = win32file.FindFirstChangeNotification(
+                self.folder,
+                False,
+                win32con.FILE_NOTIFY_CHANGE_FILE_NAME | win32con.FILE_NOTIFY_CHANGE_LAST_WRITE | win32con.FILE_NOTIFY_CHANGE_SIZE
+            )
+        except Exception:
+            logger.warning(f"Could not watch {self.folder} for changes, falling back to polling.")
+            self.handle = None
+            return False
+        return True
+
+    def wait(self, timeout):
+        if not self.open_handle():
+            return super().wait(timeout)
+
+        if self.interval == self.MIN_INTERVAL:
+            # A packet was held back because it was still being written. It may not trigger a new notification.
+            timeout = min(timeout, self.MIN_INTERVAL)
+
+        result = win32event.WaitForSingleObject(self.handle, int(timeout * 1000))
+        if result == win32event.WAIT_OBJECT_0:
+            try:
+                win32file.FindNextChangeNotification(self.handle)
+            except Exception:
+                # The folder was probably removed. Reopen the handle on the next wait.
+                self.close()
+
+    def close(self):
+        if self.handle is not None:
+            try:
+                win32file.FindCloseChangeNotification(self.handle)
+            except Exception:
+                pass
+            self.handle = None
+
+
+def create_packet_source(folder):
+    if win32file is not None:
+        return NotificationPacketSource(folder)
+    return PacketSource(folder)
@@ -0,0 +1,123 @@
+import os
+import sys
+import glob
+import base64
+import hashlib
+import binascii
+from loguru import logger
+
+# Race packets in training logs do not hold their race_scenario, which is most of their size.
+# It is stored once per content in this folder next to the logs, named after its sha256.
+# A log copied somewhere else without this folder still analyzes fine, as the finish orders are kept in the log,
+# but the full races are not available.
+BLOB_FOLDER = "race_blobs"
+BLOB_SUFFIX = ".race"
+DIGEST_SIZE = 32
+
+
+def get_blob_folder(log_path):
+    return os.path.join(os.path.dirname(os.path.abspath(log_path)), BLOB_FOLDER)
+
+
+def get_blob_path(folder, digest):
+    name = digest.hex()
+    return os.path.join(folder, name[:2], name + BLOB_SUFFIX)
+
+
+class RaceBlobRef():
+    """Stands in for the race_scenario string of a race packet in a training log.
+    finish_orders has the finish order of every horse by frame order, so analyzing the log does not need the race itself.
+    The string is only read from the blob store when load() is called.
+    """
+    __slots__ = ("digest", "finish_orders", "folder")
+
+    def __init__(self, digest, finish_orders, folder=None):
+        self.digest = digest
+        self.finish_orders = finish_orders
+        self.folder = folder
+
+    def __eq__(self, other):
+        return isinstance(other, RaceBlobRef) and self.digest == other.digest and self.finish_orders == other.finish_orders
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __repr__(self):
+        return f"RaceBlobRef({self.digest.hex()[:12]}, {self.finish_orders})"
+
+    def pack(self):
+        return self.digest + bytes(self.finish_orders)
+
+    @classmethod
+    def unpack(cls, data, folder=None):
+        return cls(bytes(data[:DIGEST_SIZE]), list(data[DIGEST_SIZE:]), folder)
+
+    def load(self):
+        return get_blob(self.folder, self.digest)
+
+
+def put_blob(folder, race_scenario):
+    """Stores a race_scenario string, and returns its digest.
+    Returns None if the string is not base64 that encodes back to itself, as only the decoded bytes are stored.
+    """
+    if not isinstance(race_scenario, str):
+        return None
+    try:
+        data = base64.b64decode(race_scenario, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    if base64.b64encode(data).decode("ascii") != race_scenario:
+        return None
+
+    digest = hashlib.sha256(data).digest()
+    path = get_blob_path(folder, digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Other processes may store the same blob at the same time.
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return digest
+
+
+def get_blob(folder, digest):
+    """Returns the race_scenario string with the given digest.
+    """
+    with open(get_blob_path(folder, digest), "rb") as f:
+        data = f.read()
+    if hashlib.sha256(data).digest() != digest:
+        raise ValueError(f"Race blob {digest.hex()} in {folder} is corrupted.")
+    return base64.b64encode(data).decode("ascii")
+
+
+def load_race_scenario(race_scenario):
+    """Returns the race_scenario string of a race packet, reading it from the blob store if the packet only has a reference.
+    """
+    if isinstance(race_scenario, RaceBlobRef):
+        return race_scenario.load()
+    return race_scenario
+
+
+def get_store_size(folder):
+    count = 0
+    size = 0
+    for path in glob.glob(os.path.join(folder, "*", "*" + BLOB_SUFFIX)):
+        count += 1
+        size += os.path.getsize(path)
+    return count, size
+
+
+def main():
+    # Usage: race_blobs.py <training logs folder>
+    # Reports the size of the race blob store of a training logs folder.
+    if len(sys.argv) < 2:
+        print("No training logs folder given.")
+        return
+    folder = os.path.join(sys.argv[1], BLOB_FOLDER)
+    count, size = get_store_size(folder)
+    logger.info(f"{count} race blobs, {size / 1024:.0f} KiB in {folder}")
+
+
+if __name__ == "__main__":
+    main()
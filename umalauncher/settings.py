@@ -5,6 +5,8 @@ from win32com.shell import shell
 import traceback
 from loguru import logger
 import util
+import mdb
+import mdb_profiler
 import constants
 import version
 import gui
@@ -43,6 +45,13 @@ class DefaultSettings(se.NewSettings):
             se.SettingType.BOOL,
             hidden=True
         ),
+        "mdb_profiling": se.Setting(
+            "Profile game database queries.",
+            "Record the time spent on every game database query and write a report to mdb_profile.txt. (For debugging purposes)",
+            False,
+            se.SettingType.BOOL,
+            hidden=True
+        ),
         "discord_rich_presence": se.Setting(
             "Discord rich presence",
             "Display your current status in Discord.",
@@ -67,6 +76,22 @@ class DefaultSettings(se.NewSettings):
             True,
             se.SettingType.BOOL,
         ),
+        "training_log_flush": se.Setting(
+            "Save training logs",
+            "How often training logs are written to disk.<br>Less often uses less disk activity, but more of the log is lost if Uma Launcher crashes.",
+            {
+                "Every packet": False,
+                "Every turn": True,
+                "Every 10 packets": False
+            },
+            se.SettingType.RADIOBUTTONS,
+        ),
+        "training_log_delta": se.Setting(
+            "Compact training logs",
+            "Only save what changed since the previous packet, with a full packet every few turns.<br>Makes training logs smaller, but slightly slower to write.",
+            False,
+            se.SettingType.BOOL,
+        ),
         "open_training_logs": se.Setting(
             "Open training logs folder",
             "Open the training logs folder in File Explorer.",
@@ -85,6 +110,12 @@ class DefaultSettings(se.NewSettings):
             False,
             se.SettingType.BOOL,
         ),
+        "mdb_in_memory": se.Setting(
+            "Load game database into memory",
+            "Keep a copy of the parts of the game database that Uma Launcher uses in memory.<br>Makes the training helper faster, at the cost of some memory usage.",
+            False,
+            se.SettingType.BOOL,
+        ),
         "debug_mode": se.Setting(
             "Debug mode",
             "Enable debug mode. (Enables additional logging)",
@@ -404,6 +435,9 @@ class SettingsHandler():
             util.log_set_info()
             logger.debug("Debug mode disabled. Logging less.")
 
+        mdb.POOL.set_in_memory(self['mdb_in_memory'])
+        mdb_profiler.set_enabled(self['mdb_profiling'])
+
         # # Check if the game install path is correct.
         # for folder_tuple in [
         #     ('s_game_install_path', "umamusume.exe", "Please choose the game's installation folder.\n(Where umamusume.exe is located.)", "Selected folder does not include umamusume.exe.\nPlease try again.")
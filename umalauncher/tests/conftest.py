@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The launcher's modules are imported by name, as when running from this folder.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
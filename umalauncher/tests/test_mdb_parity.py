@@ -0,0 +1,178 @@
+import sqlite3
+import pytest
+import mdb
+from benchmarks import mdb_queries
+
+SCHEMA = """
+CREATE TABLE skill_data (id INTEGER PRIMARY KEY, group_id INTEGER, rarity INTEGER, group_rate INTEGER, disp_order INTEGER, unique_skill_id_1 INTEGER);
+CREATE TABLE card_data (id INTEGER PRIMARY KEY, chara_id INTEGER, default_rarity INTEGER, available_skill_set_id INTEGER);
+CREATE TABLE available_skill_set (id INTEGER PRIMARY KEY, available_skill_set_id INTEGER, skill_id INTEGER, need_rank INTEGER);
+CREATE TABLE single_mode_cook_success_odds (id INTEGER PRIMARY KEY, power_min INTEGER, power_max INTEGER, success_rate INTEGER);
+CREATE TABLE single_mode_cook_power_data (id INTEGER PRIMARY KEY, turn_num INTEGER, success_num INTEGER, great_success_num INTEGER);
+CREATE TABLE single_mode_cook_garden_level (id INTEGER PRIMARY KEY, facility_id INTEGER, facility_lv INTEGER, effect_group_id INTEGER);
+CREATE TABLE single_mode_cook_garden_effect (id INTEGER PRIMARY KEY, effect_group_id INTEGER, effect_type INTEGER, effect_value_2 INTEGER);
+CREATE TABLE single_mode_sport_competition (id INTEGER PRIMARY KEY, turn INTEGER, win_sport_rank INTEGER);
+CREATE TABLE team_building_rank (id INTEGER PRIMARY KEY, team_min_value INTEGER);
+"""
+
+# (id, group_id, rarity, group_rate, disp_order, unique_skill_id_1)
+SKILLS = [
+    # A white skill and its upgrade, and the gold version of the group.
+    (1001, 100, 1, 1, 30, 0),
+    (1002, 100, 1, 2, 20, 0),
+    (1003, 100, 2, 1, 10, 0),
+    # A negative group_rate is never picked from a hint.
+    (2001, 200, 1, 1, 20, 0),
+    (2002, 200, 1, -1, 21, 0),
+    # Equal disp_order, sorted by id. Listed out of group_rate order.
+    (3001, 300, 1, 2, 5, 0),
+    (3002, 300, 1, 1, 5, 0),
+    # Only the highest group_rate is used for rarity > 1.
+    (4001, 400, 3, 1, 1, 0),
+    (4002, 400, 3, 0, 2, 0),
+]
+
+CARDS = [
+    (10001, 1001, 5, 1),
+]
+
+# (available_skill_set_id, skill_id, need_rank)
+SKILL_SETS = [
+    (1, 2001, 0),
+    (1, 3001, 2),
+    (1, 1003, 4),
+]
+
+CHARA_INFOS = [
+    # Hint for an owned white skill upgrades it.
+    {"card_id": 10001, "talent_level": 3, "turn": 1, "skill_array": [{"skill_id": 1001}], "skill_tips_array": [{"group_id": 100, "rarity": 1}]},
+    # Gold hint, and an inherent skill that is only unlocked at talent level 4.
+    {"card_id": 10001, "talent_level": 5, "turn": 2, "skill_array": [], "skill_tips_array": [{"group_id": 100, "rarity": 2}, {"group_id": 400, "rarity": 3}]},
+    # Hint for a group that does not exist, and an owned skill that is not in skill_data.
+    {"card_id": 10001, "talent_level": 1, "turn": 3, "skill_array": [{"skill_id": 9999}], "skill_tips_array": [{"group_id": 999, "rarity": 1}]},
+    # Every skill of the group is owned already.
+    {"card_id": 10001, "talent_level": 1, "turn": 4, "skill_array": [{"skill_id": 3001}, {"skill_id": 3002}], "skill_tips_array": [{"group_id": 300, "rarity": 1}]},
+    # Unknown card and nothing learned.
+    {"card_id": 99999, "talent_level": 1, "turn": 5, "skill_array": [], "skill_tips_array": []},
+    # The same hint twice.
+    {"card_id": 10001, "talent_level": 2, "turn": 6, "skill_array": [], "skill_tips_array": [{"group_id": 200, "rarity": 1}, {"group_id": 200, "rarity": 1}]},
+]
+
+# (power_min, power_max, success_rate), with an overlap and a gap.
+COOK_SUCCESS_ODDS = [
+    (0, 99, 10),
+    (100, 199, 30),
+    (150, 300, 50),
+    (400, 500, 80),
+]
+
+# (turn_num, success_num, great_success_num), not sorted by turn.
+COOK_POWER_DATA = [
+    (24, 1, 2),
+    (12, 3, 4),
+    (36, 5, 6),
+    (36, 7, 8),
+]
+
+# (facility_id, facility_lv, effect_group_id)
+COOK_GARDEN_LEVELS = [
+    (1, 1, 10),
+    (1, 2, 11),
+    (2, 1, 20),
+]
+
+# (effect_group_id, effect_type, effect_value_2)
+COOK_GARDEN_EFFECTS = [
+    (10, 110, 5),
+    (10, 111, 99),
+    (11, 110, 8),
+    (20, 110, 3),
+]
+
+# (turn, win_sport_rank), with two rows for the same turn.
+SPORT_COMPETITIONS = [
+    (24, 5),
+    (48, 10),
+    (72, 20),
+    (48, 12),
+]
+
+# Not sorted, like some rank tables.
+TEAM_BUILDING_RANKS = [0, 1000, 3000, 2500, 5000]
+
+CONTAINERS = [
+    mdb.SKILL_ID_DICT,
+    mdb.SKILL_INDEX,
+    mdb.COOKING_INDEX,
+    mdb.UAF_RANK_INDEX,
+    mdb.SCOUTING_SCORE_TO_RANK_DICT,
+    mdb.SCOUTING_RANK_INDEX,
+]
+
+GETTERS = [
+    mdb.get_skill_id_dict,
+    mdb.get_skill_index,
+    mdb.get_cooking_index,
+    mdb.get_uaf_rank_index,
+    mdb.get_scouting_score_to_rank_dict,
+    mdb.get_scouting_rank_index,
+]
+
+
+def use_db(path):
+    mdb.DB_PATH = path
+    # Reopen the pooled connections on the next query.
+    mdb.POOL.close_all()
+    mdb.POOL.last_check = 0.
+    for container in CONTAINERS:
+        container.clear()
+
+
+@pytest.fixture(scope="module")
+def master_mdb(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("mdb") / "master.mdb")
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO skill_data (id, group_id, rarity, group_rate, disp_order, unique_skill_id_1) VALUES (?, ?, ?, ?, ?, ?)", SKILLS)
+    conn.executemany("INSERT INTO card_data (id, chara_id, default_rarity, available_skill_set_id) VALUES (?, ?, ?, ?)", CARDS)
+    conn.executemany("INSERT INTO available_skill_set (available_skill_set_id, skill_id, need_rank) VALUES (?, ?, ?)", SKILL_SETS)
+    conn.executemany("INSERT INTO single_mode_cook_success_odds (power_min, power_max, success_rate) VALUES (?, ?, ?)", COOK_SUCCESS_ODDS)
+    conn.executemany("INSERT INTO single_mode_cook_power_data (turn_num, success_num, great_success_num) VALUES (?, ?, ?)", COOK_POWER_DATA)
+    conn.executemany("INSERT INTO single_mode_cook_garden_level (facility_id, facility_lv, effect_group_id) VALUES (?, ?, ?)", COOK_GARDEN_LEVELS)
+    conn.executemany("INSERT INTO single_mode_cook_garden_effect (effect_group_id, effect_type, effect_value_2) VALUES (?, ?, ?)", COOK_GARDEN_EFFECTS)
+    conn.executemany("INSERT INTO single_mode_sport_competition (turn, win_sport_rank) VALUES (?, ?)", SPORT_COMPETITIONS)
+    conn.executemany("INSERT INTO team_building_rank (team_min_value) VALUES (?)", [(value,) for value in TEAM_BUILDING_RANKS])
+    conn.commit()
+    conn.close()
+
+    old_path = mdb.DB_PATH
+    use_db(path)
+    for getter in GETTERS:
+        getter(force=True)
+    yield path
+    use_db(old_path)
+
+
+def test_skill_resolution_matches_queries(master_mdb):
+    assert mdb_queries.compare_skill_resolution(CHARA_INFOS) == []
+
+
+def test_skill_resolution_result(master_mdb):
+    assert mdb.resolve_skills_list(CHARA_INFOS[0]) == [3001, 1002, 2001]
+    assert mdb.resolve_skills_list(CHARA_INFOS[1]) == [4001, 3001, 1003, 2001]
+    assert mdb.resolve_skills_list(CHARA_INFOS[4]) is None
+
+
+def test_range_lookups_match_queries(master_mdb):
+    assert mdb_queries.compare_range_lookups() == []
+
+
+def test_range_lookup_results(master_mdb):
+    # The first row that covers the power wins.
+    assert mdb.get_cooking_success_rate(160) == 30
+    assert mdb.get_cooking_success_rate(350) == 0
+    assert mdb.get_cooking_tasting_success_thresholds(12) == [1, 2]
+    assert mdb.get_cooking_tasting_success_thresholds(36) == [0, 0]
+    assert mdb.get_cooking_vegetable_max_count(1, 2) == 8
+    assert mdb.get_uaf_required_rank(30) == 12
+    assert mdb.get_uaf_required_rank(73) is None
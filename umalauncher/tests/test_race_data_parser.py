@@ -0,0 +1,83 @@
+import gzip
+import base64
+import random
+import struct
+import pytest
+from external import race_data_parser
+from benchmarks import race_parsing
+
+# Filler for padding and unknown trailing fields. Zero padding would hide reads from the wrong offset.
+PADDING = 0xa5
+
+
+def make_race(horse_num, frame_count, horse_frame_size=12, horse_result_size=31, frame_padding=0, seed=0):
+    """Builds a race_scenario buffer with the layout deserialize reads, filling every gap with PADDING.
+    temptation_mode, running_style and the event type are enums in race_data.proto, so they are kept in their ranges.
+    """
+    rng = random.Random(seed)
+    b = bytearray()
+
+    header = struct.pack('<i', 7) + bytes([PADDING] * 3)
+    b += struct.pack('<i', len(header)) + header
+
+    b += struct.pack('<fiii', 1.5, horse_num, horse_frame_size, horse_result_size)
+    b += struct.pack('<i', 5) + bytes([PADDING] * 5)
+
+    frame_size = 4 + horse_num * horse_frame_size + frame_padding
+    b += struct.pack('<ii', frame_count, frame_size)
+    for frame in range(frame_count):
+        b += struct.pack('<f', frame * 0.0666)
+        for _ in range(horse_num):
+            b += struct.pack('<fHHHbb', rng.uniform(0, 3000), rng.randrange(65536), rng.randrange(65536), rng.randrange(65536), rng.randint(0, 4), rng.randint(-1, horse_num - 1))
+            b += bytes([PADDING] * (horse_frame_size - 12))
+        b += bytes([PADDING] * frame_padding)
+    b += struct.pack('<i', 2) + bytes([PADDING] * 2)
+
+    for horse in range(horse_num):
+        b += struct.pack('<ifffBBfBif', horse + 1, rng.uniform(60, 180), rng.uniform(0, 5), rng.uniform(0, 0.1), rng.randrange(256), rng.randrange(256), rng.uniform(0, 2400), rng.randint(0, 4), rng.randint(-1, 3), rng.uniform(60, 180))
+        b += bytes([PADDING] * (horse_result_size - 31))
+    b += struct.pack('<i', 3) + bytes([PADDING] * 3)
+
+    events = []
+    for i in range(12):
+        params = [rng.randint(-1000, 1000) for _ in range(rng.randint(0, 4))]
+        body = struct.pack('<fbb', i * 1.25, rng.randint(0, 5), len(params)) + struct.pack(f'<{len(params)}i', *params)
+        # Events can be larger than their parameters.
+        body += bytes([PADDING] * (i % 3))
+        events.append(struct.pack('<h', len(body)) + body)
+    b += struct.pack('<i', len(events)) + b''.join(events)
+    return bytes(b)
+
+
+@pytest.mark.parametrize("horse_frame_size, horse_result_size, frame_padding", [
+    (12, 31, 0),
+    (16, 35, 0),
+    (20, 40, 6),
+])
+def test_arrays_match_protobuf(horse_frame_size, horse_result_size, frame_padding):
+    b = make_race(9, 40, horse_frame_size, horse_result_size, frame_padding)
+    assert race_parsing.compare(b) == []
+
+
+def test_arrays_skip_padding():
+    b = make_race(3, 5, horse_frame_size=16, horse_result_size=35, frame_padding=4)
+    race = race_data_parser.deserialize_arrays(b)
+    data = race_data_parser.deserialize(b)
+
+    assert race.horse_frame.shape == (5, 3)
+    assert race.horse_frame["hp"][4, 2] == data.frame[4].horse_frame[2].hp
+    assert race.horse_frame["block_front_horse_index"][4, 2] == data.frame[4].horse_frame[2].block_front_horse_index
+    assert race.horse_result["finish_order"].tolist() == [1, 2, 3]
+    assert race.horse_result["defeat"][2] == data.horse_result[2].defeat
+    assert len(race.events) == 12
+
+
+def test_parse_arrays():
+    b = make_race(2, 3, horse_frame_size=16)
+    race_scenario = base64.b64encode(gzip.compress(b)).decode("ascii")
+    assert race_data_parser.parse_arrays(race_scenario).horse_result["finish_order"].tolist() == [1, 2]
+
+
+def test_unexpected_layout():
+    with pytest.raises(ValueError):
+        race_data_parser.deserialize_arrays(make_race(2, 3, horse_frame_size=8))
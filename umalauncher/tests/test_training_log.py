@@ -0,0 +1,98 @@
+import gzip
+import training_log
+
+
+def make_packets(turns):
+    packets = []
+    for turn in range(1, turns + 1):
+        packets.append({"_direction": 0, "current_turn": turn})
+        packets.append({"_direction": 1, "chara_info": {"turn": turn, "a": turn * 7, "skill_array": [1, 2, 3]}, "home_info": {"b": 1}})
+    return packets
+
+
+def write_log(path, packets, delta):
+    writer = training_log.LogWriter(str(path), delta=delta)
+    for packet in packets:
+        writer.write(packet, training_log.get_turn(packet))
+    writer.close()
+
+
+def split_records(data):
+    # (start, end) of every record payload in the decompressed log.
+    records = []
+    position = len(training_log.MAGIC)
+    while position < len(data):
+        (length,) = training_log.RECORD_HEADER.unpack_from(data, position)
+        start = position + training_log.RECORD_HEADER.size
+        records.append((start, start + length))
+        position = start + length
+    return records
+
+
+def test_delta_log_reads_back(tmp_path):
+    packets = make_packets(25)
+    write_log(tmp_path / "training.gz", packets, delta=True)
+    assert training_log.load_packets(str(tmp_path / "training.gz")) == packets
+
+
+def test_corrupted_delta_record_drops_packets_until_keyframe(tmp_path):
+    packets = make_packets(25)
+    path = tmp_path / "training.gz"
+    write_log(path, packets, delta=True)
+
+    with gzip.open(path, "rb") as f:
+        data = bytearray(f.read())
+    records = split_records(data)
+    assert len(records) == len(packets)
+    # The response of turn 3. 0xc1 is never valid msgpack.
+    corrupted = 5
+    data[records[corrupted][0]] = 0xc1
+    path.write_bytes(gzip.compress(bytes(data)))
+
+    state = {}
+    read = [packet for _, packet in training_log.iter_records(str(path), state=state)]
+
+    # Every packet that is returned is the one that was written, none are rebuilt from a stale base.
+    remaining = iter(packets)
+    for packet in read:
+        assert packet in remaining
+
+    lost = [packet for packet in packets if packet not in read]
+    assert packets[corrupted] in lost
+    # Responses of turns 3 to 9 are lost, the full packet of turn 10 starts over.
+    assert [packet["chara_info"]["turn"] for packet in lost] == list(range(3, 10))
+    assert all(packet in read for packet in packets if packet["_direction"] == 0)
+    assert state["records"] == len(packets)
+    assert state["skipped"] == len(lost)
+
+
+def test_unfinished_log_is_kept_when_resumed(tmp_path):
+    packets = make_packets(6)
+    path = str(tmp_path / "training.gz")
+    writer = training_log.LogWriter(path)
+    for packet in packets[:8]:
+        writer.write(packet, training_log.get_turn(packet))
+    writer.flush()
+    writer.file.flush()
+    original = (tmp_path / "training.gz").read_bytes()
+    # The writer is not closed, like after a crash.
+
+    write_log(path, packets[8:], delta=False)
+
+    assert (tmp_path / "training.gz.1.bak").read_bytes() == original
+    assert training_log.load_packets(path) == packets
+    assert training_log.load_index(path) is not None
+
+
+def test_log_without_index_is_not_rewritten(tmp_path):
+    packets = make_packets(6)
+    path = tmp_path / "training.gz"
+    with gzip.open(path, "wb") as f:
+        f.write(training_log.MAGIC + b"".join(training_log.pack_record(packet) for packet in packets[:8]))
+    original = path.read_bytes()
+
+    write_log(path, packets[8:], delta=False)
+
+    assert path.read_bytes().startswith(original)
+    assert training_log.load_packets(str(path)) == packets
+    assert [packet for _, _, packet in training_log.read_turns(str(path), 5, 6)] == packets[8:]
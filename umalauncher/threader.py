@@ -1,16 +1,23 @@
+import multiprocessing
+if __name__ == "__main__":
+    # Worker processes for CSV generation start this executable again. This runs their task instead of the launcher.
+    multiprocessing.freeze_support()
+
 import util
 import sys
-gzips = list([path for path in sys.argv if path.endswith(".gz")])
-if gzips:
-    # User dropped file(s) on the launcher.
-    # Use them for CSV generation.
-    import training_tracker
-    training_tracker.training_csv_dialog(gzips)
-    sys.exit()
-
-if not util.elevate():
-    util.show_warning_box("Launch Error", "Uma Launcher needs administrator privileges to start.")
-    sys.exit()
+# Worker processes import this script too, without being __main__.
+if __name__ == "__main__":
+    gzips = list([path for path in sys.argv if path.endswith(".gz")])
+    if gzips:
+        # User dropped file(s) on the launcher.
+        # Use them for CSV generation.
+        import training_tracker
+        training_tracker.training_csv_dialog(gzips)
+        sys.exit()
+
+    if not util.elevate():
+        util.show_warning_box("Launch Error", "Uma Launcher needs administrator privileges to start.")
+        sys.exit()
 
 import threading
 import time
@@ -28,6 +35,7 @@ import training_tracker
 import gui
 import umaserver
 import horsium
+import cache_registry
 
 THREAD_OBJECTS = []
 THREADS = []
@@ -61,6 +69,9 @@ class Threader():
         # Ping the server to track usage
         self.settings.notify_server()
 
+        # Load the cached dicts before anything asks for them.
+        cache_registry.REGISTRY.warm_start()
+
         self.umaserver = umaserver.UmaServer(self)
         THREAD_OBJECTS.append(self.umaserver)
         THREADS.append(threading.Thread(target=self.umaserver.run_with_catch, name="UmaServer"))
@@ -0,0 +1,327 @@
+import os
+import sys
+import glob
+import time
+import sqlite3
+import threading
+import concurrent.futures
+from loguru import logger
+import util
+import constants
+import training_log
+
+CATALOG_FILE = "training_catalog.db"
+SCHEMA_VERSION = 1
+
+# Below this many logs to read, starting worker processes takes longer than reading them here.
+POOL_MIN_LOGS = 4
+MAX_POOL_WORKERS = 8
+# Rows are committed in batches during a rebuild, so an interrupted rebuild continues where it stopped.
+COMMIT_EVERY = 50
+
+STAT_COLUMNS = ("speed", "stamina", "power", "guts", "wiz", "fans")
+
+
+class RunSummary():
+    """The catalog data of one training log, built up one packet at a time.
+    turns: turn -> (packet index, decompressed offset) of the first response of that turn.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.training_id = os.path.splitext(os.path.basename(path))[0]
+        self.scenario_id = None
+        self.card_id = None
+        self.support_card_ids = []
+        self.start_time = None
+        self.last_turn = None
+        self.stats = {}
+        self.skill_count = 0
+        self.packet_count = 0
+        self.turns = {}
+
+    def add(self, packet, offset=None):
+        packet_index = self.packet_count
+        self.packet_count += 1
+
+        chara_info = packet.get('chara_info')
+        if not isinstance(chara_info, dict):
+            return
+
+        if self.scenario_id is None:
+            self.scenario_id = chara_info.get('scenario_id')
+            self.card_id = chara_info.get('card_id')
+            self.start_time = chara_info.get('start_time')
+            self.support_card_ids = [support_card['support_card_id'] for support_card in chara_info.get('support_card_array', [])]
+
+        turn = chara_info.get('turn')
+        if turn is not None:
+            self.last_turn = turn
+            if turn not in self.turns:
+                self.turns[turn] = (packet_index, offset)
+        self.stats = {column: chara_info.get(column) for column in STAT_COLUMNS}
+        self.skill_count = len(chara_info.get('skill_array', []))
+
+
+def get_catalog_key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def summarize_log(path):
+    """Reads a whole training log into a RunSummary. Returns (path, file stat, summary), with a None summary if the log could not be read.
+    Runs in worker processes during a rebuild.
+    """
+    file_stat = training_log.get_file_stat(path)
+    summary = RunSummary(path)
+    try:
+        for offset, packet in training_log.read_records(path):
+            summary.add(packet, offset)
+    except Exception as e:
+        logger.warning(f"Could not read training log {path}: {e}")
+        return path, file_stat, None
+    return path, file_stat, summary
+
+
+class TrainingCatalog():
+    """A local SQLite catalog of training logs and their run metadata, to find runs without opening every log.
+    """
+    def __init__(self, db_path=None):
+        self.db_path = db_path or util.get_appdata(CATALOG_FILE)
+        self.lock = threading.Lock()
+        self.create_schema()
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def create_schema(self):
+        with self.lock:
+            conn = self.connect()
+            try:
+                conn.execute("PRAGMA journal_mode = WAL")
+                if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                    conn.executescript("""
+                        DROP TABLE IF EXISTS run_turns;
+                        DROP TABLE IF EXISTS run_support_cards;
+                        DROP TABLE IF EXISTS runs;
+                    """)
+                conn.executescript(f"""
+                    CREATE TABLE IF NOT EXISTS runs (
+                        path TEXT PRIMARY KEY,
+                        file_mtime INTEGER,
+                        file_size INTEGER,
+                        training_id TEXT,
+                        scenario_id INTEGER,
+                        card_id INTEGER,
+                        chara_id INTEGER,
+                        start_time TEXT,
+                        last_turn INTEGER,
+                        speed INTEGER,
+                        stamina INTEGER,
+                        power INTEGER,
+                        guts INTEGER,
+                        wiz INTEGER,
+                        fans INTEGER,
+                        skill_count INTEGER,
+                        packet_count INTEGER,
+                        updated_at REAL
+                    );
+                    CREATE INDEX IF NOT EXISTS runs_scenario ON runs (scenario_id);
+                    CREATE INDEX IF NOT EXISTS runs_card ON runs (card_id);
+                    CREATE INDEX IF NOT EXISTS runs_chara ON runs (chara_id);
+                    CREATE INDEX IF NOT EXISTS runs_start_time ON runs (start_time);
+                    CREATE TABLE IF NOT EXISTS run_support_cards (
+                        path TEXT REFERENCES runs (path) ON DELETE CASCADE,
+                        position INTEGER,
+                        support_card_id INTEGER,
+                        PRIMARY KEY (path, position)
+                    );
+                    CREATE INDEX IF NOT EXISTS run_support_cards_id ON run_support_cards (support_card_id);
+                    CREATE TABLE IF NOT EXISTS run_turns (
+                        path TEXT REFERENCES runs (path) ON DELETE CASCADE,
+                        turn INTEGER,
+                        packet_index INTEGER,
+                        offset INTEGER,
+                        PRIMARY KEY (path, turn)
+                    );
+                    PRAGMA user_version = {SCHEMA_VERSION};
+                """)
+                conn.commit()
+            finally:
+                conn.close()
+
+    def write_summary(self, conn, summary, file_stat):
+        key = get_catalog_key(summary.path)
+        chara_id = int(str(summary.card_id)[:4]) if summary.card_id else None
+        file_mtime, file_size = file_stat if file_stat else (None, None)
+        conn.execute(
+            """INSERT OR REPLACE INTO runs (path, file_mtime, file_size, training_id, scenario_id, card_id, chara_id, start_time, last_turn,
+                                            speed, stamina, power, guts, wiz, fans, skill_count, packet_count, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (key, file_mtime, file_size, summary.training_id, summary.scenario_id, summary.card_id, chara_id, summary.start_time, summary.last_turn,
+             *(summary.stats.get(column) for column in STAT_COLUMNS), summary.skill_count, summary.packet_count, time.time())
+        )
+        # Replacing the run row removed its support cards and turns.
+        conn.executemany(
+            "INSERT INTO run_support_cards (path, position, support_card_id) VALUES (?, ?, ?)",
+            [(key, position, support_card_id) for position, support_card_id in enumerate(summary.support_card_ids)]
+        )
+        conn.executemany(
+            "INSERT INTO run_turns (path, turn, packet_index, offset) VALUES (?, ?, ?, ?)",
+            [(key, turn, packet_index, offset) for turn, (packet_index, offset) in summary.turns.items()]
+        )
+
+    def update(self, summary, file_stat=None):
+        """Stores the summary of one log. Called by TrainingTracker while a training is being logged.
+        """
+        if file_stat is None:
+            file_stat = training_log.get_file_stat(summary.path)
+        with self.lock:
+            conn = self.connect()
+            try:
+                self.write_summary(conn, summary, file_stat)
+                conn.commit()
+            finally:
+                conn.close()
+
+    def get_indexed_files(self):
+        conn = self.connect()
+        try:
+            return {row['path']: (row['file_mtime'], row['file_size']) for row in conn.execute("SELECT path, file_mtime, file_size FROM runs")}
+        finally:
+            conn.close()
+
+    def rebuild(self, folder=None, workers=None, force=False):
+        """Brings the catalog up to date with the logs in the folder. Logs that did not change since they were cataloged are skipped,
+        so an interrupted rebuild continues where it stopped. Logs are read in a process pool when there are enough of them.
+        Returns the amount of logs that were read.
+        """
+        if folder is None:
+            folder = util.TRAINING_LOGS_FOLDER
+        paths = sorted(glob.glob(os.path.join(folder, "*.gz")))
+        indexed = {} if force else self.get_indexed_files()
+        todo = [path for path in paths if indexed.get(get_catalog_key(path)) != training_log.get_file_stat(path)]
+
+        existing = {get_catalog_key(path) for path in paths}
+        removed = [key for key in self.get_indexed_files() if key not in existing and os.path.dirname(key) == get_catalog_key(folder)]
+
+        logger.info(f"Cataloging {len(todo)} of {len(paths)} training logs.")
+        t1 = time.perf_counter()
+        if len(todo) < POOL_MIN_LOGS or workers == 1:
+            results = map(summarize_log, todo)
+            executor = None
+        else:
+            max_workers = workers or min((os.cpu_count() or 2) - 1, MAX_POOL_WORKERS)
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=max(1, min(max_workers, len(todo))))
+            results = executor.map(summarize_log, todo, chunksize=4)
+
+        done = 0
+        try:
+            with self.lock:
+                conn = self.connect()
+                try:
+                    for key in removed:
+                        conn.execute("DELETE FROM runs WHERE path = ?", (key,))
+                    for path, file_stat, summary in results:
+                        done += 1
+                        if summary is not None:
+                            self.write_summary(conn, summary, file_stat)
+                        if done % COMMIT_EVERY == 0:
+                            conn.commit()
+                            logger.debug(f"Cataloged {done}/{len(todo)} training logs.")
+                    conn.commit()
+                finally:
+                    conn.close()
+        finally:
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        logger.info(f"Cataloged {done} training logs in {time.perf_counter() - t1:.2f}s.")
+        return done
+
+    def find_runs(self, scenario_id=None, card_id=None, chara_id=None, support_card_id=None, min_turn=None, limit=None):
+        """Returns the runs that match all given filters as dicts, newest first. support_card_ids lists the deck of each run.
+        """
+        conditions = []
+        params = []
+        if scenario_id is not None:
+            conditions.append("runs.scenario_id = ?")
+            params.append(scenario_id)
+        if card_id is not None:
+            conditions.append("runs.card_id = ?")
+            params.append(card_id)
+        if chara_id is not None:
+            conditions.append("runs.chara_id = ?")
+            params.append(chara_id)
+        if support_card_id is not None:
+            conditions.append("runs.path IN (SELECT path FROM run_support_cards WHERE support_card_id = ?)")
+            params.append(support_card_id)
+        if min_turn is not None:
+            conditions.append("runs.last_turn >= ?")
+            params.append(min_turn)
+
+        query = "SELECT * FROM runs"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY runs.start_time DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        conn = self.connect()
+        try:
+            runs = [dict(row) for row in conn.execute(query, params)]
+            for run in runs:
+                run['support_card_ids'] = [row[0] for row in conn.execute(
+                    "SELECT support_card_id FROM run_support_cards WHERE path = ? ORDER BY position", (run['path'],)
+                )]
+        finally:
+            conn.close()
+        return runs
+
+    def get_turns(self, path):
+        """Returns turn -> (packet index, decompressed offset) for a cataloged log.
+        """
+        conn = self.connect()
+        try:
+            return {row['turn']: (row['packet_index'], row['offset']) for row in conn.execute(
+                "SELECT turn, packet_index, offset FROM run_turns WHERE path = ? ORDER BY turn", (get_catalog_key(path),)
+            )}
+        finally:
+            conn.close()
+
+
+def get_scenario_id(name):
+    for scenario_id, scenario_name in constants.SCENARIO_DICT.items():
+        if scenario_name.lower() == name.lower():
+            return scenario_id
+    return None
+
+
+CATALOG = None
+def get_catalog():
+    global CATALOG
+    if CATALOG is None:
+        CATALOG = TrainingCatalog()
+    return CATALOG
+
+
+def main():
+    # Usage: training_catalog.py rebuild [training logs folder] [workers]
+    #        training_catalog.py find [scenario id] [support card id]
+    command = sys.argv[1] if len(sys.argv) > 1 else "rebuild"
+    catalog = get_catalog()
+    if command == "rebuild":
+        folder = sys.argv[2] if len(sys.argv) > 2 else None
+        workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        catalog.rebuild(folder, workers)
+    elif command == "find":
+        scenario_id = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        support_card_id = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        for run in catalog.find_runs(scenario_id=scenario_id, support_card_id=support_card_id):
+            print(f"{run['start_time']}  {constants.SCENARIO_DICT.get(run['scenario_id'], 'Unknown Scenario')}  card {run['card_id']}  turn {run['last_turn']}  {run['path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# Exports training logs without the launcher, file dialogs or popups. Works on any OS.
+# Usage examples:
+#   python training_cli.py --mdb master.mdb -o combined.csv training_logs/
+#   python training_cli.py --mdb master.mdb --format split -o csvs/ "archive/**/*.gz"
+#   python training_cli.py --mdb master.mdb --offline --name-data names.json --format jsonl -o rows.jsonl archive/
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import argparse
+from loguru import logger
+import util
+import mdb
+import training_tracker
+
+FORMATS = ("csv", "split", "jsonl")
+
+
+def find_logs(inputs, recursive=False):
+    """Expands files, folders and glob patterns to a sorted list of training logs, without duplicates.
+    """
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, "**", "*.gz") if recursive else os.path.join(item, "*.gz")
+            paths += sorted(glob.glob(pattern, recursive=recursive))
+        elif glob.has_magic(item):
+            paths += sorted(path for path in glob.glob(item, recursive=True) if path.endswith(".gz"))
+        elif os.path.isfile(item):
+            paths.append(item)
+        else:
+            logger.warning(f"No training logs found for {item}")
+
+    seen = set()
+    unique_paths = []
+    for path in paths:
+        key = os.path.normcase(os.path.abspath(path))
+        if key not in seen:
+            seen.add(key)
+            unique_paths.append(path)
+    return unique_paths
+
+
+def load_name_data(path):
+    """Fills the character and outfit names from a file saved by an earlier run, so they do not need to be downloaded.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        name_data = json.load(f)
+    util.downloaded_chara_dict.update({int(key): value for key, value in name_data["character"].items()})
+    util.downloaded_outfit_dict.update({int(key): value for key, value in name_data["outfit"].items()})
+    logger.info(f"Loaded {len(util.downloaded_chara_dict)} character and {len(util.downloaded_outfit_dict)} outfit names from {path}")
+
+
+def save_name_data(path):
+    name_data = {
+        "character": util.get_character_name_dict(),
+        "outfit": util.get_outfit_name_dict(),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(name_data, f, ensure_ascii=False)
+    logger.info(f"Saved name data to {path}")
+
+
+def export_csv(combiner):
+    combiner.combine()
+    return len(combiner.training_paths) - len(combiner.errors)
+
+
+def export_split(combiner):
+    # One CSV per training log in the output folder, named after the log.
+    os.makedirs(combiner.output_file_path, exist_ok=True)
+    written = 0
+    for index, rows, error, _ in combiner.iter_results():
+        training_path = combiner.training_paths[index]
+        if rows is None:
+            logger.error(f"Could not export {training_path}:\n{error}")
+            combiner.errors.append((training_tracker.get_training_name(training_path), error, False))
+            continue
+        csv_path = os.path.join(combiner.output_file_path, training_tracker.get_training_name(training_path) + ".csv")
+        with open(csv_path, "w", encoding="utf-8") as csv_file:
+            csv_file.write("\n".join(rows))
+        written += 1
+    return written
+
+
+def export_jsonl(combiner):
+    # One JSON object per row, with the columns as keys.
+    written = 0
+    with open(combiner.output_file_path, "w", encoding="utf-8") as out_file:
+        for index, rows, error, _ in combiner.iter_results():
+            training_path = combiner.training_paths[index]
+            if rows is None:
+                logger.error(f"Could not export {training_path}:\n{error}")
+                combiner.errors.append((training_tracker.get_training_name(training_path), error, False))
+                continue
+            reader = csv.reader(rows)
+            header = next(reader)
+            for cells in reader:
+                row = {"Run": index + 1, "File": os.path.basename(training_path)}
+                row.update(zip(header, cells))
+                out_file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            written += 1
+    return written
+
+
+EXPORTERS = {
+    "csv": export_csv,
+    "split": export_split,
+    "jsonl": export_jsonl,
+}
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Export Uma Launcher training logs to CSV without the launcher.")
+    parser.add_argument("inputs", nargs="+", help="Training log files, folders or glob patterns.")
+    parser.add_argument("-o", "--output", required=True, help="Output file, or output folder for --format split.")
+    parser.add_argument("--mdb", default=mdb.DB_PATH, help="Path to the game's master.mdb.")
+    parser.add_argument("--format", choices=FORMATS, default="csv", help="csv: one combined CSV. split: one CSV per log. jsonl: one JSON object per row.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes. 1 analyzes everything in this process. Default: based on the CPU count.")
+    parser.add_argument("--recursive", action="store_true", help="Also look for logs in subfolders of the given folders.")
+    parser.add_argument("--offline", action="store_true", help="Do not download names from umapyoi.net.")
+    parser.add_argument("--name-data", help="JSON file with character and outfit names. Loaded if it exists, otherwise saved after the names are loaded.")
+    parser.add_argument("--repeat", type=int, default=1, help="Export this many times and report the timings, for benchmarking.")
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+
+    # Errors are logged instead of shown in popups.
+    util.ignore_errors = True
+    util.offline = args.offline
+
+    if not os.path.isfile(args.mdb):
+        logger.error(f"master.mdb not found at {args.mdb}")
+        return 2
+    mdb.DB_PATH = args.mdb
+
+    training_paths = find_logs(args.inputs, args.recursive)
+    if not training_paths:
+        logger.error("No training logs found.")
+        return 2
+
+    if args.name_data and os.path.exists(args.name_data):
+        load_name_data(args.name_data)
+
+    t1 = time.perf_counter()
+    # Build the cached dicts once, before they are handed to the worker processes.
+    training_tracker.TrainingAnalyzer()
+    logger.info(f"Loaded game data in {time.perf_counter() - t1:.2f}s")
+
+    if args.name_data and not os.path.exists(args.name_data):
+        save_name_data(args.name_data)
+
+    exporter = EXPORTERS[args.format]
+    timings = []
+    for _ in range(max(args.repeat, 1)):
+        combiner = training_tracker.TrainingCombiner(training_paths, args.output, [], workers=args.workers)
+        t1 = time.perf_counter()
+        written = exporter(combiner)
+        timings.append(time.perf_counter() - t1)
+
+    best = min(timings)
+    logger.info(
+        f"Exported {written}/{len(training_paths)} training logs to {args.output} "
+        f"in {best:.2f}s ({len(training_paths) / best:.1f} logs/s)"
+        + (f", best of {len(timings)} runs, mean {sum(timings) / len(timings):.2f}s" if len(timings) > 1 else "")
+    )
+    return 0 if written else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
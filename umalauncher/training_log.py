@@ -0,0 +1,821 @@
+import os
+import sys
+import glob
+import gzip
+import json
+import zlib
+import codecs
+import struct
+import collections
+import msgpack
+from loguru import logger
+import race_blobs
+
+# Training logs are gzip files. The old format is the packets as JSON, joined by commas.
+# The new format starts with MAGIC, followed by records: a 4-byte little-endian length and that many bytes of msgpack.
+MAGIC = b"UMALOG\x01\n"
+RECORD_HEADER = struct.Struct("<I")
+# Anything larger is treated as a corrupted length, not a real packet.
+MAX_RECORD_SIZE = 256 * 1024 * 1024
+
+FORMAT_FRAMED = "framed"
+FORMAT_JSON = "json"
+
+READ_SIZE = 64 * 1024
+
+# Logs are written as one gzip member per turn. The index next to the log lists where each member starts,
+# so a reader can seek to a turn and decompress only from there.
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"UMAIDX\x01\n"
+# Turn (-1 before the first turn), ordinal of the first packet, compressed offset of the member, decompressed offset of the member.
+INDEX_ENTRY = struct.Struct("<iIQQ")
+NO_TURN = -1
+GZIP_MAGIC = b"\x1f\x8b"
+
+IndexEntry = collections.namedtuple("IndexEntry", ["turn", "ordinal", "offset", "data_offset"])
+
+# With delta storage, a response record can be a msgpack ext of DICT_DELTA_EXT instead of a packet:
+# the changes against the response before it. Nested changes are exts too, so anything that did not change is left out.
+DICT_DELTA_EXT = 1
+LIST_DELTA_EXT = 2
+# A race_scenario in the race blob store, see race_blobs.RaceBlobRef.
+RACE_BLOB_EXT = 3
+# Deltas start over with a full packet whenever the turn enters a new block of this many turns,
+# so a reader that seeks to a turn only needs to go back to the start of its block.
+KEYFRAME_TURNS = 10
+
+
+def iter_decompressed(path, read_size=READ_SIZE, state=None, offset=0):
+    """Yields the decompressed contents of a gzip file in chunks.
+    Handles files made of multiple gzip members, and stops cleanly at a truncated or corrupted tail,
+    after yielding everything that could still be decompressed.
+    If a state dict is given, state["complete"] tells if the file ended cleanly, and state["size"] is the decompressed size.
+    offset is where to start in the file, and must be the start of a gzip member.
+    """
+    # Callers that ask for the state handle an unfinished file themselves.
+    log_truncation = state is None
+    if state is None:
+        state = {}
+    state["complete"] = False
+    state["size"] = 0
+    decompressor = zlib.decompressobj(wbits=31)
+    # Whether the current gzip member got any data.
+    started = False
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while True:
+            chunk = f.read(read_size)
+            if not chunk:
+                break
+            started = True
+            while chunk:
+                try:
+                    output = decompressor.decompress(chunk)
+                except zlib.error:
+                    logger.warning(f"Training log {path} is corrupted. Reading stopped early.")
+                    return
+                if output:
+                    state["size"] += len(output)
+                    yield output
+                if not decompressor.eof:
+                    break
+                # Start of the next gzip member.
+                chunk = decompressor.unused_data
+                started = bool(chunk)
+                decompressor = zlib.decompressobj(wbits=31)
+
+    output = decompressor.flush()
+    if output:
+        state["size"] += len(output)
+        yield output
+    if not decompressor.eof and (output or decompressor.unconsumed_tail or started):
+        if log_truncation:
+            logger.warning(f"Training log {path} is truncated.")
+        return
+    state["complete"] = True
+
+
+def scan_log(path):
+    """Decompresses the whole file, and returns the state of iter_decompressed.
+    """
+    state = {}
+    for _ in iter_decompressed(path, state=state):
+        pass
+    return state
+
+
+def is_complete(path):
+    """Checks if every gzip member in the file is finished. A writer that did not close leaves the last one open.
+    """
+    return scan_log(path)["complete"]
+
+
+def get_format(path):
+    """Returns FORMAT_FRAMED or FORMAT_JSON, or None if the file is missing or empty.
+    """
+    if not os.path.exists(path):
+        return None
+    head = b""
+    for chunk in iter_decompressed(path, 256):
+        head += chunk
+        if len(head) >= len(MAGIC):
+            break
+    if not head:
+        return None
+    if head.startswith(MAGIC):
+        return FORMAT_FRAMED
+    return FORMAT_JSON
+
+
+def get_file_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def pack_ext(obj):
+    if isinstance(obj, race_blobs.RaceBlobRef):
+        return msgpack.ExtType(RACE_BLOB_EXT, obj.pack())
+    raise TypeError(f"Cannot store {type(obj).__name__} in a training log.")
+
+
+def packb(obj):
+    return msgpack.packb(obj, use_bin_type=True, default=pack_ext)
+
+
+def get_ext_hook(path):
+    """Returns the msgpack ext_hook for reading the training log at path. Race blob references point to the store next to it.
+    """
+    folder = race_blobs.get_blob_folder(path)
+
+    def ext_hook(code, data):
+        if code == RACE_BLOB_EXT:
+            return race_blobs.RaceBlobRef.unpack(data, folder)
+        return msgpack.ExtType(code, data)
+    return ext_hook
+
+
+def pack_record(packet):
+    return frame_payload(packb(packet))
+
+
+def frame_payload(payload):
+    return RECORD_HEADER.pack(len(payload)) + payload
+
+
+# Returned by make_delta when nothing changed.
+UNCHANGED = object()
+
+
+def make_delta(base, value):
+    """Returns what changed from base to value: value itself, a delta ext, or UNCHANGED.
+    """
+    if type(base) is not type(value):
+        return value
+
+    if isinstance(value, dict):
+        changed = {}
+        for key, item in value.items():
+            if key not in base:
+                changed[key] = item
+                continue
+            item_delta = make_delta(base[key], item)
+            if item_delta is not UNCHANGED:
+                changed[key] = item_delta
+        removed = [key for key in base if key not in value]
+        if not changed and not removed:
+            return UNCHANGED
+        if len(changed) == len(value):
+            # Nothing to share with the base.
+            return value
+        return msgpack.ExtType(DICT_DELTA_EXT, packb([changed, removed]))
+
+    if isinstance(value, list):
+        changed = {}
+        for index, item in enumerate(value):
+            if index >= len(base):
+                changed[index] = item
+                continue
+            item_delta = make_delta(base[index], item)
+            if item_delta is not UNCHANGED:
+                changed[index] = item_delta
+        if not changed and len(value) == len(base):
+            return UNCHANGED
+        if len(changed) > len(value) // 2:
+            # Most items changed or moved, e.g. an item was inserted near the start.
+            return value
+        return msgpack.ExtType(LIST_DELTA_EXT, packb([len(value), changed]))
+
+    if base == value:
+        return UNCHANGED
+    return value
+
+
+def apply_delta(base, delta, ext_hook=msgpack.ExtType):
+    """Rebuilds a value from its base and the result of make_delta.
+    Anything that did not change is shared with the base instead of copied, so packets read from a delta log must not be modified.
+    """
+    if not isinstance(delta, msgpack.ExtType):
+        return delta
+
+    if delta.code == DICT_DELTA_EXT:
+        changed, removed = msgpack.unpackb(delta.data, strict_map_key=False, ext_hook=ext_hook)
+        value = dict(base)
+        for key in removed:
+            value.pop(key, None)
+        for key, item in changed.items():
+            value[key] = apply_delta(base.get(key), item, ext_hook)
+        return value
+
+    if delta.code == LIST_DELTA_EXT:
+        length, changed = msgpack.unpackb(delta.data, strict_map_key=False, ext_hook=ext_hook)
+        value = base[:length]
+        value.extend([None] * (length - len(value)))
+        for index, item in changed.items():
+            value[index] = apply_delta(value[index], item, ext_hook)
+        return value
+
+    raise ValueError(f"Unknown ext type {delta.code} in training log.")
+
+
+def iter_records(path, start=None, state=None):
+    """Yields (offset, packet) for the records in a framed training log, one at a time.
+    The offset is where the record starts in the decompressed data.
+    A record that does not decode is skipped, as the length prefix still says where the next one starts.
+    The delta records after it are dropped too, up to the next full packet, as their base is gone.
+    A truncated last record is dropped.
+    start is an IndexEntry to start reading from, instead of the start of the file.
+    If a state dict is given, it gets the state of iter_decompressed, and after reading:
+    records: the amount of records read, skipped: how many of them were not yielded,
+    end: the decompressed offset after the last whole record.
+    """
+    # iter_decompressed only warns about a truncated file when the caller does not handle it.
+    decompress_state = state
+    if state is None:
+        state = {}
+    state["records"] = 0
+    state["skipped"] = 0
+    buffer = bytearray()
+    # Decompressed offset of the start of the buffer.
+    buffer_offset = start.data_offset if start else 0
+    state["end"] = buffer_offset
+    position = 0
+    # Only the first member starts with MAGIC.
+    header_checked = buffer_offset > 0
+    # The packet that the next delta record applies to.
+    base = None
+    # Delta records dropped since the last record that could not be read.
+    dropped = 0
+    ext_hook = get_ext_hook(path)
+    for chunk in iter_decompressed(path, state=decompress_state, offset=start.offset if start else 0):
+        buffer += chunk
+        if not header_checked:
+            if len(buffer) < len(MAGIC):
+                continue
+            if not buffer.startswith(MAGIC):
+                raise ValueError(f"{path} is not a framed training log.")
+            position = len(MAGIC)
+            state["end"] = len(MAGIC)
+            header_checked = True
+
+        while len(buffer) - position >= RECORD_HEADER.size:
+            (length,) = RECORD_HEADER.unpack_from(buffer, position)
+            if length > MAX_RECORD_SIZE:
+                logger.warning(f"Training log {path} has a corrupted record length. Reading stopped early.")
+                state["skipped"] += 1
+                return
+            end = position + RECORD_HEADER.size + length
+            if end > len(buffer):
+                break
+            offset = buffer_offset + position
+            position = end
+            state["records"] += 1
+            state["end"] = buffer_offset + end
+            try:
+                with memoryview(buffer) as view:
+                    packet = msgpack.unpackb(view[offset - buffer_offset + RECORD_HEADER.size:end], strict_map_key=False, ext_hook=ext_hook)
+                if isinstance(packet, msgpack.ExtType):
+                    if base is None:
+                        dropped += 1
+                        state["skipped"] += 1
+                        continue
+                    packet = apply_delta(base, packet, ext_hook)
+            except Exception:
+                logger.warning(f"Skipped a corrupted record in training log {path}.")
+                state["skipped"] += 1
+                base = None
+                continue
+
+            if dropped and not is_request(packet):
+                logger.warning(f"Dropped {dropped} packets in training log {path} that were stored as changes to a lost packet.")
+                dropped = 0
+            if not is_request(packet):
+                base = packet
+            yield offset, packet
+
+        if position > READ_SIZE:
+            # Drop the records that were already read, so the buffer only holds the current one.
+            del buffer[:position]
+            buffer_offset += position
+            position = 0
+
+    if dropped:
+        logger.warning(f"Dropped {dropped} packets at the end of training log {path} that were stored as changes to a lost packet.")
+    if len(buffer) > position:
+        logger.warning(f"Training log {path} ends in an incomplete record. It was dropped.")
+
+
+def scan_records(path, start=None):
+    """Reads the records from start to the end of the log, and returns the state of iter_records,
+    with the records and size counted from the start of the log.
+    """
+    state = {}
+    for _ in iter_records(path, start, state):
+        pass
+    if start:
+        state["records"] += start.ordinal
+        state["size"] += start.data_offset
+    return state
+
+
+def read_framed(path):
+    """Yields the packets in a framed training log, one at a time.
+    """
+    for _, packet in iter_records(path):
+        yield packet
+
+
+def _decode_json_packets(decoder, text, position):
+    # Returns the complete packets in text from position on, and where the first incomplete one starts.
+    packets = []
+    while True:
+        while position < len(text) and text[position] in ", \r\n\t":
+            position += 1
+        if position >= len(text):
+            return packets, position
+        try:
+            packet, position = decoder.raw_decode(text, position)
+        except ValueError:
+            return packets, position
+        packets.append(packet)
+
+
+def read_json(path):
+    """Yields the packets in an old comma-joined JSON training log, one at a time.
+    Stops at the last packet that is complete.
+    """
+    decoder = json.JSONDecoder()
+    utf8_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    text = ""
+    # Only try to decode an unfinished packet again once the buffer has doubled, so large packets are not parsed again for every chunk.
+    retry_at = 0
+
+    for chunk in iter_decompressed(path):
+        text += utf8_decoder.decode(chunk)
+        if len(text) < retry_at:
+            continue
+        packets, position = _decode_json_packets(decoder, text, 0)
+        yield from packets
+        text = text[position:]
+        retry_at = len(text) * 2
+
+    text += utf8_decoder.decode(b"", final=True)
+    packets, position = _decode_json_packets(decoder, text, 0)
+    yield from packets
+    if position < len(text):
+        logger.warning(f"Training log {path} ends in an incomplete packet. It was dropped.")
+
+
+def read_packets(path):
+    """Yields the packets in a training log of either format.
+    """
+    log_format = get_format(path)
+    if log_format == FORMAT_FRAMED:
+        yield from read_framed(path)
+    elif log_format == FORMAT_JSON:
+        yield from read_json(path)
+
+
+def read_records(path, state=None):
+    """Yields (offset, packet) for a training log of either format. Old JSON logs have no offsets.
+    state is passed to iter_records for framed logs.
+    """
+    log_format = get_format(path)
+    if log_format == FORMAT_FRAMED:
+        yield from iter_records(path, state=state)
+    elif log_format == FORMAT_JSON:
+        for packet in read_json(path):
+            yield None, packet
+
+
+def load_packets(path):
+    return list(read_packets(path))
+
+
+def append_packet(path, packet):
+    """Appends one packet to a framed training log. Old JSON logs are converted first.
+    """
+    log_format = get_format(path)
+    if log_format == FORMAT_JSON:
+        convert_log(path)
+        log_format = FORMAT_FRAMED
+
+    data = pack_record(packet)
+    if log_format is None:
+        data = MAGIC + data
+    with gzip.open(path, 'ab') as f:
+        f.write(data)
+
+
+def write_packets(path, packets, delta=False):
+    """Writes a whole framed training log and its index at once, through temporary files.
+    """
+    tmp_path = path + ".tmp"
+    for tmp_file in (tmp_path, tmp_path + INDEX_SUFFIX):
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    writer = LogWriter(tmp_path, FLUSH_TURN, delta=delta)
+    writer.open()
+    for packet in packets:
+        writer.write(packet, get_turn(packet))
+    writer.close()
+    os.replace(tmp_path + INDEX_SUFFIX, path + INDEX_SUFFIX)
+    os.replace(tmp_path, path)
+
+
+def set_aside(path):
+    """Renames a log that cannot be used as it is, together with its index, so it is kept. Returns the new path.
+    """
+    number = 1
+    while os.path.exists(f"{path}.{number}.bak"):
+        number += 1
+    backup = f"{path}.{number}.bak"
+    os.replace(path, backup)
+    if os.path.exists(get_index_path(path)):
+        os.replace(get_index_path(path), get_index_path(backup))
+    return backup
+
+
+def convert_log(path, output_path=None):
+    """Converts an old JSON training log to the framed format. Converts in place when no output path is given.
+    Returns the amount of packets converted.
+    """
+    if output_path is None:
+        output_path = path
+    packets = load_packets(path)
+    write_packets(output_path, packets)
+    logger.info(f"Converted training log {path} ({len(packets)} packets).")
+    return len(packets)
+
+
+def get_turn(packet):
+    chara_info = packet.get('chara_info')
+    if isinstance(chara_info, dict):
+        return chara_info.get('turn')
+    return None
+
+
+def is_request(packet):
+    return packet.get('_direction') == 0
+
+
+def iter_turns(records):
+    """Yields (turn, offset, packet) for (offset, packet) records, with the turn each packet is logged under.
+    The turn comes from the packet's chara_info, or from the packet before it. A request gets the turn of its response,
+    so it stays with the response when the log is split by turn.
+    """
+    turn = None
+    pending = None
+    for offset, packet in records:
+        packet_turn = get_turn(packet)
+        if packet_turn is not None:
+            turn = packet_turn
+        if pending is not None:
+            yield turn, pending[0], pending[1]
+            pending = None
+        if is_request(packet):
+            pending = (offset, packet)
+        else:
+            yield turn, offset, packet
+    if pending is not None:
+        yield turn, pending[0], pending[1]
+
+
+def get_index_path(path):
+    return path + INDEX_SUFFIX
+
+
+def load_index(path):
+    """Returns the IndexEntry list of a training log, or None if it has no index or the index does not match the log.
+    """
+    index_path = get_index_path(path)
+    try:
+        with open(index_path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if not data.startswith(INDEX_MAGIC):
+        return None
+
+    entries = []
+    # A crash can leave half an entry at the end.
+    end = len(data) - (len(data) - len(INDEX_MAGIC)) % INDEX_ENTRY.size
+    for entry in INDEX_ENTRY.iter_unpack(data[len(INDEX_MAGIC):end]):
+        entries.append(IndexEntry(*entry))
+    if not entries or entries[0].offset != 0:
+        return None
+
+    for previous, entry in zip(entries, entries[1:]):
+        if entry.offset <= previous.offset or entry.ordinal < previous.ordinal or entry.data_offset < previous.data_offset:
+            return None
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if entries[-1].offset >= size:
+                return None
+            f.seek(entries[-1].offset)
+            if f.read(len(GZIP_MAGIC)) != GZIP_MAGIC:
+                return None
+    except OSError:
+        return None
+    return entries
+
+
+def get_keyframe_entry(index, position):
+    """Returns the entry to start reading from for the member at position, so any delta records in it have their base.
+    """
+    if position < 0:
+        return None
+    if index[position].turn == NO_TURN:
+        return index[position]
+    block = index[position].turn // KEYFRAME_TURNS
+    while position > 0 and index[position - 1].turn != NO_TURN and index[position - 1].turn // KEYFRAME_TURNS == block:
+        position -= 1
+    return index[position]
+
+
+def read_turns(path, first_turn, last_turn=None):
+    """Yields (turn, offset, packet) for the packets logged under turns first_turn to last_turn.
+    With an index, only the gzip members of those turns are decompressed. Without one, the whole log is read.
+    """
+    if last_turn is None:
+        last_turn = first_turn
+    index = load_index(path)
+    if index is not None:
+        position = 0
+        for position, entry in enumerate(index):
+            if entry.turn != NO_TURN and entry.turn > first_turn:
+                position -= 1
+                break
+        records = iter_records(path, get_keyframe_entry(index, position))
+    else:
+        records = read_records(path)
+
+    for turn, offset, packet in iter_turns(records):
+        if turn is None or turn < first_turn:
+            continue
+        if turn > last_turn:
+            break
+        yield turn, offset, packet
+
+
+def read_packet_at(path, ordinal):
+    """Returns the packet with the given position in the log, or None if the log is shorter.
+    """
+    index = load_index(path)
+    start = None
+    if index is not None:
+        position = 0
+        for position, entry in enumerate(index):
+            if entry.ordinal > ordinal:
+                position -= 1
+                break
+        start = get_keyframe_entry(index, position)
+    current = start.ordinal if start else 0
+    records = iter_records(path, start) if start else read_records(path)
+    for _, packet in records:
+        if current == ordinal:
+            return packet
+        current += 1
+    return None
+
+
+FLUSH_PACKET = "packet"
+FLUSH_TURN = "turn"
+FLUSH_COUNT = "count"
+# Packets between flushes with FLUSH_COUNT.
+FLUSH_EVERY = 10
+
+
+class LogWriter():
+    """Keeps a training log open for the whole training. Every turn gets its own gzip member, and an entry in the index next to the log.
+    Flushing pushes the compressed data to the file with a sync flush, so everything up to the last flush can be read back
+    even if Uma Launcher crashes before the member is closed. Closing a member at the end of a turn flushes it too.
+    flush_policy: FLUSH_PACKET flushes after every packet, FLUSH_TURN when the turn changes, FLUSH_COUNT every FLUSH_EVERY packets.
+    A request is held back until the next packet, so it is logged in the same turn as its response.
+    delta: store responses as their changes against the previous response, with a full one every KEYFRAME_TURNS turns.
+    """
+    def __init__(self, path, flush_policy=FLUSH_TURN, flush_every=FLUSH_EVERY, delta=False):
+        self.path = path
+        self.flush_policy = flush_policy
+        self.flush_every = flush_every
+        self.delta = delta
+        # The last response as it will be read back, for delta storage.
+        self.base = None
+        self.keyframe_block = None
+        self.ext_hook = get_ext_hook(path)
+        self.file = None
+        self.gzip_file = None
+        self.index_file = None
+        self.unflushed = 0
+        self.turn = None
+        self.packets_written = 0
+        self.flushes = 0
+        # Decompressed offset where the next record goes.
+        self.offset = 0
+        # Position of the next record in the log.
+        self.ordinal = 0
+        # Records in the current gzip member, and whether it is in the index yet.
+        self.member_records = 0
+        self.member_indexed = False
+        self.member_start = 0
+        self.member_data_offset = 0
+        self.pending = None
+
+    def open(self, state=None):
+        """Opens the log for appending, after checking that it can be appended to.
+        state: the state of an iter_records pass over the whole log that the caller already did, so it is not read again.
+        """
+        log_format = get_format(self.path)
+        if log_format == FORMAT_JSON:
+            # The converted log is written next to the original, which is kept.
+            backup = set_aside(self.path)
+            convert_log(backup, self.path)
+            log_format = FORMAT_FRAMED
+
+        if log_format is not None:
+            index = load_index(self.path)
+            if state is None or "records" not in state:
+                # With an index, only the turns since the last full packet are read.
+                state = scan_records(self.path, get_keyframe_entry(index, len(index) - 1) if index else None)
+            if state["complete"] and state["end"] == state["size"]:
+                if index is None:
+                    # Older logs have no index. Their existing data is indexed as a single span, so it does not have to be rewritten.
+                    with open(get_index_path(self.path), 'wb') as f:
+                        f.write(INDEX_MAGIC + INDEX_ENTRY.pack(NO_TURN, 0, 0, 0))
+            else:
+                # Appending a new member after an unfinished one would make it unreadable. The original is kept,
+                # and the packets that could be read go into a new log, unless some were lost on the way.
+                skipped = scan_records(self.path)["skipped"]
+                backup = set_aside(self.path)
+                if skipped:
+                    logger.error(f"Training log {self.path} has unreadable records. It was moved to {backup}, and the training continues in a new log.")
+                    log_format = None
+                else:
+                    logger.warning(f"Recovering unfinished training log {self.path}. The original was moved to {backup}.")
+                    write_packets(self.path, read_framed(backup), self.delta)
+                    state = scan_records(self.path)
+
+        if log_format is not None:
+            self.offset = state["end"]
+            self.ordinal = state["records"]
+
+        if log_format is None:
+            # A new log replaces any index left over from an old log with the same name.
+            self.index_file = open(get_index_path(self.path), 'wb')
+            self.index_file.write(INDEX_MAGIC)
+        else:
+            self.index_file = open(get_index_path(self.path), 'ab')
+        self.file = open(self.path, 'ab')
+        self.start_member()
+        if log_format is None:
+            self.gzip_file.write(MAGIC)
+            self.offset = len(MAGIC)
+
+    def start_member(self):
+        self.member_start = self.file.tell()
+        self.member_data_offset = self.offset
+        self.member_records = 0
+        self.member_indexed = False
+        self.gzip_file = gzip.GzipFile(fileobj=self.file, mode='ab')
+
+    def end_member(self):
+        self.gzip_file.close()
+        self.file.flush()
+        if self.unflushed:
+            self.unflushed = 0
+            self.flushes += 1
+
+    def write_record(self, packet):
+        if not self.member_indexed:
+            turn = NO_TURN if self.turn is None else self.turn
+            self.index_file.write(INDEX_ENTRY.pack(turn, self.ordinal, self.member_start, self.member_data_offset))
+            self.index_file.flush()
+            self.member_indexed = True
+
+        if self.delta and not is_request(packet):
+            record = self.pack_delta_record(packet)
+        else:
+            record = pack_record(packet)
+        offset = self.offset
+        self.gzip_file.write(record)
+        self.offset += len(record)
+        self.ordinal += 1
+        self.member_records += 1
+        self.unflushed += 1
+        self.packets_written += 1
+        return offset
+
+    def pack_delta_record(self, packet):
+        payload = packb(packet)
+        # Diff against the packet as the reader will see it, e.g. with tuples turned into lists.
+        packet = msgpack.unpackb(payload, strict_map_key=False, ext_hook=self.ext_hook)
+        if self.base is not None:
+            delta = make_delta(self.base, packet)
+            if delta is UNCHANGED:
+                delta = msgpack.ExtType(DICT_DELTA_EXT, packb([{}, []]))
+            if isinstance(delta, msgpack.ExtType):
+                payload = packb(delta)
+        self.base = packet
+        return frame_payload(payload)
+
+    def write(self, packet, turn=None):
+        """Writes a packet, and returns the decompressed offset of its record.
+        Returns None for a request, as it is only written together with the next packet.
+        """
+        if self.gzip_file is None:
+            self.open()
+
+        if turn is not None and turn != self.turn:
+            # The previous turn is done.
+            if self.member_records:
+                self.end_member()
+                self.start_member()
+            self.turn = turn
+            if turn // KEYFRAME_TURNS != self.keyframe_block:
+                self.keyframe_block = turn // KEYFRAME_TURNS
+                self.base = None
+
+        if self.pending is not None:
+            self.write_record(self.pending)
+            self.pending = None
+
+        if turn is None and is_request(packet):
+            self.pending = packet
+            return None
+
+        offset = self.write_record(packet)
+        if self.flush_policy == FLUSH_PACKET or (self.flush_policy == FLUSH_COUNT and self.unflushed >= self.flush_every):
+            self.flush()
+        return offset
+
+    def flush(self):
+        if self.gzip_file is None or not self.unflushed:
+            return
+        self.gzip_file.flush(zlib.Z_SYNC_FLUSH)
+        self.unflushed = 0
+        self.flushes += 1
+
+    def close(self):
+        if self.gzip_file is None:
+            return
+        if self.pending is not None:
+            self.write_record(self.pending)
+            self.pending = None
+        self.gzip_file.close()
+        self.file.close()
+        self.index_file.close()
+        self.gzip_file = None
+        self.file = None
+        self.index_file = None
+        self.unflushed = 0
+
+
+def main():
+    # Usage: training_log.py [--delta] <training log .gz files or folders>
+    # Converts old JSON logs. With --delta, rewrites all given logs with delta storage.
+    args = sys.argv[1:]
+    delta = "--delta" in args
+    paths = []
+    for arg in args:
+        if arg == "--delta":
+            continue
+        if os.path.isdir(arg):
+            paths += sorted(glob.glob(os.path.join(arg, "*.gz")))
+        else:
+            paths.append(arg)
+    if not paths:
+        print("No training logs given.")
+        return
+
+    for path in paths:
+        if delta:
+            write_packets(path, load_packets(path), delta=True)
+        elif get_format(path) == FORMAT_JSON:
+            convert_log(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,16 @@
 import os
-import json
-import gzip
 import re
 import time
 import threading
+import collections
+import concurrent.futures
 import traceback
-import win32gui
-import win32con
+try:
+    import win32gui
+    import win32con
+except ImportError:
+    # The file dialogs are only available on Windows. The analyzer itself also runs headless, see training_cli.py.
+    win32gui = None
 from dataclasses import dataclass, field
 from enum import Enum
 from loguru import logger
@@ -21,13 +25,49 @@ import gui
 import mdb
 import util
 import constants
+import training_log
+import training_catalog
+import race_blobs
+import cache_registry
 from external import race_data_parser
 
 
+# Trackers of recent trainings that were analyzed live, by log path. Exporting these does not need to read the log again.
+LIVE_TRACKERS = collections.OrderedDict()
+MAX_LIVE_TRACKERS = 3
+
+
+def get_live_key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def get_live_analyzer(sav_path):
+    """Returns the live analyzer of a training log, if it is still up to date with the file.
+    """
+    tracker = LIVE_TRACKERS.get(get_live_key(sav_path))
+    if tracker is None or tracker.live_analyzer is None:
+        return None
+    if tracker.writer is None and tracker.closed_stat != training_log.get_file_stat(sav_path):
+        # The log was changed after the training ended.
+        return None
+    return tracker.live_analyzer
+
+
 class TrainingTracker():
 
-    def __init__(self, training_id: str, card_id: int=None, training_log_folder: str=util.TRAINING_LOGS_FOLDER, full_path: str=None):
+    def __init__(self, training_id: str, card_id: int=None, training_log_folder: str=util.TRAINING_LOGS_FOLDER, full_path: str=None, flush_policy: str=training_log.FLUSH_TURN, live_analysis: bool=False, catalog=None, delta_storage: bool=False):
         self.full_path=full_path
+        self.flush_policy = flush_policy
+        self.delta_storage = delta_storage
+        self.writer = None
+        self.training_paths = {}
+        self.live_analyzer = None
+        self.closed_stat = None
+        self.catalog = catalog
+        self.summary = None
+        self.cataloged_turn = None
+        # What reading the existing log found, so the writer does not read it again.
+        self.resume_state = None
         if not training_log_folder:
             training_log_folder = util.TRAINING_LOGS_FOLDER
         self.training_log_folder = training_log_folder
@@ -40,6 +80,14 @@ class TrainingTracker():
 
         self.training_id = self.make_string_safe(training_id)
 
+        if live_analysis:
+            self.live_analyzer = TrainingAnalyzer()
+            self.live_analyzer.start_live(self)
+        if catalog:
+            self.summary = training_catalog.RunSummary(self.get_sav_path())
+        if self.live_analyzer or self.summary:
+            self.catch_up()
+
 
     def make_string_safe(self, training_id: str):
         def convert_char(c: str):
@@ -54,7 +102,78 @@ class TrainingTracker():
 
 
     def add_packet(self, packet: dict):
-        self.write_packet(packet)
+        offset = self.write_packet(packet)
+        if self.summary:
+            self.summary.add(packet, offset)
+            if self.summary.last_turn != self.cataloged_turn:
+                self.update_catalog()
+        if self.live_analyzer:
+            try:
+                # The packet is the one that was logged, race blob references included. The fields the analyzer reads are not changed by CarrotJuicer afterwards.
+                self.live_analyzer.feed(packet)
+            except Exception:
+                # Exporting falls back to reading the log.
+                logger.error("Live training analysis failed.")
+                logger.error(traceback.format_exc())
+                self.stop_live_analysis()
+
+
+    def catch_up(self):
+        # Feeds the packets of this training that were logged before, e.g. before a restart, to the live analyzer and the catalog summary.
+        # The log is read once for both.
+        state = {}
+        try:
+            for offset, packet in training_log.read_records(self.get_sav_path(), state):
+                if self.live_analyzer:
+                    try:
+                        self.live_analyzer.feed(packet)
+                    except Exception:
+                        logger.error("Could not analyze the existing training log.")
+                        logger.error(traceback.format_exc())
+                        self.live_analyzer = None
+                if self.summary:
+                    self.summary.add(packet, offset)
+        except Exception:
+            logger.error("Could not read the existing training log.")
+            logger.error(traceback.format_exc())
+            self.live_analyzer = None
+            self.summary = None
+            return
+        self.resume_state = state
+
+        if self.live_analyzer:
+            key = get_live_key(self.get_sav_path())
+            LIVE_TRACKERS[key] = self
+            LIVE_TRACKERS.move_to_end(key)
+            while len(LIVE_TRACKERS) > MAX_LIVE_TRACKERS:
+                LIVE_TRACKERS.popitem(last=False)
+
+
+    def update_catalog(self):
+        try:
+            self.catalog.update(self.summary)
+            self.cataloged_turn = self.summary.last_turn
+        except Exception:
+            # The catalog is rebuilt from the logs, so a failed update only delays it.
+            logger.error("Could not update the training catalog.")
+            logger.error(traceback.format_exc())
+
+
+    def stop_live_analysis(self):
+        self.live_analyzer = None
+        key = get_live_key(self.get_sav_path())
+        if LIVE_TRACKERS.get(key) is self:
+            del LIVE_TRACKERS[key]
+
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+            # Remember what the finished log looks like, so later changes to it are noticed.
+            self.closed_stat = training_log.get_file_stat(self.get_sav_path())
+            if self.summary:
+                self.update_catalog()
 
 
     def add_request(self, request: dict):
@@ -72,23 +191,55 @@ class TrainingTracker():
     def add_response(self, response: dict):
         logger.debug("Adding response.")
         response['_direction'] = 1
-        self.add_packet(response)
+        self.add_packet(self.store_race_blobs(response))
+
+
+    def store_race_blobs(self, response: dict):
+        # Moves race_scenario strings into the race blob store. Returns a copy of the response with references instead.
+        if response.get('race_scenario') and 'race_start_info' in response:
+            response = {**response, 'race_scenario': self.make_race_blob_ref(response['race_scenario'])}
+        venus = response.get('venus_data_set')
+        if isinstance(venus, dict) and venus.get('race_scenario'):
+            response = {**response, 'venus_data_set': {**venus, 'race_scenario': self.make_race_blob_ref(venus['race_scenario'])}}
+        return response
+
+
+    def make_race_blob_ref(self, race_scenario):
+        # Keeps the race_scenario inline when it cannot be stored.
+        folder = race_blobs.get_blob_folder(self.get_sav_path())
+        try:
+            finish_orders = race_data_parser.parse_arrays(race_scenario).horse_result['finish_order'].tolist()
+            if not all(0 <= finish_order < 256 for finish_order in finish_orders):
+                return race_scenario
+            digest = race_blobs.put_blob(folder, race_scenario)
+        except Exception:
+            logger.error("Could not store race blob.")
+            logger.error(traceback.format_exc())
+            return race_scenario
+        if digest is None:
+            return race_scenario
+        return race_blobs.RaceBlobRef(digest, finish_orders, folder)
 
 
     def get_training_path(self, suffix=""):
         if self.full_path:
             return self.full_path + suffix
 
+        # The chara/outfit names do not change during a training, so the path only needs to be made once.
+        if suffix in self.training_paths:
+            return self.training_paths[suffix]
+
         card_segment = ""
         if self.card_id:
             card_segment = f"{util.get_character_name_dict().get(int(str(self.card_id)[:4]), 'Unknown Chara')} [{util.get_outfit_name_dict().get(self.card_id, '[Unknown Outfit]')[1:-1]}] - "
         
         filename = sanitize_filename(card_segment + self.training_id + suffix, replacement_text="_")
 
-        return str(os.path.join(
+        self.training_paths[suffix] = str(os.path.join(
             self.training_log_folder,
             filename
         ))
+        return self.training_paths[suffix]
 
 
     def get_sav_path(self):
@@ -100,36 +251,51 @@ class TrainingTracker():
 
 
     def write_packet(self, packet: dict):
-        # Convert to json string and save with gzip
-        # Append to gzip if file exists
-        is_first = not os.path.exists(self.get_sav_path())
+        # Append a framed msgpack record to the gzip file, which stays open until the training ends
         if packet is not None:
-            with gzip.open(self.get_sav_path(), 'ab') as f:
-                if not is_first:
-                    f.write(','.encode('utf-8'))
-                f.write(json.dumps(packet, ensure_ascii=False).encode('utf-8'))
+            if not self.writer:
+                self.writer = training_log.LogWriter(self.get_sav_path(), self.flush_policy, delta=self.delta_storage)
+                self.writer.open(self.resume_state)
+                self.resume_state = None
+            return self.writer.write(packet, training_log.get_turn(packet))
+        return None
+
+
+    def read_packets(self):
+        # Generator over the packets in the log, so they do not all need to be in memory at once.
+        if self.writer:
+            self.writer.flush()
+        return training_log.read_packets(self.get_sav_path())
+
+
+    def read_turns(self, first_turn, last_turn=None):
+        # Only decompresses the turns that are asked for, using the index next to the log.
+        if self.writer:
+            self.writer.flush()
+        for _, _, packet in training_log.read_turns(self.get_sav_path(), first_turn, last_turn):
+            yield packet
 
 
     def load_packets(self):
-        packet_list = []
         logger.debug("Loading packets from file")
-        if os.path.exists(self.get_sav_path()):
-            with gzip.open(self.get_sav_path(), 'rb') as f:
-                packet_list = json.loads(f"[{f.read().decode('utf-8')}]")
+        packet_list = list(self.read_packets())
         logger.debug(f"Amount of packets loaded: {len(packet_list)}")
         return packet_list
 
+    def get_analyzer(self):
+        app = get_live_analyzer(self.get_sav_path())
+        if app is None:
+            app = TrainingAnalyzer()
+            app.set_training_tracker(self)
+        return app
+
     def analyze(self):
-        app = TrainingAnalyzer(self)
+        app = self.get_analyzer()
         # app.run(TrainingAnalyzerGui(app))
-        app.set_training_tracker(self)
-        app.to_csv()
-        app.close()
+        app.to_csv(self.get_csv_path())
 
     def to_csv_list(self):
-        app = TrainingAnalyzer(self)
-        csv_list = app.to_csv_list()
-        return csv_list
+        return self.get_analyzer().to_csv_list()
 
 
 class TrainingAnalyzerGui(gui.UmaMainWidget):
@@ -251,9 +417,52 @@ class TrainingAction():
     remove_status: set = field(default_factory=set)
 
 
+class PacketPairer():
+    """Groups logged packets into (request, response) pairs, one packet at a time.
+    Extra requests before a response are skipped, keeping the first one.
+    """
+    def __init__(self):
+        self.req = None
+
+    def add(self, packet: dict):
+        if self.req is None:
+            self.req = packet
+            return None
+        # Check if response really is a response
+        if packet['_direction'] != 1:
+            return None
+        pair = (self.req, packet)
+        self.req = None
+        return pair
+
+
+def pair_packets(packets):
+    pairer = PacketPairer()
+    for packet in packets:
+        pair = pairer.add(packet)
+        if pair is not None:
+            yield pair
+
+
+def format_csv_cell(value):
+    cell_data = str(value)
+    cell_data = cell_data.replace('"', '""')
+    if ',' in cell_data:
+        cell_data = f"\"{cell_data}\""
+    return cell_data
+
+
+def remove_zero(value):
+    if value in (0, '0'):
+        return ""
+    return value
+
+
 class TrainingAnalyzer():
+    """Turns a training log into CSV rows. Packets are streamed through pair_packets, iter_actions and iter_csv_rows,
+    so only the previous action is kept in memory, however long the log is.
+    """
     training_tracker = None
-    packets = None
     last_turn = 0
     scenario_id = None
     card_id = None
@@ -264,7 +473,12 @@ class TrainingAnalyzer():
     last_mant_shop_items_dict = {}
     next_action_type = None
     gm_effect_active = False
-    action_list = []
+    prev_action = None
+    static_cells = None
+    live = False
+    action_list = None
+    pairer = None
+    prev_resp = None
 
     def __init__(self):
         self.chara_names_dict = util.get_character_name_dict()
@@ -277,10 +491,14 @@ class TrainingAnalyzer():
         self.support_card_string_dict = mdb.get_support_card_string_dict()
         self.mant_item_string_dict = mdb.get_mant_item_string_dict()
         self.gl_lesson_dict = mdb.get_gl_lesson_dict()
+        self.headers = self.make_headers()
+        self.lock = threading.Lock()
 
     def set_training_tracker(self, training_tracker):
         self.training_tracker = training_tracker
-        self.packets = None
+        self.reset()
+
+    def reset(self):
         self.last_turn = 0
         self.scenario_id = None
         self.card_id = None
@@ -291,132 +509,139 @@ class TrainingAnalyzer():
         self.last_mant_shop_items_dict = {}
         self.next_action_type = None
         self.gm_effect_active = False
-        self.action_list = []
-        self.packets = self.training_tracker.load_packets()
-
-    def to_csv_list(self):
-        self.action_list = []
+        self.prev_action = None
+        self.static_cells = None
+
+    def make_action(self, req: dict, resp: dict, prev_resp: dict):
+        """Creates the action for a request/response pair, or returns None if the response is not recognized.
+        """
+        if 'chara_info' in resp:
+            chara_info = resp['chara_info']
+
+            if self.last_turn == 0:
+                # First turn, set all static values.
+                self.scenario_id = chara_info['scenario_id']
+                self.card_id = chara_info['card_id']
+                self.chara_id = int(str(self.card_id)[:4])
+                self.support_cards = chara_info['support_card_array']
+
+            # Create base action
+            action = TrainingAction(
+                turn = req['current_turn'] if 'current_turn' in req else chara_info['turn'],
+                speed = chara_info['speed'],
+                stamina = chara_info['stamina'],
+                power = chara_info['power'],
+                guts = chara_info['guts'],
+                wisdom = chara_info['wiz'],
+                skill_pt = chara_info['skill_point'],
+                energy = chara_info['vital'],
+                motivation = chara_info['motivation'],
+                fans = chara_info['fans'],
+                skill = {tuple(item.values()) for item in chara_info['skill_array']},
+                skillhint = {tuple(item.values()) for item in chara_info['skill_tips_array']},
+                status = set(chara_info['chara_effect_id_array'])
+            )
 
-        # Grab req/resp pairs
-        prev_resp = None
-        # for i in range(0, len(self.packets), 2):
-        packet_index = 0
-        while packet_index < len(self.packets) - 1:
-            req = self.packets[packet_index]
-            resp = self.packets[packet_index+1]
-
-            # Check if response really is a response
-            while resp['_direction'] != 1:
-                packet_index += 1
-                resp = self.packets[packet_index+1]
-            packet_index += 2
-
-            if 'chara_info' in resp:
-                chara_info = resp['chara_info']
-
-                if self.last_turn == 0:
-                    # First turn, set all static values.
-                    self.scenario_id = chara_info['scenario_id']
-                    self.card_id = chara_info['card_id']
-                    self.chara_id = int(str(self.card_id)[:4])
-                    self.support_cards = chara_info['support_card_array']            
-
-                # Create base action
-                action = TrainingAction(
-                    turn = req['current_turn'] if 'current_turn' in req else chara_info['turn'],
-                    speed = chara_info['speed'],
-                    stamina = chara_info['stamina'],
-                    power = chara_info['power'],
-                    guts = chara_info['guts'],
-                    wisdom = chara_info['wiz'],
-                    skill_pt = chara_info['skill_point'],
-                    energy = chara_info['vital'],
-                    motivation = chara_info['motivation'],
-                    fans = chara_info['fans'],
-                    skill = {tuple(item.values()) for item in chara_info['skill_array']},
-                    skillhint = {tuple(item.values()) for item in chara_info['skill_tips_array']},
-                    status = set(chara_info['chara_effect_id_array'])
-                )
-            
-            elif 'race_scenario' in resp and resp['race_scenario']:
-                # Race packet
-                this_horse_data = resp['race_start_info']['race_horse_data'][0]
-                action = TrainingAction(
-                    turn = req['current_turn'],
-                    speed = this_horse_data['speed'],
-                    stamina = this_horse_data['stamina'],
-                    power = this_horse_data['pow'],
-                    guts = this_horse_data['guts'],
-                    wisdom = this_horse_data['wiz'],
-                    skill_pt = self.action_list[-1].skill_pt,
-                    energy = self.action_list[-1].energy,
-                    motivation = this_horse_data['motivation'],
-                    fans = this_horse_data['fan_count'],
-                    skill = {tuple(item.values()) for item in this_horse_data['skill_array']},
-                    skillhint = self.action_list[-1].skillhint,
-                    status = self.action_list[-1].status
-                )
+        elif 'race_scenario' in resp and resp['race_scenario']:
+            # Race packet
+            this_horse_data = resp['race_start_info']['race_horse_data'][0]
+            action = TrainingAction(
+                turn = req['current_turn'],
+                speed = this_horse_data['speed'],
+                stamina = this_horse_data['stamina'],
+                power = this_horse_data['pow'],
+                guts = this_horse_data['guts'],
+                wisdom = this_horse_data['wiz'],
+                skill_pt = self.prev_action.skill_pt,
+                energy = self.prev_action.energy,
+                motivation = this_horse_data['motivation'],
+                fans = this_horse_data['fan_count'],
+                skill = {tuple(item.values()) for item in this_horse_data['skill_array']},
+                skillhint = self.prev_action.skillhint,
+                status = self.prev_action.status
+            )
 
-            else:
-                # Unknown packet
-                logger.error(f'Unknown response packet type at index {packet_index}: {resp}')
-                continue
+        else:
+            # Unknown packet
+            logger.error(f'Unknown response packet type: {resp}')
+            return None
+
+        # Determine if turn changed
+        if action.turn > self.last_turn:
+            self.last_turn = action.turn
+            # Reset some values
+            self.gm_effect_active = False
+
+        # Calculate deltas
+        if self.prev_action:
+            prev_action = self.prev_action
+            action.dspeed = action.speed - prev_action.speed
+            action.dstamina = action.stamina - prev_action.stamina
+            action.dpower = action.power - prev_action.power
+            action.dguts = action.guts - prev_action.guts
+            action.dwisdom = action.wisdom - prev_action.wisdom
+            action.dskill_pt = action.skill_pt - prev_action.skill_pt
+            action.denergy = action.energy - prev_action.energy
+            action.dmotivation = action.motivation - prev_action.motivation
+            action.dfans = action.fans - prev_action.fans
+            action.add_skill = action.skill - prev_action.skill
+            action.remove_skill = prev_action.skill - action.skill
+            action.add_skillhint = action.skillhint - prev_action.skillhint
+            action.add_status = action.status - prev_action.status
+            action.remove_status = prev_action.status - action.status
+
+        # Determine action type
+        self.determine_action_type(req, resp, action, prev_resp)
+
+        if 'home_info' in resp:
+            self.last_failure_rates = {command['command_id']: command['failure_rate'] for command in resp['home_info']['command_info_array']}
+
+        self.prev_action = action
+        return action
+
+    def start_live(self, training_tracker):
+        """Analyzes the training as its packets come in, keeping every action, so it can be exported right away.
+        """
+        self.set_training_tracker(training_tracker)
+        self.live = True
+        self.action_list = []
+        self.pairer = PacketPairer()
+        self.prev_resp = None
 
-            # Determine if turn changed
-            if action.turn > self.last_turn:
-                self.last_turn = action.turn
-                # Reset some values
-                self.gm_effect_active = False
-
-            # Calculate deltas
-            if self.action_list:
-                prev_action = self.action_list[-1]
-                action.dspeed = action.speed - prev_action.speed
-                action.dstamina = action.stamina - prev_action.stamina
-                action.dpower = action.power - prev_action.power
-                action.dguts = action.guts - prev_action.guts
-                action.dwisdom = action.wisdom - prev_action.wisdom
-                action.dskill_pt = action.skill_pt - prev_action.skill_pt
-                action.denergy = action.energy - prev_action.energy
-                action.dmotivation = action.motivation - prev_action.motivation
-                action.dfans = action.fans - prev_action.fans
-                action.add_skill = action.skill - prev_action.skill
-                action.remove_skill = prev_action.skill - action.skill
-                action.add_skillhint = action.skillhint - prev_action.skillhint
-                action.add_status = action.status - prev_action.status
-                action.remove_status = prev_action.status - action.status
-
-
-            # Determine action type
-            self.determine_action_type(req, resp, action, prev_resp)
-
-            # Add to list
+    def feed(self, packet: dict):
+        pair = self.pairer.add(packet)
+        if pair is None:
+            return
+        req, resp = pair
+        with self.lock:
+            action = self.make_action(req, resp, self.prev_resp)
+            if action is None:
+                return
             self.action_list.append(action)
+            self.prev_resp = resp
 
-            if 'home_info' in resp:
-                self.last_failure_rates = {command['command_id']: command['failure_rate'] for command in resp['home_info']['command_info_array']}
-
+    def iter_actions(self, packets):
+        prev_resp = None
+        for req, resp in pair_packets(packets):
+            action = self.make_action(req, resp, prev_resp)
+            if action is None:
+                continue
+            yield action
             prev_resp = resp
 
-        # Write to CSV
-        scenario_str = constants.SCENARIO_DICT.get(self.scenario_id, 'Unknown Scenario')
-        chara_str = f"{self.chara_names_dict.get(self.chara_id, 'Unknown Character')} {self.outfit_name_dict.get(self.card_id, 'Unknown Outfit')}"
-        support_1_str = f"{self.support_cards[0]['support_card_id']} - {self.support_card_string_dict[self.support_cards[0]['support_card_id']]}"
-        support_2_str = f"{self.support_cards[1]['support_card_id']} - {self.support_card_string_dict[self.support_cards[1]['support_card_id']]}"
-        support_3_str = f"{self.support_cards[2]['support_card_id']} - {self.support_card_string_dict[self.support_cards[2]['support_card_id']]}"
-        support_4_str = f"{self.support_cards[3]['support_card_id']} - {self.support_card_string_dict[self.support_cards[3]['support_card_id']]}"
-        support_5_str = f"{self.support_cards[4]['support_card_id']} - {self.support_card_string_dict[self.support_cards[4]['support_card_id']]}"
-        support_6_str = f"{self.support_cards[5]['support_card_id']} - {self.support_card_string_dict[self.support_cards[5]['support_card_id']]}"
-
-        headers = [
-                ("Scenario", lambda _: scenario_str),
-                ("Chara", lambda _: chara_str),
-                ("Support 1", lambda _: support_1_str),
-                ("Support 2", lambda _: support_2_str),
-                ("Support 3", lambda _: support_3_str),
-                ("Support 4", lambda _: support_4_str),
-                ("Support 5", lambda _: support_5_str),
-                ("Support 6", lambda _: support_6_str),
+    def make_static_cells(self):
+        # Columns that are the same on every row, known once the first turn has been read.
+        cells = [
+            constants.SCENARIO_DICT.get(self.scenario_id, 'Unknown Scenario'),
+            f"{self.chara_names_dict.get(self.chara_id, 'Unknown Character')} {self.outfit_name_dict.get(self.card_id, 'Unknown Outfit')}",
+        ]
+        for index in range(6):
+            support_card = self.support_cards[index]
+            cells.append(f"{support_card['support_card_id']} - {self.support_card_string_dict[support_card['support_card_id']]}")
+        return [format_csv_cell(remove_zero(cell)) for cell in cells]
+
+    def make_headers(self):
+        return [
                 ("Turn", lambda x: x.turn),
                 ("Action", lambda x: x.action_type.name),
                 ("Text", lambda x: x.text),
@@ -447,59 +672,83 @@ class TrainingAnalyzer():
                 ("Statuses Removed", lambda x: "|".join([self.status_name_dict[status] for status in x.remove_status])),
             ]
 
-        # Create CSV
-        out_rows = []
-
-        header_row = ",".join([header[0] for header in headers])
-        out_rows.append(header_row)
+    def get_header_row(self):
+        static_headers = ["Scenario", "Chara", "Support 1", "Support 2", "Support 3", "Support 4", "Support 5", "Support 6"]
+        return ",".join(static_headers + [header[0] for header in self.headers])
+
+    def should_skip(self, action: TrainingAction):
+        # Ignore certain actions
+        if action.action_type.value < 0:
+            return True
+        if action.action_type == ActionType.Unknown:
+            # Skip action if it does not gain or lose any stats or skills/statuses etc.
+            if not any([action.dspeed,
+                        action.dstamina,
+                        action.dpower,
+                        action.dguts,
+                        action.dwisdom,
+                        action.dskill_pt,
+                        action.denergy,
+                        action.dmotivation,
+                        action.dfans,
+                        action.add_skill,
+                        action.remove_skill,
+                        action.add_skillhint,
+                        action.add_status,
+                        action.remove_status]):
+                return True
+        return False
+
+    def format_row(self, action: TrainingAction):
+        if self.static_cells is None:
+            self.static_cells = self.make_static_cells()
+        formatted_cells = self.static_cells + [format_csv_cell(remove_zero(header[1](action))) for header in self.headers]
+        return ",".join(formatted_cells)
+
+    def iter_csv_rows(self, packets=None):
+        """Yields the CSV header, then one row per action, as the packets are read.
+        A live analyzer uses the actions it already has instead.
+        """
+        if self.live:
+            yield from self.get_live_csv_rows()
+            return
 
-        def remove_zero(value):
-            if value in (0, '0'):
-                return ""
-            return value
+        self.reset()
+        if packets is None:
+            packets = self.training_tracker.read_packets()
 
-        for action in self.action_list:
-            # Ignore certain actions
-            if action.action_type.value < 0:
+        yield self.get_header_row()
+        for action in self.iter_actions(packets):
+            if self.should_skip(action):
                 continue
-            if action.action_type == ActionType.Unknown:
-                # Skip action if it does not gain or lose any stats or skills/statuses etc.
-                if not any([action.dspeed,
-                            action.dstamina,
-                            action.dpower,
-                            action.dguts,
-                            action.dwisdom,
-                            action.dskill_pt,
-                            action.denergy,
-                            action.dmotivation,
-                            action.dfans,
-                            action.add_skill,
-                            action.remove_skill,
-                            action.add_skillhint,
-                            action.add_status,
-                            action.remove_status]):
-                    continue
-
-            # Format lines
-            formatted_cells = []
-            for header in headers:
-                cell_data = str(remove_zero(header[1](action)))
-                cell_data = cell_data.replace('"', '""')
-                if ',' in cell_data:
-                    cell_data = f"\"{cell_data}\""
-                formatted_cells.append(cell_data)
+            yield self.format_row(action)
 
-            # Combine lines
-            row = ",".join(formatted_cells)
-            out_rows.append(row)
+    def get_live_csv_rows(self):
+        with self.lock:
+            rows = [self.get_header_row()]
+            for action in self.action_list:
+                if self.should_skip(action):
+                    continue
+                rows.append(self.format_row(action))
+        return rows
 
-        return out_rows
+    def to_csv_list(self):
+        return list(self.iter_csv_rows())
 
+    def write_csv(self, csv_file):
+        first = True
+        for row in self.iter_csv_rows():
+            if not first:
+                csv_file.write("\n")
+            first = False
+            csv_file.write(row)
 
-    def to_csv(self):
+    def to_csv(self, csv_path=None):
         t1 = time.perf_counter()
-        with open(self.training_tracker.get_csv_path(), 'w', encoding='utf-8') as csvfile:
-            csvfile.write("\n".join(self.to_csv_list()))
+        if csv_path is None:
+            csv_path = self.training_tracker.get_csv_path()
+        with open(csv_path, 'w', encoding='utf-8') as csvfile:
+            self.write_csv(csvfile)
         t2 = time.perf_counter()
         logger.debug(f"CSV generation took {t2-t1:0.4f} seconds")
 
@@ -680,17 +929,33 @@ class TrainingAnalyzer():
 
     def make_race_action(self, action: TrainingAction, race_dict: dict):
         race_data = race_dict['race_start_info']
-        race_scenario = race_data_parser.parse(race_dict['race_scenario'])
         action.action_type = ActionType.Race
         action.text = self.race_program_name_dict[race_data['program_id']]
         frame_order = race_data['race_horse_data'][0]['frame_order']
-        action.value = race_scenario.horse_result[frame_order-1].finish_order + 1  # Saving the finishing position here for now.
+        if isinstance(race_dict['race_scenario'], race_blobs.RaceBlobRef):
+            # The finish order was saved with the reference, so the race does not need to be loaded.
+            finish_order = race_dict['race_scenario'].finish_orders[frame_order-1]
+        else:
+            # Only the horse results are needed, so the frames are not turned into objects.
+            finish_order = int(race_data_parser.parse_arrays(race_dict['race_scenario']).horse_result['finish_order'][frame_order-1])
+        action.value = finish_order + 1  # Saving the finishing position here for now.
         self.last_program_id = race_data['program_id']
         return
 
+    def get_race_data(self, race_dict: dict):
+        # The whole race, for detailed race views. Reads it from the race blob store if needed.
+        # Returns None if the race is not available, e.g. when the log was copied without its race_blobs folder.
+        try:
+            race_scenario = race_blobs.load_race_scenario(race_dict['race_scenario'])
+        except (OSError, ValueError) as e:
+            logger.warning(f"Race data not available: {e}. Copy the {race_blobs.BLOB_FOLDER} folder along with the training log to keep its races.")
+            return None
+        return race_data_parser.parse(race_scenario)
+
     def plot_stats(self, ax: plt.Axes):
         cur_turn = 0
-        in_packets = []
+        in_packet_count = 0
+        last_in_packet = None
 
         speed = []
         stamina = []
@@ -714,9 +979,10 @@ class TrainingAnalyzer():
             motivation.append(packet['chara_info']['motivation'])
             fans.append(packet['chara_info']['fans'])
 
-        for packet in self.packets:
+        for packet in self.training_tracker.read_packets():
             if packet['_direction'] == 1:
-                in_packets.append(packet)
+                in_packet_count += 1
+                last_in_packet = packet
                 # Incoming packet
                 chara_info = packet.get('chara_info')
                 if chara_info is None:
@@ -727,8 +993,8 @@ class TrainingAnalyzer():
                 if turn > cur_turn:
                     cur_turn = turn
                     unpack_stats(packet)
-        if len(in_packets) > 1:
-            unpack_stats(in_packets[-1])
+        if in_packet_count > 1:
+            unpack_stats(last_in_packet)
         # Plot
         x = list(range(1, len(speed) + 1))
 
@@ -749,58 +1015,175 @@ class TrainingAnalyzer():
         ax.yaxis.set_major_locator(ticker.MultipleLocator(100))
 
 
+# Below this many logs to read, starting worker processes takes longer than analyzing them here.
+POOL_MIN_LOGS = 4
+MAX_POOL_WORKERS = 8
+
+_worker_analyzer = None
+
+
+def get_training_name(training_path):
+    _, training_name = os.path.split(training_path)
+    training_name, _ = os.path.splitext(training_name)
+    return training_name
+
+
+def make_csv_rows(training_analyzer, training_path):
+    """Returns (rows, error, error_is_expected) for one training log. Errors are returned rather than raised, so one bad log does not stop the others.
+    """
+    try:
+        analyzer = get_live_analyzer(training_path)
+        if analyzer is None:
+            analyzer = training_analyzer
+            analyzer.set_training_tracker(TrainingTracker(get_training_name(training_path), full_path=os.path.splitext(training_path)[0]))
+        return analyzer.to_csv_list(), None, False
+    except NotImplementedError as e:
+        return None, str(e), True
+    except Exception:
+        return None, traceback.format_exc(), False
+
+
+def get_dict_snapshot():
+    # The cached dicts the analyzer needs, so worker processes do not have to build them again.
+    # Failed downloads are left empty and passed on as failed, so the workers do not try them again either.
+    entries = cache_registry.REGISTRY.entries
+    containers = {name: entry.container for name, entry in entries.items() if entry.container}
+    failed = [name for name, entry in entries.items() if entry.failed]
+    return containers, failed
+
+
+def init_combine_worker(dict_snapshot):
+    containers, failed = dict_snapshot
+    for name, output in containers.items():
+        entry = cache_registry.REGISTRY.entries.get(name)
+        if entry is not None:
+            entry.fill(output)
+    for name in failed:
+        entry = cache_registry.REGISTRY.entries.get(name)
+        if entry is not None:
+            entry.failed = True
+
+
+def analyze_in_worker(training_path):
+    global _worker_analyzer
+    if _worker_analyzer is None:
+        _worker_analyzer = TrainingAnalyzer()
+    return make_csv_rows(_worker_analyzer, training_path)
+
+
 class TrainingCombiner:
     training_paths = None
     output_file_path = None
     result = None
+    progress_message = None
 
-    def __init__(self, training_paths, output_file_path, result: list):
+    def __init__(self, training_paths, output_file_path, result: list, workers: int=None):
         self.training_paths = training_paths
         self.output_file_path = output_file_path
         self.result = result
-
-    def combine(self):
-        csvs = []
+        # Maximum worker processes. None picks a number from the CPU count, 1 analyzes everything in this process.
+        self.workers = workers
+        self.errors = []
+
+    def iter_results(self):
+        """Yields (index, rows, error, error_is_expected) for every training log, in order.
+        Logs are analyzed in a process pool when there are enough of them. Logs with a live analyzer are exported here directly.
+        """
         training_analyzer = TrainingAnalyzer()
-        for training_path in self.training_paths:
-            try:
-                _, training_name = os.path.split(training_path)
-                training_name, _ = os.path.splitext(training_name)
-                training_analyzer.set_training_tracker(TrainingTracker(training_name, full_path=os.path.splitext(training_path)[0]))
-                csvs.append(training_analyzer.to_csv_list())
-            except NotImplementedError as e:
-                util.show_error_box_no_report(f"Error while generating CSV for {training_name}", str(e))
-                self.result.append(False)
-                return
-            except Exception:
-                logger.error(traceback.format_exc())
-                util.show_error_box("Error", f"Error while generating CSV for {training_name}")
-                self.result.append(False)
-                logger.debug(f"Error while generating CSV for {training_path}")
-                return
+        to_read = [training_path for training_path in self.training_paths if get_live_analyzer(training_path) is None]
+        if len(to_read) < POOL_MIN_LOGS or self.workers == 1:
+            for index, training_path in enumerate(self.training_paths):
+                yield (index, *make_csv_rows(training_analyzer, training_path))
+            return
 
-        with open(self.output_file_path, 'w', encoding='utf-8') as csv_file:
+        max_workers = self.workers or min((os.cpu_count() or 2) - 1, MAX_POOL_WORKERS)
+        workers = max(1, min(max_workers, len(to_read)))
+        # Only keep a few logs ahead of the one being written, so finished results do not pile up in memory.
+        window = workers * 2
+        logger.debug(f"Analyzing {len(to_read)} training logs in {workers} processes.")
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_combine_worker, initargs=(get_dict_snapshot(),))
+        futures = {}
+        use_pool = True
+        try:
+            for index, training_path in enumerate(self.training_paths):
+                if use_pool:
+                    for ahead in range(index, min(index + window, len(self.training_paths))):
+                        ahead_path = self.training_paths[ahead]
+                        if ahead not in futures and get_live_analyzer(ahead_path) is None:
+                            futures[ahead] = executor.submit(analyze_in_worker, ahead_path)
+
+                future = futures.pop(index, None)
+                if future is None or not use_pool:
+                    yield (index, *make_csv_rows(training_analyzer, training_path))
+                    continue
+
+                try:
+                    yield (index, *future.result())
+                except concurrent.futures.BrokenExecutor:
+                    logger.error("Training log worker processes stopped. Analyzing the remaining logs here.")
+                    use_pool = False
+                    yield (index, *make_csv_rows(training_analyzer, training_path))
+                except Exception:
+                    yield index, None, traceback.format_exc(), False
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def combine(self):
+        # Rows are written in order as the logs are analyzed. A log that fails is left out, and reported at the end.
+        tmp_path = self.output_file_path + ".tmp"
+        multiple = len(self.training_paths) > 1
+        written = 0
+        with open(tmp_path, 'w', encoding='utf-8') as csv_file:
             first = True
-            for i, rows in enumerate(csvs):
-                if not first:
-                    csv_file.write("\n")
-                header = True
+            for index, rows, error, error_is_expected in self.iter_results():
+                self.progress_message = f"Creating CSV... ({index + 1}/{len(self.training_paths)})"
+                training_path = self.training_paths[index]
+                if rows is None:
+                    logger.error(f"Error while generating CSV for {training_path}")
+                    logger.error(error)
+                    self.errors.append((get_training_name(training_path), error, error_is_expected))
+                    continue
+
                 for j, row in enumerate(rows):
-                    if len(self.training_paths) > 1:
-                        if header:
-                            header = False
-                            if not first:
-                                rows[j] = ''
+                    if multiple:
+                        if j == 0:
+                            # Only the first log written includes the header.
+                            if written > 0:
                                 continue
-                            first = False
-                            rows[j] = "Run," + row
+                            row = "Run," + row
                         else:
-                            rows[j] = f"{i + 1}," + row
-                csv_file.write("\n".join(row for row in rows if row))
+                            row = f"{index + 1}," + row
+                    if not first:
+                        csv_file.write("\n")
+                    first = False
+                    csv_file.write(row)
+                written += 1
+
+        if not written:
+            os.remove(tmp_path)
+            self.show_errors()
+            self.result.append(False)
+            return
+
+        os.replace(tmp_path, self.output_file_path)
+        self.show_errors()
         self.result.append(True)
-        logger.debug("Finished generating CSV for %s", self.output_file_path)
+        logger.debug(f"Finished generating CSV for {self.output_file_path}")
         return
 
+    def show_errors(self):
+        if not self.errors:
+            return
+        if len(self.errors) == 1:
+            training_name, error, error_is_expected = self.errors[0]
+            if error_is_expected:
+                util.show_error_box_no_report(f"Error while generating CSV for {training_name}", error)
+            else:
+                util.show_error_box("Error", f"Error while generating CSV for {training_name}")
+            return
+        names = "<br>".join(training_name for training_name, _, _ in self.errors)
+        util.show_warning_box("Error", f"These training logs could not be added to the CSV:<br>{names}")
+
 
 def combine_trainings(training_paths, output_file_path):
     result = []
@@ -811,7 +1194,7 @@ def combine_trainings(training_paths, output_file_path):
     combiner_thread.start()
 
     logger.debug("Running popup")
-    gui.show_widget(gui.UmaBorderlessPopup, "Creating CSV", "Creating CSV...", combiner_thread, result)
+    gui.show_widget(gui.UmaBorderlessPopup, "Creating CSV", "Creating CSV...", combiner, result)
     logger.debug("Finished popup")
 
     return result[0]
@@ -3,11 +3,15 @@ import sys
 import base64
 import io
 import ctypes
-import win32event
-from win32com.shell.shell import ShellExecuteEx
-from win32com.shell import shellcon
-import win32con
-import win32process
+try:
+    import win32event
+    from win32com.shell.shell import ShellExecuteEx
+    from win32com.shell import shellcon
+    import win32con
+    import win32process
+except ImportError:
+    # Not on Windows. Only the parts without windows or dialogs work, e.g. the training log CLI.
+    win32event = None
 from PIL import Image
 from loguru import logger
 import json
@@ -15,6 +19,8 @@ import constants
 import shutil
 
 ignore_errors = False
+# Skip all requests to umapyoi.net, and use the names from master.mdb.
+offline = False
 
 relative_dir = os.path.abspath(os.getcwd())
 unpack_dir = relative_dir
@@ -103,18 +109,24 @@ else:
 
 
 # Import the rest of the modules after logging is set up.
-import win32api
-import win32gui
-import win32con
+try:
+    import win32api
+    import win32gui
+    import win32con
+    from pywintypes import error as pywinerror  # pylint: disable=no-name-in-module
+except ImportError:
+    win32gui = None
+    class pywinerror(Exception):
+        pass
 import traceback
 import math
 import time
 import requests
-from pywintypes import error as pywinerror  # pylint: disable=no-name-in-module
 from PIL import Image
 import numpy as np
 import mdb
 import gui
+import cache_registry
 
 TRAINING_LOGS_FOLDER = get_appdata("training_logs")
 
@@ -124,6 +136,9 @@ def do_get_request(url, error_title=None, error_message=None, ignore_timeout=Fal
     global last_failed_request
     global has_failed_once
 
+    if offline:
+        return None
+
     try:
         if not ignore_timeout and last_failed_request is not None:
             # Ignore everything from umapyoi.net for 5 minutes to avoid spamming requests.
@@ -441,8 +456,12 @@ def get_character_name_dict(force=False):
 
     if force or not downloaded_chara_dict:
         chara_dict = mdb.get_chara_name_dict()
+        if not force and cache_registry.REGISTRY.is_failed(get_character_name_dict):
+            # The download failed on the last refresh. It is tried again on the next one.
+            return chara_dict
         response = do_get_request("https://umapyoi.net/api/v1/character/names")
         if not response:
+            cache_registry.REGISTRY.mark_failed(get_character_name_dict)
             return chara_dict
 
         for character in response.json():
@@ -457,8 +476,12 @@ def get_outfit_name_dict(force=False):
 
     if force or not downloaded_outfit_dict:
         outfit_dict = mdb.get_outfit_name_dict()
+        if not force and cache_registry.REGISTRY.is_failed(get_outfit_name_dict):
+            # The download failed on the last refresh. It is tried again on the next one.
+            return outfit_dict
         response = do_get_request("https://umapyoi.net/api/v1/outfit")
         if not response:
+            cache_registry.REGISTRY.mark_failed(get_outfit_name_dict)
             return outfit_dict
 
         for outfit in response.json():
@@ -473,9 +496,13 @@ def get_race_name_dict(force=False):
 
     if force or not downloaded_race_name_dict:
         race_name_dict = mdb.get_race_program_name_dict()
+        if not force and cache_registry.REGISTRY.is_failed(get_race_name_dict):
+            # The download failed on the last refresh. It is tried again on the next one.
+            return race_name_dict
         logger.info("Requesting race names from umapyoi.net")
         response = do_get_request("https://umapyoi.net/api/v1/race_program")
         if not response:
+            cache_registry.REGISTRY.mark_failed(get_race_name_dict)
             return race_name_dict
         
         for race_program in response.json():
@@ -615,23 +642,15 @@ def heroes_score_to_league_string(score):
     return current_league
 
 def scouting_score_to_rank_string(score):
-    current_rank = list(mdb.get_scouting_score_to_rank_dict().keys())[0]
-    for score_threshold, rank in mdb.get_scouting_score_to_rank_dict().items():
-        if score >= score_threshold:
-            current_rank = rank
-        else:
-            break
-    return current_rank
-
-UPDATE_FUNCS = [
-    get_character_name_dict,
-    get_outfit_name_dict,
-    get_race_name_dict,
-    get_gm_fragment_dict,
-    get_uaf_sport_image_dict,
-    get_uaf_genre_image_dict,
-    get_gff_veg_image_dict,
-    get_gl_token_dict,
-    get_rmu_image_dict,
-    get_group_support_id_to_passion_zone_effect_id_dict,
-]
\ No newline at end of file
+    return mdb.get_scouting_rank(score)
+
+cache_registry.register(get_character_name_dict, downloaded_chara_dict, depends=["mdb.get_chara_name_dict"], remote=True)
+cache_registry.register(get_outfit_name_dict, downloaded_outfit_dict, depends=["mdb.get_outfit_name_dict"], remote=True)
+cache_registry.register(get_race_name_dict, downloaded_race_name_dict, depends=["mdb.get_race_program_name_dict"], remote=True)
+cache_registry.register(get_gm_fragment_dict, gm_fragment_dict, assets=["_assets/gm"])
+cache_registry.register(get_uaf_sport_image_dict, uaf_sport_image_dict, assets=["_assets/uaf/sports"])
+cache_registry.register(get_uaf_genre_image_dict, uaf_genre_image_dict, assets=["_assets/uaf/genres"])
+cache_registry.register(get_gff_veg_image_dict, gff_veg_image_dict, assets=["_assets/gff/vegetables"])
+cache_registry.register(get_gl_token_dict, gl_token_dict, assets=["_assets/gl/tokens"])
+cache_registry.register(get_rmu_image_dict, rmu_image_dict, assets=["_assets/rmu"])
+cache_registry.register(get_group_support_id_to_passion_zone_effect_id_dict, GROUP_SUPPORT_ID_TO_PASSION_ZONE_EFFECT_ID_DICT, depends=["mdb.get_group_card_effect_ids"])
\ No newline at end of file